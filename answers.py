@@ -0,0 +1,60 @@
+"""
+Bulk reads and writes of the answers of one test attempt.
+
+take_test used to look up each question's answer with its own query, once
+to prefill the forms and again on every save. load_answers() fetches all
+of an attempt's answers in one query, and save_answers() writes a whole
+paper as a single upsert on the (test_result_id, question_id) unique
+constraint.
+"""
+
+from models import QuestionAnswer
+from extensions import db
+
+
+def load_answers(test_result_id):
+    """{question_id: QuestionAnswer} for a test attempt"""
+    return {
+        answer.question_id: answer
+        for answer in QuestionAnswer.query.filter_by(test_result_id=test_result_id)
+    }
+
+
+def save_answers(test_result_id, answers):
+    """
+    Store {question_id: student_answer} for a test attempt in the current
+    transaction, inserting missing rows and overwriting the answer text of
+    existing ones. Grading columns are left alone. The caller commits.
+    """
+    if not answers:
+        return
+    table = QuestionAnswer.__table__
+    rows = [{'test_result_id': test_result_id, 'question_id': question_id, 'student_answer': answer}
+            for question_id, answer in answers.items()]
+    dialect = db.engine.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.test_result_id, table.c.question_id],
+            set_={'student_answer': stmt.excluded.student_answer}
+        )
+        db.session.execute(stmt)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(student_answer=stmt.inserted.student_answer)
+        db.session.execute(stmt)
+    else:
+        # No native upsert: one read, then update or add under the session
+        existing = load_answers(test_result_id)
+        for row in rows:
+            answer = existing.get(row['question_id'])
+            if answer is None:
+                db.session.add(QuestionAnswer(**row))
+            else:
+                answer.student_answer = row['student_answer']
@@ -36,11 +36,41 @@ def create_app():
     app.config['TIMEZONE'] = 'Asia/Kolkata'
     logger.debug(f"Secret key set to: {app.config['SECRET_KEY']}")
 
-    # Configure SQLite
+    # Configure SQLite (DATABASE_URL overrides, e.g. for benchmark databases)
     basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'app.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'app.db'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     logger.debug(f"Database URI set to: {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+    # Recommendation model refresh (seconds / new answer rows)
+    app.config['RECOMMENDER_REFRESH_ENABLED'] = os.environ.get('RECOMMENDER_REFRESH_ENABLED', '1') == '1'
+    app.config['RECOMMENDER_REFRESH_INTERVAL'] = int(os.environ.get('RECOMMENDER_REFRESH_INTERVAL', 3600))
+    app.config['RECOMMENDER_REFRESH_MIN_ANSWERS'] = int(os.environ.get('RECOMMENDER_REFRESH_MIN_ANSWERS', 500))
+    app.config['RECOMMENDER_REFRESH_POLL'] = int(os.environ.get('RECOMMENDER_REFRESH_POLL', 60))
+    # Fit models in a separate process so training never holds a web worker's GIL
+    app.config['RECOMMENDER_TRAIN_IN_PROCESS'] = os.environ.get('RECOMMENDER_TRAIN_IN_PROCESS', '1') == '1'
+    # Auto-submission of expired attempts (seconds / attempts per transaction / seconds past the deadline)
+    app.config['EXPIRY_SWEEP_ENABLED'] = os.environ.get('EXPIRY_SWEEP_ENABLED', '1') == '1'
+    app.config['EXPIRY_SWEEP_INTERVAL'] = int(os.environ.get('EXPIRY_SWEEP_INTERVAL', 60))
+    app.config['EXPIRY_SWEEP_BATCH'] = int(os.environ.get('EXPIRY_SWEEP_BATCH', 200))
+    app.config['EXPIRY_SWEEP_GRACE'] = int(os.environ.get('EXPIRY_SWEEP_GRACE', 60))
+    # Trained models are written here once and memory-mapped by every worker
+    app.config['RECOMMENDER_ARTIFACT_DIR'] = os.environ.get(
+        'RECOMMENDER_ARTIFACT_DIR', os.path.join(app.instance_path, 'recommender'))
+    # Chapters and teachers are cached per process; other workers' changes show up after this many seconds
+    app.config['REFERENCE_CACHE_TTL'] = int(os.environ.get('REFERENCE_CACHE_TTL', 600))
+    # Rendered dashboard fragments, shared between workers through FRAGMENT_CACHE_URL (redis://...).
+    # Off without one: a per-process cache misses other workers' version bumps. Set
+    # FRAGMENT_CACHE_ENABLED=1 to use the in-process cache on a single-worker deployment.
+    app.config['FRAGMENT_CACHE_URL'] = os.environ.get('FRAGMENT_CACHE_URL')
+    app.config['FRAGMENT_CACHE_ENABLED'] = os.environ.get(
+        'FRAGMENT_CACHE_ENABLED', '1' if app.config['FRAGMENT_CACHE_URL'] else '0') == '1'
+    app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 2048))
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+    # Compiled test papers are cached per process; other workers' edits show up after this many seconds
+    app.config['PAPER_CACHE_TTL'] = int(os.environ.get('PAPER_CACHE_TTL', 600))
+
     # Add a context processor to inject `current_user` into templates
     from flask_login import current_user
     @app.context_processor
@@ -69,6 +99,25 @@ def create_app():
         # Create database tables
         db.create_all()
         logger.debug("Database tables created")
+
+    from reference_data import init_reference_cache
+    from fragment_cache import init_fragment_cache
+    from paper import init_paper_cache
+    init_reference_cache(app)
+    init_fragment_cache(app)
+    init_paper_cache(app)
+
+    if app.config['RECOMMENDER_REFRESH_ENABLED']:
+        from model_lifecycle import init_model_refresher
+        from recommenders import recommender, collaborative_recommender
+        init_model_refresher(app, recommender)
+        init_model_refresher(app, collaborative_recommender, name='collaborative_refresher')
+        logger.debug("Recommendation model refresher registered")
+
+    if app.config['EXPIRY_SWEEP_ENABLED']:
+        from sweeper import init_expiry_sweeper
+        init_expiry_sweeper(app)
+        logger.debug("Expired attempt sweeper registered")
     
     @app.route('/health')
     def health_check():
@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
 from models import User, UserRole
+from reference_data import get_teachers
+from fragment_cache import bump_data_version
 from forms import RegistrationForm  # Make sure to import the form
 
 auth_bp = Blueprint('auth', __name__)
@@ -15,7 +17,7 @@ def register():
     form = RegistrationForm()
     
     # Populate teacher choices for student registration
-    teachers = User.query.filter_by(role=UserRole.TEACHER).all()
+    teachers = get_teachers()
     form.teacher.choices = [(str(t.id), t.username) for t in teachers]
     form.teacher.choices.insert(0, ('', 'Select a teacher'))
     
@@ -32,6 +34,7 @@ def register():
             
         db.session.add(user)
         db.session.commit()
+        bump_data_version(user.teacher_id)
         
         flash('Your account has been created! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
@@ -0,0 +1,137 @@
+"""
+Small in-process caches shared by the application
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with an optional time-to-live.
+
+    ``max_entries`` caps the number of values held. Values of very
+    different sizes can also be bounded by weight: with ``max_weight`` set,
+    least recently used entries are evicted until the summed
+    ``weigh(value)`` of the rest fits (``weigh`` defaults to
+    ``sys.getsizeof``, so pass e.g. ``len`` for strings). A single value
+    heavier than ``max_weight`` is not stored. Entries older than
+    ``ttl_seconds`` are treated as misses and dropped. Hit, miss, eviction,
+    expiration and invalidation counters are kept for monitoring.
+
+    ``generation`` changes on every invalidate() and clear(). get_or_create(),
+    and set() when given the generation read before computing the value,
+    do not store a value if the generation changed meanwhile, since it may
+    have been read before the invalidation.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=None, max_weight=None, weigh=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_weight = max_weight
+        self.weigh = weigh or sys.getsizeof
+        self.weight = 0
+        self.generation = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value, weight)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds is not None and time.monotonic() - stored_at >= self.ttl_seconds
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+
+    def set(self, key, value, generation=None):
+        """
+        Store value under key. If generation is given (a value of
+        self.generation read before value was computed), the value is
+        dropped when an invalidation happened since.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            weight = self.weigh(value) if self.max_weight is not None else 0
+            self._remove(key)
+            if self.max_weight is not None and weight > self.max_weight:
+                self.evictions += 1
+                return
+            self._entries[key] = (time.monotonic(), value, weight)
+            self.weight += weight
+            while len(self._entries) > self.max_entries or (
+                    self.max_weight is not None and self.weight > self.max_weight):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """
+        Return the cached value for key, computing it with factory() on a
+        miss. The value is stored only if nothing was invalidated meanwhile.
+        """
+        generation = self.generation
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            if self._remove(key) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.weight = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'weight': self.weight,
+                'max_weight': self.max_weight,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
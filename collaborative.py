@@ -0,0 +1,234 @@
+"""
+Collaborative-filtering recommender built from the student x question score matrix
+"""
+
+import threading
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func, case, cast, Float
+
+from models import Question, QuestionAnswer, TestResult
+from app import db
+from recommendation import recommender as content_recommender, select_questions
+from training import factorize_scores, run_fit
+from model_lifecycle import BackgroundTrainer, train_in_process
+
+# Latent factors kept from the truncated SVD
+N_FACTORS = 20
+
+# Pseudo-answers pulling the bias of rarely answered questions toward zero
+BIAS_SHRINKAGE = 5
+
+# Sampling weight of questions predicted fully mastered, so strong students still get a full test
+MIN_NEED = 0.01
+
+
+class FactorModel:
+    """
+    Immutable snapshot of one factorization: predicted mastery of student s
+    on question q is global_mean + question_bias[q] + student_factors[s] . question_factors[q]
+    """
+
+    def __init__(self, version, student_ids, question_ids, chapter_ids, global_mean,
+                 question_bias, student_factors, question_factors, answer_watermark):
+        self.version = version
+        self.student_ids = student_ids  # Sorted
+        self.question_ids = question_ids  # Sorted
+        self.chapter_ids = chapter_ids
+        self.global_mean = global_mean
+        self.question_bias = question_bias
+        self.student_factors = student_factors
+        self.question_factors = question_factors
+        self.answer_watermark = answer_watermark
+        self.trained_at = datetime.utcnow()
+
+    def student_row(self, student_id):
+        """Row of the student in student_factors, or None if they had no history at training time"""
+        row = np.searchsorted(self.student_ids, student_id)
+        if row < len(self.student_ids) and self.student_ids[row] == student_id:
+            return int(row)
+        return None
+
+    def predict(self, row, positions=None):
+        """Predicted score fraction (0-1) of the student at row for the questions at positions"""
+        if positions is None:
+            positions = slice(None)
+        predicted = (self.global_mean + self.question_bias[positions]
+                     + self.question_factors[positions] @ self.student_factors[row])
+        return np.clip(predicted, 0.0, 1.0)
+
+
+class CollaborativeEngine:
+    """
+    Latent-factor recommender. The student x question matrix of average score
+    fractions is factorized offline; serving a student is one matrix-vector
+    product against the precomputed question factors.
+    """
+
+    def __init__(self, n_factors=N_FACTORS):
+        self.n_factors = n_factors
+        self.current_model = None
+        self._train_lock = threading.Lock()
+        self._background = BackgroundTrainer(self, 'collaborative-trainer')
+
+    @property
+    def model_version(self):
+        model = self.current_model
+        return model.version if model is not None else 0
+
+    def get_answer_watermark(self):
+        return db.session.query(func.max(QuestionAnswer.id)).scalar() or 0
+
+    def new_answers_since_training(self):
+        model = self.current_model
+        watermark = model.answer_watermark if model is not None else 0
+        return self.get_answer_watermark() - watermark
+
+    def load_published_model(self):
+        # Factor models are small and kept in memory only
+        return False
+
+    def get_score_matrix(self):
+        """
+        Sparse student x question matrix of average score fractions over
+        completed tests, from one grouped query
+
+        Returns:
+            (matrix, student_ids, question_ids, chapter_ids)
+        """
+        question_rows = db.session.query(Question.id, Question.chapter_id).order_by(Question.id).all()
+        question_ids = np.array([row[0] for row in question_rows], dtype=np.int64)
+        chapter_ids = np.array([row[1] for row in question_rows], dtype=np.int64)
+
+        score_pct = case((Question.marks > 0, QuestionAnswer.score / cast(Question.marks, Float)), else_=0.0)
+        rows = db.session.query(
+            TestResult.student_id,
+            QuestionAnswer.question_id,
+            func.avg(score_pct)
+        ).join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
+            .join(Question, QuestionAnswer.question_id == Question.id)\
+            .filter(TestResult.completed == True)\
+            .filter(QuestionAnswer.score != None)\
+            .group_by(TestResult.student_id, QuestionAnswer.question_id)\
+            .all()
+
+        students = np.array([row[0] for row in rows], dtype=np.int64)
+        questions = np.array([row[1] for row in rows], dtype=np.int64)
+        values = np.array([row[2] for row in rows], dtype=np.float64)
+
+        student_ids, student_index = np.unique(students, return_inverse=True)
+        question_index = np.searchsorted(question_ids, questions)
+
+        matrix = sparse.csr_matrix(
+            (values, (student_index, question_index)),
+            shape=(len(student_ids), len(question_ids))
+        )
+        return matrix, student_ids, question_ids, chapter_ids
+
+    def train_model(self, if_missing=False):
+        """
+        Factorize the score matrix and publish the new model with a single
+        reference swap. Returns True if a model is now being served. With
+        if_missing, an existing model is kept rather than retrained, for
+        cold-start callers that queued behind another run.
+        """
+        with self._train_lock:
+            if if_missing and self.current_model is not None:
+                return True
+            answer_watermark = self.get_answer_watermark()
+            matrix, student_ids, question_ids, chapter_ids = self.get_score_matrix()
+            if len(question_ids) == 0 or matrix.nnz == 0:
+                return False
+
+            # Baseline: global mean plus a shrunk per-question bias
+            global_mean = matrix.data.mean()
+            coo = matrix.tocoo()
+            residual = coo.data - global_mean
+            bias_sum = np.bincount(coo.col, weights=residual, minlength=matrix.shape[1])
+            bias_count = np.bincount(coo.col, minlength=matrix.shape[1])
+            question_bias = bias_sum / (bias_count + BIAS_SHRINKAGE)
+
+            # Factorize what the baseline does not explain
+            residual_matrix = sparse.csr_matrix(
+                (residual - question_bias[coo.col], (coo.row, coo.col)),
+                shape=matrix.shape
+            )
+            student_factors, question_factors = run_fit(factorize_scores, residual_matrix, self.n_factors,
+                                                        in_process=train_in_process())
+
+            self.current_model = FactorModel(
+                version=self.model_version + 1,
+                student_ids=student_ids,
+                question_ids=question_ids,
+                chapter_ids=chapter_ids,
+                global_mean=global_mean,
+                question_bias=question_bias,
+                student_factors=student_factors,
+                question_factors=question_factors,
+                answer_watermark=answer_watermark
+            )
+        return True
+
+    def train_in_background(self):
+        """Start train_model() on a background thread unless one is already running"""
+        return self._background.start()
+
+    def get_serving_model(self):
+        """The model to serve, or None while the first one is still training in the background"""
+        if self.current_model is None:
+            self.train_in_background()
+        return self.current_model
+
+    def predict_mastery(self, student_id, question_ids):
+        """
+        Predicted score fraction for each question, or None if the student
+        is unknown to the model. Questions unknown to the model get the global mean.
+        """
+        model = self.get_serving_model()
+        row = model.student_row(student_id) if model is not None else None
+        if row is None:
+            return None
+
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(model.question_ids, question_ids), len(model.question_ids) - 1)
+        known = model.question_ids[positions] == question_ids
+        mastery = np.full(len(question_ids), model.global_mean)
+        mastery[known] = model.predict(row, positions[known])
+        return mastery
+
+    def recommend_questions(self, student_id, chapter_ids=None, num_questions=10):
+        """
+        Recommend questions the student is predicted to find hardest.
+        Students without history fall back to the content-based engine.
+
+        Args:
+            student_id: The ID of the student
+            chapter_ids: Optional list of chapter IDs to filter by
+            num_questions: Number of questions to recommend
+
+        Returns:
+            List of recommended Question objects
+        """
+        model = self.get_serving_model()
+        row = model.student_row(student_id) if model is not None else None
+        if row is None:
+            return content_recommender.recommend_questions(student_id, chapter_ids, num_questions)
+
+        positions = np.arange(len(model.question_ids))
+        if chapter_ids:
+            positions = positions[np.isin(model.chapter_ids, np.asarray(chapter_ids, dtype=np.int64))]
+        if len(positions) == 0:
+            return []
+
+        # Lower predicted mastery means more practice needed
+        need = np.maximum(1.0 - model.predict(row, positions), MIN_NEED)
+        chosen = select_questions(need, num_questions)
+        recommended_ids = model.question_ids[positions[chosen]].tolist()
+
+        return Question.query.filter(Question.id.in_(recommended_ids)).all()
+
+
+# Create singleton instance
+collaborative_recommender = CollaborativeEngine()
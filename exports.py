@@ -0,0 +1,232 @@
+"""
+Streaming exports of results for teachers.
+
+Rows are read from a server-side cursor EXPORT_CHUNK at a time and encoded
+chunk by chunk, so an export of any size runs in constant memory and the
+download starts before the query has finished. CSV is always available;
+Parquet (one row group per chunk) needs the optional pyarrow package.
+"""
+
+import csv
+import io
+
+from sqlalchemy import select, case, cast, DateTime, Enum, Float
+
+from models import User, Question, Test, TestResult, QuestionAnswer, UserRole
+from extensions import db
+
+EXPORT_CHUNK = 5000
+
+# Text cells starting with one of these are formulas to a spreadsheet; CSV prefixes them with '
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = ('csv', 'parquet')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# (column name, kind); kinds map onto Parquet types
+TEST_RESULT_COLUMNS = [
+    ('result_id', 'int'),
+    ('student_id', 'int'),
+    ('username', 'str'),
+    ('email', 'str'),
+    ('start_time', 'timestamp'),
+    ('end_time', 'timestamp'),
+    ('total_score', 'float'),
+    ('total_marks', 'int'),
+    ('percentage', 'float')
+]
+
+CLASS_ANSWER_COLUMNS = [
+    ('result_id', 'int'),
+    ('test_id', 'int'),
+    ('test_title', 'str'),
+    ('student_id', 'int'),
+    ('username', 'str'),
+    ('end_time', 'timestamp'),
+    ('question_id', 'int'),
+    ('chapter_id', 'int'),
+    ('difficulty', 'str'),
+    ('question_type', 'str'),
+    ('marks', 'int'),
+    ('student_answer', 'str'),
+    ('is_correct', 'bool'),
+    ('score', 'float')
+]
+
+
+def test_results_query(test_id):
+    """Completed results of a test, one row per attempt"""
+    percentage = case((Test.total_marks > 0, TestResult.total_score * 100 / cast(Test.total_marks, Float)),
+                      else_=0.0)
+    return select(
+        TestResult.id,
+        User.id,
+        User.username,
+        User.email,
+        TestResult.start_time,
+        TestResult.end_time,
+        TestResult.total_score,
+        Test.total_marks,
+        percentage
+    ).join(User, User.id == TestResult.student_id)\
+        .join(Test, Test.id == TestResult.test_id)\
+        .where(TestResult.test_id == test_id)\
+        .where(TestResult.completed == True)\
+        .order_by(TestResult.end_time, TestResult.id)
+
+
+def class_answers_query(teacher_id):
+    """
+    Every answer of a teacher's students in completed tests, one row per
+    answer. Ordered by answer id, which follows the table so rows stream
+    without a sort (answers of an attempt are written together).
+    """
+    return select(
+        TestResult.id,
+        Test.id,
+        Test.title,
+        User.id,
+        User.username,
+        TestResult.end_time,
+        Question.id,
+        Question.chapter_id,
+        Question.difficulty,
+        Question.question_type,
+        Question.marks,
+        QuestionAnswer.student_answer,
+        QuestionAnswer.is_correct,
+        QuestionAnswer.score
+    ).select_from(QuestionAnswer)\
+        .join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
+        .join(Test, Test.id == TestResult.test_id)\
+        .join(User, User.id == TestResult.student_id)\
+        .join(Question, Question.id == QuestionAnswer.question_id)\
+        .where(User.teacher_id == teacher_id)\
+        .where(User.role == UserRole.STUDENT)\
+        .where(TestResult.completed == True)\
+        .order_by(QuestionAnswer.id)
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def iter_column_chunks(stmt, text_timestamps=False, chunk_size=EXPORT_CHUNK):
+    """
+    Execute stmt on a server-side cursor and yield its rows up to chunk_size
+    at a time, transposed into one tuple per column. Enum columns hold their
+    values; timestamps become ISO strings if text_timestamps is set.
+    """
+    converters = {}
+    for i, column in enumerate(stmt.selected_columns):
+        if isinstance(column.type, Enum):
+            converters[i] = lambda values: tuple(v.value if v is not None else None for v in values)
+        elif text_timestamps and isinstance(column.type, DateTime):
+            converters[i] = lambda values: tuple(v.isoformat() if v is not None else None for v in values)
+
+    # Executed on the session's connection, not through the ORM, which would buffer every row first
+    result = db.session.connection().execute(stmt.execution_options(stream_results=True))
+    try:
+        for rows in result.partitions(chunk_size):
+            columns = list(zip(*rows))
+            for i, convert in converters.items():
+                columns[i] = convert(columns[i])
+            yield columns
+    finally:
+        result.close()
+
+
+def neutralise_formula(value):
+    """Free text a spreadsheet would evaluate, made literal with a leading quote"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(stmt, columns):
+    """
+    Yield the rows of stmt as UTF-8 CSV, one chunk of rows at a time. Text
+    columns (usernames, titles, answers typed by students) are passed
+    through neutralise_formula() so opening the file cannot run formulas.
+    """
+    text_columns = [i for i, (_, kind) in enumerate(columns) if kind == 'str']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    # Send the header before running the query so the download starts at once
+    writer.writerow([name for name, _ in columns])
+    yield drain()
+
+    for values in iter_column_chunks(stmt, text_timestamps=True):
+        for i in text_columns:
+            values[i] = tuple(neutralise_formula(value) for value in values[i])
+        writer.writerows(zip(*values))
+        yield drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain()"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(stmt, columns):
+    """Yield the rows of stmt as a Parquet file with one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'str': pa.string(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us')
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for values in iter_column_chunks(stmt):
+            writer.write_table(pa.table({
+                name: pa.array(values[i], type=schema.field(name).type) for i, (name, _) in enumerate(columns)
+            }, schema=schema))
+            yield sink.drain()
+    # Closing the writer adds the footer
+    yield sink.drain()
+
+
+def stream_export(stmt, columns, fmt):
+    if fmt == 'parquet':
+        return stream_parquet(stmt, columns)
+    return stream_csv(stmt, columns)
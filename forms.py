@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField, FloatField
-from wtforms import BooleanField, IntegerField, HiddenField, RadioField, SelectMultipleField, widgets
+from wtforms import BooleanField, IntegerField, SelectMultipleField, widgets
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional, NumberRange
 from wtforms.widgets import TextArea
 from models import User, QuestionDifficulty, QuestionType, UserRole
@@ -108,21 +108,16 @@ class PersonalizedTestForm(FlaskForm):
     chapters = MultiCheckboxField('Chapters (Optional)', coerce=int, validators=[Optional()])
     num_questions = IntegerField('Number of Questions', validators=[DataRequired(), NumberRange(min=3, max=30)])
     duration_minutes = IntegerField('Duration (minutes)', validators=[DataRequired(), NumberRange(min=5, max=180)])
+    engine = SelectField('Recommendation Engine', choices=[
+        ('content', 'Content-based (chapter and difficulty profile)'),
+        ('collaborative', 'Collaborative (students with similar results)')
+    ], default='content')
     submit = SubmitField('Generate Personalized Test')
 
 
-class AnswerForm(FlaskForm):
-    question_id = HiddenField('Question ID')
-    test_result_id = HiddenField('Test Result ID')
-    
-    # For multiple choice questions
-    multiple_choice = RadioField('Answer', choices=[])
-    
-    # For true/false questions
-    true_false = RadioField('Answer', choices=[('True', 'True'), ('False', 'False')])
-    
-    # For numerical and descriptive questions
-    text_answer = TextAreaField('Answer', widget=TextArea())
-    
-    # To determine which field to show
-    question_type = HiddenField('Question Type')
+class ClassPersonalizedTestForm(FlaskForm):
+    title = StringField('Test Title', validators=[DataRequired()])
+    chapters = MultiCheckboxField('Chapters (Optional)', coerce=int, validators=[Optional()])
+    num_questions = IntegerField('Questions per Student', validators=[DataRequired(), NumberRange(min=3, max=30)])
+    duration_minutes = IntegerField('Duration (minutes)', validators=[DataRequired(), NumberRange(min=5, max=180)])
+    submit = SubmitField('Generate Tests for All Students')
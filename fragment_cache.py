@@ -0,0 +1,178 @@
+"""
+Cache of rendered dashboard fragments.
+
+The content and scripts blocks of the dashboards are rendered once per
+user and data version and replayed until the version changes. Flash
+messages and the navigation bar live in base.html, outside the cached
+blocks, so they stay per request.
+
+Each user has a data version that bump_data_version() changes whenever
+something the user's pages show changes (a test submitted, started or
+created, questions edited). Page keys include the versions they depend on,
+so a bump makes the old fragments unreachable and they age out of the
+backend.
+
+The cache is on when FRAGMENT_CACHE_URL names a shared backend (redis),
+which every worker reads versions from. Without one it is off by default:
+the in-process MemoryBackend only sees version bumps made by its own
+worker, so under several workers the others would serve stale pages until
+FRAGMENT_CACHE_TTL. Enable it explicitly (FRAGMENT_CACHE_ENABLED=1) only
+for a single-worker deployment.
+"""
+
+import itertools
+import json
+import logging
+import threading
+
+from flask import current_app, g, render_template
+from markupsafe import Markup
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Size-bounded in-process backend"""
+
+    def __init__(self, max_entries=2048, ttl_seconds=None):
+        self._fragments = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._versions = LRUCache(max_entries=max_entries * 4)
+        # Versions are drawn from one counter, so a user whose version was
+        # evicted never gets back a version that still has fragments cached
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._fragments.get(key)
+
+    def set(self, key, fragments):
+        self._fragments.set(key, fragments)
+
+    def get_version(self, user_id):
+        with self._lock:
+            version = self._versions.get(user_id)
+            if version is None:
+                version = next(self._counter)
+                self._versions.set(user_id, version)
+            return version
+
+    def bump_version(self, user_id):
+        with self._lock:
+            self._versions.set(user_id, next(self._counter))
+
+    def stats(self):
+        return self._fragments.stats()
+
+
+class RedisBackend:
+    """
+    Backend shared by all workers. Takes any client with the redis-py
+    get/set/incr API.
+    """
+
+    def __init__(self, client, ttl_seconds=None, prefix='fragments:'):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, fragments):
+        self.client.set(self.prefix + key, json.dumps(fragments), ex=self.ttl_seconds)
+
+    def get_version(self, user_id):
+        return int(self.client.get(f"{self.prefix}version:{user_id}") or 0)
+
+    def bump_version(self, user_id):
+        self.client.incr(f"{self.prefix}version:{user_id}")
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+def backend_from_config(config):
+    url = config.get('FRAGMENT_CACHE_URL')
+    ttl = config.get('FRAGMENT_CACHE_TTL') or None
+    if url:
+        import redis
+        return RedisBackend(redis.Redis.from_url(url), ttl_seconds=ttl)
+    return MemoryBackend(max_entries=config.get('FRAGMENT_CACHE_SIZE', 2048), ttl_seconds=ttl)
+
+
+def _backend():
+    return current_app.extensions.get('fragment_cache')
+
+
+def bump_data_version(*user_ids):
+    """Invalidate the cached pages of the given users; None entries are ignored"""
+    backend = _backend()
+    if backend is None:
+        return
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        try:
+            backend.bump_version(user_id)
+        except Exception as e:
+            logger.error(f"Fragment cache version bump failed: {e}")
+
+
+def render_cached(template, page, user_ids, context_factory, **context):
+    """
+    Render template with its cached fragments for page, keyed by the data
+    versions of user_ids. On a miss context_factory() supplies the
+    template context, and the fragments it renders are stored. context is
+    passed on both paths and should hold whatever the template uses outside
+    its cached blocks.
+    """
+    backend = _backend()
+    if backend is None:
+        return render_template(template, **context_factory(), **context)
+
+    try:
+        versions = ':'.join(f"{user_id}.{backend.get_version(user_id)}"
+                            for user_id in user_ids if user_id is not None)
+        key = f"{page}:{versions}"
+        fragments = backend.get(key)
+    except Exception as e:
+        logger.error(f"Fragment cache lookup failed: {e}")
+        return render_template(template, **context_factory(), **context)
+
+    if fragments is not None:
+        g.cached_fragments = fragments
+        return render_template(template, **context)
+
+    g.rendered_fragments = {}
+    html = render_template(template, **context_factory(), **context)
+    try:
+        backend.set(key, g.rendered_fragments)
+    except Exception as e:
+        logger.error(f"Fragment cache store failed: {e}")
+    return html
+
+
+def cached_fragment(name, caller):
+    """
+    Template global used as {% call cached_fragment('content') %}...{% endcall %}.
+    Replays the stored fragment on a hit; otherwise renders the body and
+    records it for render_cached().
+    """
+    cached = g.get('cached_fragments')
+    if cached is not None and name in cached:
+        return Markup(cached[name])
+    html = caller()
+    rendered = g.get('rendered_fragments')
+    if rendered is not None:
+        rendered[name] = str(html)
+    return html
+
+
+def init_fragment_cache(app):
+    """Attach the configured backend (if FRAGMENT_CACHE_ENABLED) and the template global"""
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+    if app.config.get('FRAGMENT_CACHE_ENABLED', bool(app.config.get('FRAGMENT_CACHE_URL'))):
+        app.extensions['fragment_cache'] = backend_from_config(app.config)
@@ -0,0 +1,208 @@
+"""
+Grading of submitted tests.
+
+submit_test and auto_submit_test each graded answer by answer, loading the
+questions one at a time. grade_results() grades any number of test results
+together: their answers and the answer keys of their questions are fetched
+in two queries per chunk of results, graded as arrays, and written back
+with one bulk update. Questions left unanswered get a blank, zero-score
+answer row in one bulk insert, so every result has one answer per question
+on its paper.
+
+- multiple choice and true/false: exact match with the correct answer
+- numerical: within NUMERICAL_TOLERANCE of the correct value
+- descriptive: not auto-graded (is_correct is NULL); DESCRIPTIVE_CREDIT of
+  the marks for any non-empty answer, until a teacher grades it
+
+numpy is imported on first grading so app start-up does not pay for it.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update, bindparam
+
+from models import Question, QuestionAnswer, QuestionType, TestQuestion, TestResult
+from extensions import db
+from rollups import record_completed_result
+
+NUMERICAL_TOLERANCE = 0.001
+DESCRIPTIVE_CREDIT = 0.5
+
+# Results per query, keeping IN lists within every database's limits
+GRADE_CHUNK = 500
+
+
+def _fetch_papers(result_ids):
+    """{result_id: set of the question ids on its test}"""
+    rows = db.session.execute(
+        select(TestResult.id, TestQuestion.question_id)
+        .join(TestQuestion, TestQuestion.test_id == TestResult.test_id)
+        .where(TestResult.id.in_(result_ids))
+    )
+    papers = {result_id: set() for result_id in result_ids}
+    for result_id, question_id in rows:
+        papers[result_id].add(question_id)
+    return papers
+
+
+def _fetch_answers(result_ids):
+    return db.session.execute(
+        select(
+            QuestionAnswer.id,
+            QuestionAnswer.test_result_id,
+            QuestionAnswer.question_id,
+            QuestionAnswer.student_answer,
+            Question.question_type,
+            Question.correct_answer,
+            Question.marks
+        ).join(Question, Question.id == QuestionAnswer.question_id)
+        .where(QuestionAnswer.test_result_id.in_(result_ids))
+    ).all()
+
+
+def _update_grades():
+    # Executed with one parameter set per answer, as a single executemany
+    table = QuestionAnswer.__table__
+    return update(table).where(table.c.id == bindparam('answer_id'))\
+        .values(is_correct=bindparam('graded_correct'), score=bindparam('graded_score'))
+
+
+def _to_float(np, values):
+    """float() of each value as an array, NaN where it does not parse"""
+    strings = np.char.strip(np.array([value or '' for value in values], dtype=str))
+    try:
+        return strings.astype(np.float64)
+    except ValueError:
+        pass
+    parsed = np.full(len(strings), np.nan)
+    for i, value in enumerate(strings):
+        try:
+            parsed[i] = float(value)
+        except ValueError:
+            pass
+    return parsed
+
+
+def grade(np, question_types, student_answers, correct_answers, marks):
+    """
+    Grade parallel arrays of answers. Returns (is_correct, score): is_correct
+    is an object array holding True, False or None (not auto-graded), score
+    a float array.
+    """
+    marks = np.asarray(marks, dtype=np.float64)
+    is_correct = np.full(len(marks), False, dtype=object)
+    score = np.zeros(len(marks))
+
+    choice = (question_types == QuestionType.MULTIPLE_CHOICE) | (question_types == QuestionType.TRUE_FALSE)
+    numerical = question_types == QuestionType.NUMERICAL
+    descriptive = ~(choice | numerical)
+
+    correct = np.zeros(len(marks), dtype=bool)
+    correct[choice] = student_answers[choice] == correct_answers[choice]
+    if numerical.any():
+        # NaN for answers that are not numbers, which never compare as within tolerance
+        difference = _to_float(np, student_answers[numerical]) - _to_float(np, correct_answers[numerical])
+        correct[numerical] = np.abs(difference) < NUMERICAL_TOLERANCE
+    is_correct[~descriptive] = correct[~descriptive]
+    score[~descriptive] = np.where(correct[~descriptive], marks[~descriptive], 0.0)
+
+    is_correct[descriptive] = None
+    answered = np.array([bool(answer) for answer in student_answers[descriptive]], dtype=bool)
+    score[descriptive] = np.where(answered, marks[descriptive] * DESCRIPTIVE_CREDIT, 0.0)
+
+    return is_correct, score
+
+
+def grade_results(result_ids):
+    """
+    Grade the answers of the given test results in the current transaction
+    and add blank answers for unanswered questions. Returns {result_id:
+    total score}. TestResult rows are not touched; see complete_results().
+    """
+    import numpy as np
+
+    result_ids = list(result_ids)
+    totals = dict.fromkeys(result_ids, 0.0)
+    for start in range(0, len(result_ids), GRADE_CHUNK):
+        chunk = result_ids[start:start + GRADE_CHUNK]
+        papers = _fetch_papers(chunk)
+        # Only answers to questions on the result's paper count
+        rows = [row for row in _fetch_answers(chunk) if row[2] in papers[row[1]]]
+        if rows:
+            answer_ids, owners, _, student_answers, question_types, correct_answers, marks = (
+                np.array(column, dtype=object) for column in zip(*rows)
+            )
+            is_correct, score = grade(np, question_types, student_answers, correct_answers, marks)
+
+            db.session.execute(_update_grades(), [
+                {'answer_id': answer_id, 'graded_correct': correct, 'graded_score': points}
+                for answer_id, correct, points in zip(answer_ids.tolist(), is_correct.tolist(), score.tolist())
+            ])
+
+            result_index = {result_id: i for i, result_id in enumerate(chunk)}
+            positions = np.array([result_index[owner] for owner in owners.tolist()])
+            for result_id, total in zip(chunk, np.bincount(positions, weights=score, minlength=len(chunk)).tolist()):
+                totals[result_id] = total
+
+        # Blank, zero-score answers for questions left unanswered
+        answered = {(row[1], row[2]) for row in rows}
+        blanks = [
+            {'test_result_id': result_id, 'question_id': question_id,
+             'student_answer': '', 'is_correct': False, 'score': 0.0}
+            for result_id in chunk for question_id in papers[result_id]
+            if (result_id, question_id) not in answered
+        ]
+        if blanks:
+            db.session.bulk_insert_mappings(QuestionAnswer, blanks)
+    return totals
+
+
+def claim_results(result_ids):
+    """
+    Mark the given results completed unless they already are, and return
+    the ids this transaction completed. The conditional update makes
+    concurrent graders (a student's submit and the sweeper, or two sweeper
+    runs) agree on who completes a result, so it is counted once.
+    """
+    result_ids = list(result_ids)
+    claimed = db.session.execute(
+        update(TestResult)
+        .where(TestResult.id.in_(result_ids), TestResult.completed == False)
+        .values(completed=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed == len(result_ids):
+        return set(result_ids)
+    if claimed == 0:
+        return set()
+    # Results completed elsewhere already have a completion time; the ones claimed here get theirs below
+    return set(db.session.scalars(
+        select(TestResult.id)
+        .where(TestResult.id.in_(result_ids), TestResult.completed == True, TestResult.completed_at.is_(None))
+    ))
+
+
+def complete_results(test_results, end_time=None):
+    """
+    Grade the given results that this call completes and mark them
+    completed at end_time (default now), or at their deadline if that is
+    earlier. They are also stamped with completed_at, the actual time,
+    which incremental jobs use as their watermark, added to the rollups and
+    returned. Results another grader already completed are left exactly as
+    that grader wrote them. The caller commits.
+    """
+    now = datetime.utcnow()
+    end_time = end_time or now
+    newly_completed = claim_results(test_result.id for test_result in test_results)
+    completed = [test_result for test_result in test_results if test_result.id in newly_completed]
+    if not completed:
+        return []
+
+    totals = grade_results(test_result.id for test_result in completed)
+    for test_result in completed:
+        test_result.end_time = min(end_time, test_result.deadline) if test_result.deadline else end_time
+        test_result.completed_at = now
+        test_result.total_score = totals[test_result.id]
+        test_result.completed = True
+        record_completed_result(test_result)
+    return completed
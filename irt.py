@@ -0,0 +1,288 @@
+"""
+Item-response-theory calibration of question difficulty.
+
+Fits a 1PL (Rasch) or 2PL logistic model to all objectively graded answers
+of completed tests::
+
+    P(correct) = sigmoid(discrimination_q * (ability_s - difficulty_q))
+
+Parameters are MAP estimates under weak normal priors, found by alternating
+diagonal Newton steps computed for every student and question at once with
+np.bincount. The priors keep questions everyone (or no one) gets right finite
+and fix the scale, so the average student sits at ability 0.
+
+Results are stored in ItemCalibration / StudentAbility. An incremental run
+only refits the students and questions touched by tests completed since the
+previous run, holding every other parameter at its stored value.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import or_
+
+from models import QuestionAnswer, TestResult, ItemCalibration, StudentAbility, CalibrationRun
+from app import db
+
+MODELS = ('1PL', '2PL')
+
+# Prior standard deviations
+ABILITY_PRIOR_SD = 1.0
+DIFFICULTY_PRIOR_SD = 2.0
+DISCRIMINATION_PRIOR_SD = 0.5  # Around 1.0
+
+DISCRIMINATION_RANGE = (0.2, 4.0)
+MAX_STEP = 1.0  # Largest change of any parameter per iteration, in logits
+MAX_ITER = 100
+TOLERANCE = 1e-4
+
+# Incremental runs look this far behind the previous run's start: a result is
+# stamped completed_at before its grading transaction commits, so one committed
+# while that run was reading can carry an earlier time
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+RESPONSE_BATCH_SIZE = 50000
+WRITE_CHUNK = 5000
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def fit_irt(students, questions, responses, num_students, num_questions, model='2PL',
+            ability=None, difficulty=None, discrimination=None,
+            free_students=None, free_questions=None, max_iter=MAX_ITER, tol=TOLERANCE):
+    """
+    Fit IRT parameters to a set of responses.
+
+    Args:
+        students: Student index (0..num_students-1) of each response
+        questions: Question index (0..num_questions-1) of each response
+        responses: 1.0 for a correct response, 0.0 otherwise
+        num_students, num_questions: Sizes of the parameter arrays
+        model: '1PL' (discrimination fixed at 1) or '2PL'
+        ability, difficulty, discrimination: Optional starting values
+        free_students, free_questions: Optional boolean masks of the
+            parameters to fit; the rest are held at their starting values
+        max_iter: Iteration limit
+        tol: Stop once no parameter moves by more than this
+
+    Returns:
+        (ability, difficulty, discrimination, iterations)
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown IRT model {model!r}, expected one of {MODELS}")
+
+    ability = np.zeros(num_students) if ability is None else np.array(ability, dtype=np.float64)
+    difficulty = np.zeros(num_questions) if difficulty is None else np.array(difficulty, dtype=np.float64)
+    discrimination = np.ones(num_questions) if discrimination is None else np.array(discrimination, dtype=np.float64)
+    if free_students is None:
+        free_students = np.ones(num_students, dtype=bool)
+    if free_questions is None:
+        free_questions = np.ones(num_questions, dtype=bool)
+    responses = np.asarray(responses, dtype=np.float64)
+
+    def newton_step(gradient, curvature, free):
+        step = np.clip(gradient / curvature, -MAX_STEP, MAX_STEP)
+        step[~free] = 0.0
+        return step
+
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        # Abilities
+        a = discrimination[questions]
+        p = sigmoid(a * (ability[students] - difficulty[questions]))
+        gradient = np.bincount(students, weights=a * (responses - p), minlength=num_students) \
+            - ability / ABILITY_PRIOR_SD ** 2
+        curvature = np.bincount(students, weights=a * a * p * (1 - p), minlength=num_students) \
+            + 1 / ABILITY_PRIOR_SD ** 2
+        ability_step = newton_step(gradient, curvature, free_students)
+        ability += ability_step
+
+        # Difficulties
+        p = sigmoid(a * (ability[students] - difficulty[questions]))
+        gradient = -np.bincount(questions, weights=a * (responses - p), minlength=num_questions) \
+            - difficulty / DIFFICULTY_PRIOR_SD ** 2
+        curvature = np.bincount(questions, weights=a * a * p * (1 - p), minlength=num_questions) \
+            + 1 / DIFFICULTY_PRIOR_SD ** 2
+        difficulty_step = newton_step(gradient, curvature, free_questions)
+        difficulty += difficulty_step
+
+        # Discriminations
+        discrimination_step = np.zeros(num_questions)
+        if model == '2PL':
+            distance = ability[students] - difficulty[questions]
+            p = sigmoid(a * distance)
+            gradient = np.bincount(questions, weights=distance * (responses - p), minlength=num_questions) \
+                - (discrimination - 1) / DISCRIMINATION_PRIOR_SD ** 2
+            curvature = np.bincount(questions, weights=distance * distance * p * (1 - p), minlength=num_questions) \
+                + 1 / DISCRIMINATION_PRIOR_SD ** 2
+            discrimination_step = newton_step(gradient, curvature, free_questions)
+            discrimination = np.clip(discrimination + discrimination_step, *DISCRIMINATION_RANGE)
+
+        largest = max(np.abs(ability_step).max(initial=0),
+                      np.abs(difficulty_step).max(initial=0),
+                      np.abs(discrimination_step).max(initial=0))
+        if largest < tol:
+            break
+
+    return ability, difficulty, discrimination, iterations
+
+
+def load_responses(completed_since=None):
+    """
+    Objectively graded answers of completed tests as arrays
+    (student_id, question_id, correct). Descriptive answers (is_correct NULL)
+    are skipped.
+
+    With completed_since, only answers by students or to questions that
+    appear in tests completed (TestResult.completed_at) at or after that
+    time are loaded.
+    """
+    query = db.session.query(
+        TestResult.student_id,
+        QuestionAnswer.question_id,
+        QuestionAnswer.is_correct
+    ).join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
+        .filter(TestResult.completed == True)\
+        .filter(QuestionAnswer.is_correct != None)
+
+    if completed_since is not None:
+        recent_results = db.session.query(TestResult.id)\
+            .filter(TestResult.completed == True)\
+            .filter(TestResult.completed_at >= completed_since)
+        recent_students = db.session.query(TestResult.student_id).filter(TestResult.id.in_(recent_results))
+        recent_questions = db.session.query(QuestionAnswer.question_id)\
+            .filter(QuestionAnswer.test_result_id.in_(recent_results))
+        query = query.filter(or_(
+            TestResult.student_id.in_(recent_students),
+            QuestionAnswer.question_id.in_(recent_questions)
+        ))
+
+    columns = ([], [], [])
+    for row in query.yield_per(RESPONSE_BATCH_SIZE):
+        for column, value in zip(columns, row):
+            column.append(value)
+
+    student_ids, question_ids, correct = columns
+    return (np.array(student_ids, dtype=np.int64),
+            np.array(question_ids, dtype=np.int64),
+            np.array(correct, dtype=np.float64))
+
+
+def _stored_parameters(key, ids, columns):
+    """Stored parameter columns for ids, plus a mask of the ids that have a stored row"""
+    stored = {}
+    for start in range(0, len(ids), WRITE_CHUNK):
+        chunk = ids[start:start + WRITE_CHUNK].tolist()
+        for row in db.session.query(key, *columns).filter(key.in_(chunk)):
+            stored[row[0]] = row[1:]
+
+    found = np.array([i in stored for i in ids.tolist()], dtype=bool)
+    values = [np.array([stored[i][c] if i in stored else np.nan for i in ids.tolist()], dtype=np.float64)
+              for c in range(len(columns))]
+    return found, values
+
+
+def _save(model, key_name, rows, existing):
+    """Write rows (dicts keyed by column), updating ids that already exist"""
+    updates = [row for row in rows if row[key_name] in existing]
+    inserts = [row for row in rows if row[key_name] not in existing]
+    for start in range(0, len(updates), WRITE_CHUNK):
+        db.session.bulk_update_mappings(model, updates[start:start + WRITE_CHUNK])
+    for start in range(0, len(inserts), WRITE_CHUNK):
+        db.session.bulk_insert_mappings(model, inserts[start:start + WRITE_CHUNK])
+
+
+def calibrate(model='2PL', incremental=True):
+    """
+    Run the calibration job and store the fitted parameters.
+
+    An incremental run needs an earlier run of the same model; otherwise a
+    full calibration is done.
+
+    Returns:
+        The CalibrationRun record, or None if there was nothing to fit
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown IRT model {model!r}, expected one of {MODELS}")
+
+    previous = None
+    if incremental:
+        previous = CalibrationRun.query.filter_by(model=model)\
+            .filter(CalibrationRun.finished_at != None)\
+            .order_by(CalibrationRun.started_at.desc()).first()
+
+    run = CalibrationRun(model=model, incremental=previous is not None, started_at=datetime.utcnow())
+    completed_since = previous.started_at - WATERMARK_OVERLAP if previous else None
+    student_ids, question_ids, correct = load_responses(completed_since)
+    if len(correct) == 0:
+        return None
+
+    unique_students, student_index = np.unique(student_ids, return_inverse=True)
+    unique_questions, question_index = np.unique(question_ids, return_inverse=True)
+
+    free_students = free_questions = None
+    ability = difficulty = discrimination = None
+    if previous is not None:
+        # Refit what recent tests touched; hold everything else at its stored value
+        students_found, (stored_ability,) = _stored_parameters(
+            StudentAbility.student_id, unique_students, [StudentAbility.ability])
+        questions_found, (stored_difficulty, stored_discrimination) = _stored_parameters(
+            ItemCalibration.question_id, unique_questions,
+            [ItemCalibration.difficulty, ItemCalibration.discrimination])
+
+        recent_results = db.session.query(TestResult.id)\
+            .filter(TestResult.completed == True)\
+            .filter(TestResult.completed_at >= completed_since)
+        recent_students = {sid for (sid,) in db.session.query(TestResult.student_id)
+                           .filter(TestResult.id.in_(recent_results)).distinct()}
+        recent_questions = {qid for (qid,) in db.session.query(QuestionAnswer.question_id)
+                            .filter(QuestionAnswer.test_result_id.in_(recent_results)).distinct()}
+
+        free_students = ~students_found | np.isin(unique_students, list(recent_students))
+        free_questions = ~questions_found | np.isin(unique_questions, list(recent_questions))
+        ability = np.nan_to_num(stored_ability, nan=0.0)
+        difficulty = np.nan_to_num(stored_difficulty, nan=0.0)
+        discrimination = np.nan_to_num(stored_discrimination, nan=1.0)
+
+    ability, difficulty, discrimination, _ = fit_irt(
+        student_index, question_index, correct, len(unique_students), len(unique_questions),
+        model=model, ability=ability, difficulty=difficulty, discrimination=discrimination,
+        free_students=free_students, free_questions=free_questions
+    )
+
+    if free_students is None:
+        free_students = np.ones(len(unique_students), dtype=bool)
+    if free_questions is None:
+        free_questions = np.ones(len(unique_questions), dtype=bool)
+
+    now = datetime.utcnow()
+    student_counts = np.bincount(student_index, minlength=len(unique_students))
+    question_counts = np.bincount(question_index, minlength=len(unique_questions))
+
+    existing_students = {sid for (sid,) in db.session.query(StudentAbility.student_id)}
+    _save(StudentAbility, 'student_id', [{
+        'student_id': int(unique_students[i]),
+        'ability': float(ability[i]),
+        'num_responses': int(student_counts[i]),
+        'updated_at': now
+    } for i in np.flatnonzero(free_students)], existing_students)
+
+    existing_questions = {qid for (qid,) in db.session.query(ItemCalibration.question_id)}
+    _save(ItemCalibration, 'question_id', [{
+        'question_id': int(unique_questions[i]),
+        'difficulty': float(difficulty[i]),
+        'discrimination': float(discrimination[i]),
+        'num_responses': int(question_counts[i]),
+        'updated_at': now
+    } for i in np.flatnonzero(free_questions)], existing_questions)
+
+    run.num_responses = len(correct)
+    run.num_students = int(free_students.sum())
+    run.num_questions = int(free_questions.sum())
+    run.finished_at = datetime.utcnow()
+    db.session.add(run)
+    db.session.commit()
+    return run
+
@@ -0,0 +1,166 @@
+"""
+Classical item analysis of a test's questions.
+
+For every question of a test, over all completed attempts:
+
+- facility: mean fraction of the marks scored (the share answering
+  correctly, for objectively graded questions)
+- discrimination: facility among the top 27% of attempts by total score
+  minus facility among the bottom 27%
+- point-biserial: correlation between the item score and the rest of the
+  test score (total minus the item, so an item does not correlate with
+  itself)
+- distractors: how often each option A-D was chosen, for multiple choice
+
+All of it is computed from one fetch of the test's QuestionAnswer rows,
+with the answers laid out as an attempts x questions matrix. Results are
+cached per test and recomputed when the number of completed attempts or
+the question list changes, or invalidate_test() is called after a result
+completes.
+
+numpy is imported on first analysis so app start-up does not pay for it.
+"""
+
+from sqlalchemy import case, func
+
+from cache import LRUCache
+from models import QuestionAnswer, QuestionType, TestResult
+from extensions import db
+
+GROUP_FRACTION = 0.27
+OPTIONS = ('A', 'B', 'C', 'D')
+
+# A discrimination below this suggests the question needs review
+LOW_DISCRIMINATION = 0.2
+
+ANALYSIS_CACHE_SIZE = 256
+ANALYSIS_CACHE_TTL = 30 * 60  # seconds
+
+_cache = LRUCache(max_entries=ANALYSIS_CACHE_SIZE, ttl_seconds=ANALYSIS_CACHE_TTL)
+
+
+def _fetch_answers(test_id):
+    # Options are coded in SQL so long descriptive answers are never fetched
+    answer = func.upper(func.trim(QuestionAnswer.student_answer))
+    option_code = case(*[(answer == option, code) for code, option in enumerate(OPTIONS)], else_=len(OPTIONS))
+    return db.session.query(
+        QuestionAnswer.test_result_id,
+        QuestionAnswer.question_id,
+        option_code,
+        QuestionAnswer.score
+    ).join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
+        .filter(TestResult.test_id == test_id)\
+        .filter(TestResult.completed == True)\
+        .all()
+
+
+def analyze(questions, rows):
+    """
+    Item statistics for the given questions.
+
+    Args:
+        questions: Question objects of the test, in display order
+        rows: (test_result_id, question_id, option code, score) tuples, the
+            option code being the index into OPTIONS or len(OPTIONS) for
+            anything else (including blanks)
+
+    Returns:
+        (attempts, {question_id: stats dict}); statistics that are undefined
+        for the data (e.g. a correlation without variance) are None
+    """
+    import numpy as np
+
+    question_ids = np.array([q.id for q in questions], dtype=np.int64)
+    stats = {int(q_id): {
+        'responses': 0, 'facility': None, 'discrimination': None, 'point_biserial': None, 'distractors': None
+    } for q_id in question_ids}
+    if not rows or not len(question_ids):
+        return 0, stats
+
+    table = np.array(rows, dtype=np.float64)
+    result_col, question_col, code_col = table[:, :3].astype(np.int64).T
+    score_col = np.nan_to_num(table[:, 3])  # Ungraded (NULL) scores count as 0
+
+    # Answers to questions since removed from the test are ignored
+    order = np.argsort(question_ids)
+    position = np.searchsorted(question_ids, question_col, sorter=order)
+    position = np.minimum(position, len(question_ids) - 1)
+    keep = question_ids[order[position]] == question_col
+    column = order[position[keep]]
+    _, row = np.unique(result_col[keep], return_inverse=True)
+    attempts = int(row.max()) + 1 if len(row) else 0
+    if attempts == 0:
+        return 0, stats
+
+    marks = np.array([q.marks for q in questions], dtype=np.float64)
+    scores = np.zeros((attempts, len(question_ids)))
+    scores[row, column] = score_col[keep]
+    answered = np.zeros((attempts, len(question_ids)), dtype=bool)
+    answered[row, column] = True
+    item = np.divide(scores, marks, out=np.zeros_like(scores), where=marks > 0)
+
+    facility = item.mean(axis=0)
+
+    # Discrimination: top vs bottom groups by total score
+    totals = scores.sum(axis=1)
+    group = max(1, int(round(attempts * GROUP_FRACTION)))
+    ranked = np.argsort(totals, kind='stable')
+    if attempts >= 2:
+        discrimination = item[ranked[-group:]].mean(axis=0) - item[ranked[:group]].mean(axis=0)
+    else:
+        discrimination = np.full(len(question_ids), np.nan)
+
+    # Point-biserial against the rest score
+    rest = totals[:, None] - scores
+    item_centered = item - item.mean(axis=0)
+    rest_centered = rest - rest.mean(axis=0)
+    denominator = np.sqrt((item_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0))
+    point_biserial = np.divide((item_centered * rest_centered).sum(axis=0), denominator,
+                               out=np.full(len(question_ids), np.nan), where=denominator > 0)
+
+    # Option counts per question; the last column collects blanks and anything else
+    option_counts = np.bincount(column * (len(OPTIONS) + 1) + code_col[keep],
+                                minlength=len(question_ids) * (len(OPTIONS) + 1))\
+        .reshape(len(question_ids), len(OPTIONS) + 1)
+    responses = answered.sum(axis=0)
+
+    def finite(value, digits=3):
+        return round(float(value), digits) if np.isfinite(value) else None
+
+    for i, question in enumerate(questions):
+        entry = stats[question.id]
+        entry['responses'] = int(responses[i])
+        entry['facility'] = finite(facility[i])
+        entry['discrimination'] = finite(discrimination[i])
+        entry['point_biserial'] = finite(point_biserial[i])
+        if question.question_type == QuestionType.MULTIPLE_CHOICE:
+            entry['distractors'] = [{
+                'option': option,
+                'count': int(option_counts[i, code]),
+                'fraction': round(option_counts[i, code] / responses[i], 3) if responses[i] else 0.0,
+                'correct': option == (question.correct_answer or '').strip().upper()
+            } for code, option in enumerate(OPTIONS)]
+            entry['omitted'] = int(option_counts[i, len(OPTIONS)])
+    return attempts, stats
+
+
+def get_item_analysis(test_id, questions, completed_results):
+    """
+    Cached analysis of a test. completed_results is the test's current
+    number of completed attempts; a cached entry computed for a different
+    count or question list (e.g. by another worker before new submissions)
+    is recomputed.
+    """
+    stamp = (completed_results, tuple(q.id for q in questions))
+    generation = _cache.generation
+    cached = _cache.get(test_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    analysis = analyze(questions, _fetch_answers(test_id))
+    _cache.set(test_id, (stamp, analysis), generation)
+    return analysis
+
+
+def invalidate_test(test_id):
+    """Drop the cached analysis of a test, e.g. after one of its results completes"""
+    _cache.invalidate(test_id)
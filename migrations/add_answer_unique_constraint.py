@@ -0,0 +1,30 @@
+from sqlalchemy import text
+
+from app import create_app
+from extensions import db
+
+# Same name as the UniqueConstraint on QuestionAnswer. Existing tables get a
+# unique index, which SQLite cannot add as a constraint after the fact and
+# which serves ON CONFLICT (test_result_id, question_id) just the same.
+INDEX_NAME = 'uq_question_answer_result_question'
+
+def upgrade():
+    app = create_app()
+    with app.app_context():
+        # Keep the most recent row of any duplicated (attempt, question) pair
+        deleted = db.session.execute(text(
+            'DELETE FROM question_answer WHERE id NOT IN ('
+            ' SELECT keep_id FROM ('
+            '  SELECT MAX(id) AS keep_id FROM question_answer GROUP BY test_result_id, question_id'
+            ' ) AS latest)'
+        )).rowcount
+        db.session.execute(text(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS {INDEX_NAME} ON question_answer (test_result_id, question_id)'
+        ))
+        db.session.commit()
+        print(f"Removed {deleted} duplicate answers and added {INDEX_NAME}")
+        if deleted:
+            print("Run scripts/backfill_rollups.py to recompute the performance rollups")
+
+if __name__ == '__main__':
+    upgrade()
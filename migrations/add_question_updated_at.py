@@ -0,0 +1,21 @@
+from sqlalchemy import text, inspect
+
+from app import create_app
+from extensions import db
+
+def upgrade():
+    app = create_app()
+    with app.app_context():
+        columns = {column['name'] for column in inspect(db.engine).get_columns('question')}
+        if 'updated_at' not in columns:
+            db.session.execute(text('ALTER TABLE question ADD COLUMN updated_at TIMESTAMP'))
+
+        # Existing questions were last changed no earlier than they were created
+        backfilled = db.session.execute(text(
+            'UPDATE question SET updated_at = created_at WHERE updated_at IS NULL'
+        )).rowcount
+        db.session.commit()
+        print(f"Set the update time of {backfilled} questions")
+
+if __name__ == '__main__':
+    upgrade()
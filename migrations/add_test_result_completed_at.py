@@ -0,0 +1,29 @@
+from sqlalchemy import text, inspect
+
+from app import create_app
+from extensions import db
+
+# Same name as the Index on TestResult
+INDEX_NAME = 'ix_test_result_completed_at'
+
+def upgrade():
+    app = create_app()
+    with app.app_context():
+        columns = {column['name'] for column in inspect(db.engine).get_columns('test_result')}
+        if 'completed_at' not in columns:
+            db.session.execute(text('ALTER TABLE test_result ADD COLUMN completed_at TIMESTAMP'))
+
+        # Results completed before this column existed: their end time is the best record left
+        backfilled = db.session.execute(text(
+            'UPDATE test_result SET completed_at = end_time '
+            'WHERE completed = :completed AND completed_at IS NULL AND end_time IS NOT NULL'
+        ), {'completed': True}).rowcount
+
+        db.session.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON test_result (completed_at)'
+        ))
+        db.session.commit()
+        print(f"Set the completion time of {backfilled} results and added {INDEX_NAME}")
+
+if __name__ == '__main__':
+    upgrade()
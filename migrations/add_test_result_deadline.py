@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from sqlalchemy import text, inspect, select, update, bindparam
+
+from app import create_app
+from extensions import db
+from models import Test, TestResult
+
+# Same name as the Index on TestResult
+INDEX_NAME = 'ix_test_result_completed_deadline'
+BACKFILL_CHUNK = 5000
+
+def upgrade():
+    app = create_app()
+    with app.app_context():
+        columns = {column['name'] for column in inspect(db.engine).get_columns('test_result')}
+        if 'deadline' not in columns:
+            db.session.execute(text('ALTER TABLE test_result ADD COLUMN deadline TIMESTAMP'))
+
+        # Deadlines of attempts already started: start_time plus the test's duration
+        table = TestResult.__table__
+        set_deadline = update(table).where(table.c.id == bindparam('result_id'))\
+            .values(deadline=bindparam('result_deadline'))
+        backfilled = 0
+        while True:
+            rows = db.session.execute(
+                select(TestResult.id, TestResult.start_time, Test.duration_minutes)
+                .join(Test, Test.id == TestResult.test_id)
+                .where(TestResult.start_time.isnot(None), TestResult.deadline.is_(None))
+                .limit(BACKFILL_CHUNK)
+            ).all()
+            if not rows:
+                break
+            db.session.execute(set_deadline, [
+                {'result_id': result_id, 'result_deadline': start_time + timedelta(minutes=duration)}
+                for result_id, start_time, duration in rows
+            ])
+            backfilled += len(rows)
+
+        db.session.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON test_result (completed, deadline)'
+        ))
+        db.session.commit()
+        print(f"Set the deadline of {backfilled} attempts and added {INDEX_NAME}")
+
+if __name__ == '__main__':
+    upgrade()
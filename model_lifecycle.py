@@ -0,0 +1,162 @@
+"""
+Background refresh of the recommendation model
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+
+def train_in_process():
+    """Whether fits run in the training process pool (RECOMMENDER_TRAIN_IN_PROCESS, default on)"""
+    if not has_app_context():
+        return True
+    return current_app.config.get('RECOMMENDER_TRAIN_IN_PROCESS', True)
+
+
+class BackgroundTrainer:
+    """
+    Runs an engine's train_model() on a daemon thread, one run at a time,
+    so a request that finds no model can start training without waiting for it.
+    """
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start a run unless one is in progress. Needs an app context, which the thread inherits."""
+        if not has_app_context():
+            return False
+        app = current_app._get_current_object()
+
+        def train():
+            with app.app_context():
+                try:
+                    self.engine.train_model(if_missing=True)
+                except Exception as e:
+                    logger.error(f"Background training failed: {e}", exc_info=True)
+
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=train, name=self.name, daemon=True)
+            self._thread.start()
+        return True
+
+
+class ModelRefresher:
+    """
+    Periodically retrains a recommendation engine in a daemon thread.
+
+    Each poll first loads any newer model another worker has published to
+    the shared artifact directory, then decides whether a rebuild is due.
+
+    A rebuild is triggered when the current model is older than
+    ``interval_seconds`` or when at least ``min_new_answers`` QuestionAnswer
+    rows have arrived since it was trained. The engine publishes each new
+    model with an atomic swap, so requests never wait on a rebuild.
+    """
+
+    def __init__(self, app, engine, interval_seconds=3600, min_new_answers=500, poll_seconds=60,
+                 name='model-refresher'):
+        self.app = app
+        self.engine = engine
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.min_new_answers = min_new_answers
+        self.poll_seconds = poll_seconds
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._start_lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def refresh_due(self):
+        """Return the reason a rebuild is due, or None if the current model is fresh"""
+        model = self.engine.current_model
+        if model is None:
+            return 'no model'
+        if datetime.utcnow() - model.trained_at >= timedelta(seconds=self.interval_seconds):
+            return 'schedule'
+        if self.engine.new_answers_since_training() >= self.min_new_answers:
+            return 'new answers'
+        return None
+
+    def refresh_once(self):
+        """Retrain if due. Returns True when a new model version was published."""
+        with self.app.app_context():
+            # Pick up a model another worker has published
+            if self.engine.load_published_model():
+                logger.info(f"Loaded published recommendation model version {self.engine.model_version}")
+
+            reason = self.refresh_due()
+            if reason is None:
+                return False
+
+            logger.info(f"Retraining recommendation model ({reason})")
+            # The engine's background trainer may have built the first model meanwhile
+            trained = self.engine.train_model(if_missing=reason == 'no model')
+            if trained:
+                logger.info(f"Published recommendation model version {self.engine.model_version}")
+            return trained
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error(f"Model refresh failed: {e}", exc_info=True)
+            self._stop_event.wait(self.poll_seconds)
+
+
+def init_model_refresher(app, engine, name='model_refresher'):
+    """
+    Attach a ModelRefresher to the app under app.extensions[name]. The thread
+    is started by a request rather than here, so CLI scripts that call
+    create_app() do not spawn a trainer. For a LazyEngine it waits until a
+    request has loaded the engine: polling would import the ML stack in
+    every worker, including those that never recommend anything. Until
+    then the engine's own BackgroundTrainer covers a missing model.
+    """
+    refresher = ModelRefresher(
+        app,
+        engine,
+        interval_seconds=app.config['RECOMMENDER_REFRESH_INTERVAL'],
+        min_new_answers=app.config['RECOMMENDER_REFRESH_MIN_ANSWERS'],
+        poll_seconds=app.config['RECOMMENDER_REFRESH_POLL'],
+        name=name.replace('_', '-')
+    )
+    app.extensions[name] = refresher
+
+    @app.before_request
+    def start_model_refresher():
+        if not refresher.running and getattr(engine, 'loaded', True):
+            refresher.start()
+
+    return refresher
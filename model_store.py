@@ -0,0 +1,167 @@
+"""
+On-disk artifacts for trained recommendation models.
+
+Layout of an artifact directory::
+
+    CURRENT             name of the published version directory
+    train.lock          held by the worker that is currently training
+    v000007/
+        meta.json       version, answer watermark, training time
+        transforms.pkl  fitted StandardScaler / PCA
+        <column>.npy    one array per question feature column
+        features.npy    transformed feature matrix
+
+A version directory is written under a temporary name, renamed into place
+and only then pointed to by CURRENT, so readers never see a partial model.
+Arrays are loaded with ``mmap_mode='r'``; every gunicorn worker mapping the
+same files shares one copy of the pages through the OS page cache.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; training is then not coordinated
+    fcntl = None
+
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'train.lock'
+KEEP_VERSIONS = 3
+
+
+def _version_dirname(version):
+    return f"v{version:06d}"
+
+
+def read_current_version(directory):
+    """Version number of the published artifact, or 0 if nothing is published"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return 0
+    return int(name.lstrip('v')) if name else 0
+
+
+@contextmanager
+def training_lock(directory):
+    """
+    Non-blocking exclusive lock on the artifact directory. Yields True when
+    this process may train, False when another process already is.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_artifact(directory, version, columns, features, transforms, answer_watermark, trained_at):
+    """
+    Write a model version and publish it as CURRENT.
+
+    Args:
+        directory: Artifact root directory
+        version: Integer version number, must be higher than the published one
+        columns: Dict of column name -> 1-D array of per-question values
+        features: 2-D transformed feature matrix
+        transforms: Dict of fitted sklearn transforms (pickled)
+        answer_watermark: Highest QuestionAnswer id seen by the training run
+        trained_at: datetime the model was trained
+    """
+    os.makedirs(directory, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=directory)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(values))
+        np.save(os.path.join(staging, 'features.npy'), np.ascontiguousarray(features, dtype=np.float64))
+
+        with open(os.path.join(staging, 'transforms.pkl'), 'wb') as f:
+            pickle.dump(transforms, f)
+
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'version': version,
+                'columns': list(columns),
+                'answer_watermark': answer_watermark,
+                'trained_at': trained_at.isoformat()
+            }, f)
+
+        os.rename(staging, os.path.join(directory, _version_dirname(version)))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Atomically repoint CURRENT at the new version
+    fd, pointer = tempfile.mkstemp(prefix='.current-', dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        f.write(_version_dirname(version))
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    _remove_old_versions(directory, version)
+
+
+def _remove_old_versions(directory, current_version):
+    # Workers still mapping an old version keep their pages until they unmap
+    versions = sorted(
+        int(name[1:]) for name in os.listdir(directory)
+        if name.startswith('v') and name[1:].isdigit()
+    )
+    for version in versions:
+        if version <= current_version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(directory, _version_dirname(version)), ignore_errors=True)
+
+
+def read_artifact(directory, version=None):
+    """
+    Load a published model version with memory-mapped arrays.
+
+    Returns a dict with keys version, columns, features, transforms,
+    answer_watermark and trained_at, or None if nothing is published.
+    """
+    if version is None:
+        version = read_current_version(directory)
+    if not version:
+        return None
+
+    path = os.path.join(directory, _version_dirname(version))
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['format'] != FORMAT_VERSION:
+        return None
+
+    with open(os.path.join(path, 'transforms.pkl'), 'rb') as f:
+        transforms = pickle.load(f)
+
+    return {
+        'version': meta['version'],
+        'columns': {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            for name in meta['columns']
+        },
+        'features': np.load(os.path.join(path, 'features.npy'), mmap_mode='r'),
+        'transforms': transforms,
+        'answer_watermark': meta['answer_watermark'],
+        'trained_at': datetime.fromisoformat(meta['trained_at'])
+    }
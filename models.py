@@ -104,6 +104,8 @@ class Question(db.Model):
     marks = db.Column(db.Integer, nullable=False)
     created_by = db.Column(db.Integer, ForeignKey("user.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last change, part of the stamp compiled papers are checked against
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Multiple choice options (applicable for MULTIPLE_CHOICE type)
     option_a = db.Column(db.Text, nullable=True)
@@ -148,6 +150,13 @@ class TestQuestion(db.Model):
 
 
 class TestResult(db.Model):
+    # Open attempts by deadline, for the sweeper that auto-submits expired ones;
+    # results by completion time, for incremental jobs such as the IRT calibration
+    __table_args__ = (
+        db.Index('ix_test_result_completed_deadline', 'completed', 'deadline'),
+        db.Index('ix_test_result_completed_at', 'completed_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     test_id = db.Column(db.Integer, ForeignKey("test.id"), nullable=False)
     student_id = db.Column(db.Integer, ForeignKey("user.id"), nullable=False)
@@ -155,12 +164,27 @@ class TestResult(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     total_score = db.Column(db.Float, nullable=True)
     completed = db.Column(db.Boolean, default=False)
+    # start_time plus the test's duration; NULL until the clock starts
+    deadline = db.Column(db.DateTime, nullable=True)
+    # When the result was actually completed. end_time is capped at the deadline
+    # for display and durations, so it can lie well before this for swept attempts.
+    completed_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     answers = relationship("QuestionAnswer", backref="test_result", lazy=True, cascade="all, delete-orphan")
 
+    def start(self, duration_minutes):
+        """Start the clock of this attempt"""
+        self.start_time = datetime.utcnow()
+        self.deadline = self.start_time + timedelta(minutes=duration_minutes)
+
 
 class QuestionAnswer(db.Model):
+    # One answer per question per attempt; answers are saved with an upsert on this key
+    __table_args__ = (
+        db.UniqueConstraint('test_result_id', 'question_id', name='uq_question_answer_result_question'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     test_result_id = db.Column(db.Integer, ForeignKey("test_result.id"), nullable=False)
     question_id = db.Column(db.Integer, ForeignKey("question.id"), nullable=False)
@@ -172,6 +196,91 @@ class QuestionAnswer(db.Model):
     question = relationship("Question")
 
 
+class ItemCalibration(db.Model):
+    """Item-response-theory parameters of a question, fitted by irt.py"""
+    question_id = db.Column(db.Integer, ForeignKey("question.id"), primary_key=True)
+    difficulty = db.Column(db.Float, nullable=False)  # Logit scale; the average student is at 0
+    discrimination = db.Column(db.Float, nullable=False, default=1.0)
+    num_responses = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Calibrated difficulty bounds of the MEDIUM band
+    EASY_BELOW = -0.5
+    HARD_ABOVE = 0.5
+
+    question = relationship("Question", backref=db.backref("calibration", uselist=False))
+
+    @classmethod
+    def matches_difficulty(cls, difficulty):
+        """
+        SQL condition selecting questions of a difficulty band. Calibrated
+        questions are banded by their fitted difficulty, the rest by their label.
+        Use with a query outer-joined to ItemCalibration.
+        """
+        if difficulty == QuestionDifficulty.EASY:
+            calibrated = cls.difficulty < cls.EASY_BELOW
+        elif difficulty == QuestionDifficulty.HARD:
+            calibrated = cls.difficulty > cls.HARD_ABOVE
+        else:
+            calibrated = cls.difficulty.between(cls.EASY_BELOW, cls.HARD_ABOVE)
+        return db.or_(
+            db.and_(cls.question_id != None, calibrated),
+            db.and_(cls.question_id == None, Question.difficulty == difficulty)
+        )
+
+
+class StudentAbility(db.Model):
+    """Item-response-theory ability estimate of a student, fitted by irt.py"""
+    student_id = db.Column(db.Integer, ForeignKey("user.id"), primary_key=True)
+    ability = db.Column(db.Float, nullable=False)
+    num_responses = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CalibrationRun(db.Model):
+    """One run of the IRT calibration job; the latest run is the incremental watermark"""
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(8), nullable=False)  # '1PL' or '2PL'
+    incremental = db.Column(db.Boolean, default=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    num_responses = db.Column(db.Integer, default=0)
+    num_questions = db.Column(db.Integer, default=0)
+    num_students = db.Column(db.Integer, default=0)
+
+
+class StudentPerformance(db.Model):
+    """Running totals over a student's completed tests, maintained by rollups.py"""
+    student_id = db.Column(db.Integer, ForeignKey("user.id"), primary_key=True)
+    tests_taken = db.Column(db.Integer, nullable=False, default=0)
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of per-test score fractions
+    total_score = db.Column(db.Float, nullable=False, default=0.0)
+    total_marks = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def avg_percentage(self):
+        """Average per-test score fraction (0-1)"""
+        return self.percentage_sum / self.tests_taken if self.tests_taken else 0.0
+
+
+class ChapterPerformance(db.Model):
+    """
+    Running totals of a student's answers in completed tests per chapter,
+    maintained by rollups.py. Difficulty and question type are part of the
+    key so the recommender can build profiles from the same rows.
+    """
+    student_id = db.Column(db.Integer, ForeignKey("user.id"), primary_key=True)
+    chapter_id = db.Column(db.Integer, ForeignKey("chapter.id"), primary_key=True)
+    difficulty = db.Column(Enum(QuestionDifficulty), primary_key=True)
+    question_type = db.Column(Enum(QuestionType), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    max_score = db.Column(db.Float, nullable=False, default=0.0)
+    scored = db.Column(db.Integer, nullable=False, default=0)  # Answers with a score
+    score_fraction_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of score / marks
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
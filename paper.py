@@ -0,0 +1,188 @@
+"""
+Compiled test papers.
+
+take_test used to query a test's questions and build a WTForms form per
+question on every page load, although the paper does not change while
+students sit it. get_paper() compiles a test into immutable tuples (its
+settings and the ordered questions with their options) once per process,
+and the page is rendered from those.
+
+Committed changes to a test, its question list or any question invalidate
+the compiled papers they affect in this process. Changes made by other
+processes, or by bulk SQL that bypasses the ORM, are caught by a stamp
+read on every get_paper(): one aggregate query over the test's settings,
+its question list and the latest Question.updated_at. A cached paper whose
+stamp differs is compiled again, so workers never serve a stale question
+set; PAPER_CACHE_TTL only bounds memory.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from cache import LRUCache
+from extensions import db
+from models import Chapter, Question, QuestionType, Test, TestQuestion
+
+Paper = namedtuple('Paper', ['id', 'title', 'duration_minutes', 'total_marks', 'questions'])
+PaperQuestion = namedtuple('PaperQuestion', [
+    'id', 'text', 'question_type', 'difficulty', 'marks', 'chapter_name', 'image_path', 'field', 'options'
+])
+
+# Name of the answer field each question type is posted under, as q<id>-<field>
+ANSWER_FIELDS = {
+    QuestionType.MULTIPLE_CHOICE: 'multiple_choice',
+    QuestionType.TRUE_FALSE: 'true_false'
+}
+TEXT_ANSWER_FIELD = 'text_answer'
+TRUE_FALSE_OPTIONS = (('True', 'True'), ('False', 'False'))
+
+DEFAULT_TTL = 10 * 60  # seconds
+
+_cache = LRUCache(max_entries=256, ttl_seconds=DEFAULT_TTL)
+
+# Key of the session.info entry collecting changes until commit; ALL means every paper
+_CHANGES = 'paper_changes'
+ALL = 'all'
+
+
+def _compile(test_id):
+    test = db.session.query(Test.id, Test.title, Test.duration_minutes, Test.total_marks)\
+        .filter(Test.id == test_id).first()
+    if test is None:
+        return None
+
+    rows = db.session.query(
+        Question.id,
+        Question.text,
+        Question.question_type,
+        Question.difficulty,
+        Question.marks,
+        Chapter.name,
+        Question.image_path,
+        Question.option_a,
+        Question.option_b,
+        Question.option_c,
+        Question.option_d
+    ).join(TestQuestion, TestQuestion.question_id == Question.id)\
+        .outerjoin(Chapter, Chapter.id == Question.chapter_id)\
+        .filter(TestQuestion.test_id == test_id)\
+        .order_by(TestQuestion.order)
+
+    questions = []
+    for (question_id, text, question_type, difficulty, marks, chapter_name, image_path,
+         option_a, option_b, option_c, option_d) in rows:
+        if question_type == QuestionType.MULTIPLE_CHOICE:
+            options = (('A', option_a), ('B', option_b), ('C', option_c), ('D', option_d))
+        elif question_type == QuestionType.TRUE_FALSE:
+            options = TRUE_FALSE_OPTIONS
+        else:
+            options = ()
+        questions.append(PaperQuestion(
+            id=question_id,
+            text=text,
+            question_type=question_type.value,
+            difficulty=difficulty.value,
+            marks=marks,
+            chapter_name=chapter_name,
+            image_path=image_path.replace('\\', '/') if image_path else None,
+            field=f"q{question_id}-{ANSWER_FIELDS.get(question_type, TEXT_ANSWER_FIELD)}",
+            options=options
+        ))
+
+    return Paper(*test, questions=tuple(questions))
+
+
+def _stamp(test_id):
+    """
+    What a compiled paper depends on, as one cheap row: the test's settings,
+    its question list and the last time one of its questions changed. None
+    if there is no such test.
+    """
+    row = db.session.query(
+        Test.title,
+        Test.duration_minutes,
+        Test.total_marks,
+        func.count(TestQuestion.id),
+        func.max(TestQuestion.id),
+        func.sum(TestQuestion.question_id),
+        func.max(Question.updated_at)
+    ).outerjoin(TestQuestion, TestQuestion.test_id == Test.id)\
+        .outerjoin(Question, Question.id == TestQuestion.question_id)\
+        .filter(Test.id == test_id)\
+        .group_by(Test.id)\
+        .first()
+    return tuple(row) if row is not None else None
+
+
+def get_paper(test_id):
+    """The compiled Paper of a test, or None if there is no such test"""
+    generation = _cache.generation
+    stamp = _stamp(test_id)
+    if stamp is None:
+        return None
+    cached = _cache.get(test_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    paper = _compile(test_id)
+    if paper is not None:
+        _cache.set(test_id, (stamp, paper), generation)
+    return paper
+
+
+def posted_answers(paper, form):
+    """
+    {question_id: answer} for the questions of paper in the posted form. A
+    field posted empty (a cleared text answer) maps to '', so saving it
+    clears the stored answer; fields not posted at all (no option chosen)
+    are left out.
+    """
+    return {question.id: form[question.field] for question in paper.questions if question.field in form}
+
+
+def invalidate_paper(*test_ids):
+    """Drop the compiled papers of the given tests, or all of them if none are given"""
+    if not test_ids:
+        _cache.clear()
+    for test_id in test_ids:
+        _cache.invalidate(test_id)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault(_CHANGES, set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, TestQuestion):
+            pending.add(instance.test_id)
+        elif isinstance(instance, Test):
+            pending.add(instance.id)
+        elif isinstance(instance, Question) and instance not in session.new:
+            # A question can be on any number of papers
+            pending.add(ALL)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    changed = session.info.pop(_CHANGES, None)
+    if not changed:
+        return
+    if ALL in changed:
+        invalidate_paper()
+    else:
+        invalidate_paper(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_CHANGES, None)
+
+
+def init_paper_cache(app):
+    """Apply the app's PAPER_CACHE_TTL (seconds; 0 disables expiry)"""
+    ttl = app.config.get('PAPER_CACHE_TTL', DEFAULT_TTL)
+    _cache.ttl_seconds = ttl or None
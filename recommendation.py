@@ -2,16 +2,236 @@
 Machine learning system for personalized question recommendations
 """
 
+import threading
+from datetime import datetime
+
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
-from sklearn.decomposition import PCA
+from flask import current_app, has_app_context
+from sqlalchemy import func, case
 
-from models import User, Question, QuestionAnswer, TestResult, Chapter, QuestionDifficulty, QuestionType
+from cache import LRUCache
+from model_store import read_artifact, read_current_version, training_lock, write_artifact
+from training import fit_question_features, run_fit
+from model_lifecycle import BackgroundTrainer, train_in_process
+from models import (User, Question, QuestionAnswer, TestResult, Chapter, QuestionDifficulty, QuestionType,
+                    ItemCalibration, ChapterPerformance)
 from app import db
 
 
+# Numeric encodings used as model features
+DIFFICULTY_CODES = {
+    QuestionDifficulty.EASY: 1,
+    QuestionDifficulty.MEDIUM: 2,
+    QuestionDifficulty.HARD: 3
+}
+
+TYPE_CODES = {
+    QuestionType.MULTIPLE_CHOICE: 1,
+    QuestionType.TRUE_FALSE: 2,
+    QuestionType.NUMERICAL: 3,
+    QuestionType.DESCRIPTIVE: 4
+}
+
+# Rows fetched per round trip when streaming the question bank
+QUESTION_BATCH_SIZE = 5000
+
+# Student profile cache bounds. The TTL also caps staleness in workers that
+# never see the invalidation for a student's latest submission.
+PROFILE_CACHE_SIZE = 2048
+PROFILE_CACHE_TTL = 15 * 60  # seconds
+
+# Students per grouped profile query, and per block of the batch score matrix
+PROFILE_QUERY_CHUNK = 500
+STUDENT_BLOCK_SIZE = 64
+
+# Weights applied to each part of a student profile when scoring questions
+WEAK_CHAPTER_WEIGHT = 5
+CHAPTER_WEIGHT = 3
+DIFFICULTY_WEIGHT = 2
+TYPE_WEIGHT = 2
+
+
+def lookup_weights(mapping, keys, default=0.5):
+    """
+    Vectorized ``mapping.get(key, default)`` over an array of integer keys
+    """
+    keys = np.asarray(keys)
+    if not mapping:
+        return np.full(len(keys), default, dtype=np.float64)
+    
+    map_keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+    map_values = np.fromiter(mapping.values(), dtype=np.float64, count=len(mapping))
+    order = np.argsort(map_keys)
+    map_keys = map_keys[order]
+    map_values = map_values[order]
+    
+    positions = np.minimum(np.searchsorted(map_keys, keys), len(map_keys) - 1)
+    found = map_keys[positions] == keys
+    return np.where(found, map_values[positions], default)
+
+
+def score_questions(profile, chapters, difficulties, question_types):
+    """
+    Score candidate questions against a student profile.
+
+    Args:
+        profile: Profile dict from RecommendationEngine.create_student_profile
+        chapters, difficulties, question_types: Equal-length arrays of
+            encoded question features
+
+    Returns:
+        Array of scores, higher meaning the student needs more practice
+    """
+    weak_chapters = np.fromiter(profile['weak_chapters'], dtype=np.int64, count=len(profile['weak_chapters']))
+    
+    scores = WEAK_CHAPTER_WEIGHT * np.isin(chapters, weak_chapters)
+    scores = scores + CHAPTER_WEIGHT * lookup_weights(profile['chapter_preference'], chapters)
+    scores += DIFFICULTY_WEIGHT * lookup_weights(profile['difficulty_preference'], difficulties)
+    scores += TYPE_WEIGHT * lookup_weights(profile['type_preference'], question_types)
+    return scores
+
+
+def select_questions(scores, num_questions):
+    """
+    Pick up to num_questions candidate indices by weighted random sampling
+    without replacement, with probability proportional to score. When fewer
+    than num_questions scores are positive, all of those are taken and the
+    rest are drawn uniformly from the others.
+    """
+    if len(scores) <= num_questions:
+        # If we have fewer questions than requested, return all of them
+        return np.arange(len(scores))
+    
+    positive = np.flatnonzero(scores > 0)
+    if len(positive) <= num_questions:
+        # Too few stand out to sample from by weight: take them all and top up at random
+        others = np.flatnonzero(scores <= 0)
+        fill = np.random.choice(others, size=num_questions - len(positive), replace=False)
+        return np.concatenate([positive, fill])
+    
+    # Normalize scores
+    norm_scores = np.maximum(scores, 0) / scores.max()
+    probabilities = norm_scores / norm_scores.sum()
+    
+    return np.random.choice(len(scores), size=num_questions, replace=False, p=probabilities)
+
+
+def score_questions_batch(profiles, chapters, difficulties, question_types):
+    """
+    Score candidate questions against many student profiles at once.
+
+    Each profile is expanded into weight vectors over the candidate chapters,
+    difficulties and types, and the scores come from gathering those vectors
+    by column. Same weighting as score_questions().
+
+    Returns:
+        Array of shape (len(profiles), len(chapters))
+    """
+    unique_chapters, chapter_index = np.unique(chapters, return_inverse=True)
+    difficulty_codes = np.arange(max(DIFFICULTY_CODES.values()) + 1)
+    type_codes = np.arange(max(TYPE_CODES.values()) + 1)
+    
+    chapter_weights = np.empty((len(profiles), len(unique_chapters)))
+    difficulty_weights = np.empty((len(profiles), len(difficulty_codes)))
+    type_weights = np.empty((len(profiles), len(type_codes)))
+    for i, profile in enumerate(profiles):
+        chapter_weights[i] = (WEAK_CHAPTER_WEIGHT * np.isin(unique_chapters, profile['weak_chapters'])
+                              + CHAPTER_WEIGHT * lookup_weights(profile['chapter_preference'], unique_chapters))
+        difficulty_weights[i] = DIFFICULTY_WEIGHT * lookup_weights(profile['difficulty_preference'], difficulty_codes)
+        type_weights[i] = TYPE_WEIGHT * lookup_weights(profile['type_preference'], type_codes)
+    
+    return chapter_weights[:, chapter_index] + difficulty_weights[:, difficulties] + type_weights[:, question_types]
+
+
+def select_questions_batch(scores, num_questions, rng=None):
+    """
+    Row-wise weighted sampling without replacement, for a matrix of scores.
+
+    Uses exponential keys (u ** (1 / w), compared in log space) and takes
+    the top num_questions per row, which draws from the same distribution
+    as sequential np.random.choice(replace=False, p=...) calls.
+
+    Returns:
+        Array of shape (len(scores), min(num_questions, n_candidates)) of indices
+    """
+    rng = rng or np.random.default_rng()
+    num_students, num_candidates = scores.shape
+    if num_candidates <= num_questions:
+        return np.tile(np.arange(num_candidates), (num_students, 1))
+    
+    # Rows where nothing stands out fall back to uniform sampling
+    scores = np.where(scores.max(axis=1, keepdims=True) > 0, scores, 1.0)
+    with np.errstate(divide='ignore'):
+        keys = np.log(rng.random(scores.shape)) / scores
+    return np.argpartition(-keys, num_questions - 1, axis=1)[:, :num_questions]
+
+
+def balanced_mix(difficulties, num_questions, rng=None):
+    """
+    Cold-start selection: an even split across difficulties, topped up at
+    random when a difficulty runs short. Returns candidate indices.
+    """
+    rng = rng or np.random.default_rng()
+    per_difficulty = num_questions // 3
+    chosen = []
+    for code in DIFFICULTY_CODES.values():
+        pool = np.flatnonzero(difficulties == code)
+        chosen.append(rng.choice(pool, size=min(per_difficulty, len(pool)), replace=False))
+    chosen = np.concatenate(chosen)
+    
+    # If we don't have enough, add more random questions
+    if len(chosen) < num_questions:
+        remaining = np.setdiff1d(np.arange(len(difficulties)), chosen)
+        extra = rng.choice(remaining, size=min(num_questions - len(chosen), len(remaining)), replace=False)
+        chosen = np.concatenate([chosen, extra])
+    
+    rng.shuffle(chosen)
+    return chosen
+
+
+class TrainedModel:
+    """
+    Immutable snapshot of one training run. The engine swaps whole snapshots,
+    so a request always sees a consistent set of question data and transforms.
+
+    Per-question columns and the feature matrix are plain or memory-mapped
+    NumPy arrays; the NearestNeighbors index is built from them on first use.
+    """
+    
+    def __init__(self, version, columns, questions_features, scaler, pca, answer_watermark, trained_at=None):
+        self.version = version
+        self.columns = columns
+        self.questions_features = questions_features
+        self.scaler = scaler
+        self.pca = pca
+        self.answer_watermark = answer_watermark  # Highest QuestionAnswer id seen by this run
+        self.trained_at = trained_at or datetime.utcnow()
+        self._model = None
+        self._model_lock = threading.Lock()
+    
+    @property
+    def num_questions(self):
+        return len(self.columns['question_id'])
+    
+    @property
+    def questions_df(self):
+        """The question features as a DataFrame (a copy of the arrays)"""
+        return pd.DataFrame({name: np.asarray(values) for name, values in self.columns.items()})
+    
+    @property
+    def model(self):
+        """NearestNeighbors index over questions_features, fitted lazily"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    model = NearestNeighbors(n_neighbors=10, algorithm='ball_tree')
+                    model.fit(self.questions_features)
+                    self._model = model
+        return self._model
+
+
 class RecommendationEngine:
     """
     Machine learning recommendation engine for personalized question suggestions
@@ -19,137 +239,185 @@ class RecommendationEngine:
     """
     
     def __init__(self):
-        self.scaler = StandardScaler()
-        self.pca = PCA(n_components=5)  # Reduce to 5 dimensions for efficiency
-        self.model = NearestNeighbors(n_neighbors=10, algorithm='ball_tree')
-        self.questions_df = None
-        self.questions_features = None
-        self.student_profiles = {}
+        self.current_model = None
+        self.student_profiles = LRUCache(max_entries=PROFILE_CACHE_SIZE, ttl_seconds=PROFILE_CACHE_TTL)
+        self._train_lock = threading.Lock()
+        self._background = BackgroundTrainer(self, 'recommender-trainer')
+    
+    @property
+    def model_version(self):
+        """Version of the model currently serving requests (0 if untrained)"""
+        model = self.current_model
+        return model.version if model is not None else 0
+    
+    @property
+    def questions_df(self):
+        model = self.current_model
+        return model.questions_df if model is not None else None
+    
+    @property
+    def questions_features(self):
+        model = self.current_model
+        return model.questions_features if model is not None else None
+    
+    def _artifact_dir(self):
+        """Directory shared by all workers for model artifacts, or None to keep models in memory only"""
+        if not has_app_context():
+            return None
+        return current_app.config.get('RECOMMENDER_ARTIFACT_DIR')
+    
+    def get_answer_watermark(self):
+        """
+        Highest QuestionAnswer id in the database, used to tell how many
+        answers have arrived since the current model was trained
+        """
+        return db.session.query(func.max(QuestionAnswer.id)).scalar() or 0
+    
+    def new_answers_since_training(self):
+        """Approximate number of QuestionAnswer rows added after the last training run"""
+        model = self.current_model
+        watermark = model.answer_watermark if model is not None else 0
+        return self.get_answer_watermark() - watermark
     
     def get_questions_dataframe(self):
         """
-        Create a DataFrame of all questions with relevant features
+        Create a DataFrame of all questions with relevant features.
+
+        Popularity is the probability that a student of average ability
+        answers correctly. Once the IRT job (irt.py) has run it is read from
+        ItemCalibration; before that it is the raw correctness rate from a
+        single grouped query over the answers.
         """
-        # Query all questions
-        questions = Question.query.all()
-        
-        # Create DataFrame
-        data = []
-        for q in questions:
-            # Calculate question popularity (how often it's answered correctly)
-            answers = QuestionAnswer.query.filter_by(question_id=q.id).all()
-            correct_count = sum(1 for a in answers if a.is_correct)
-            total_count = len(answers)
-            correctness_rate = correct_count / total_count if total_count > 0 else 0.5
-            
-            # Encode difficulty
-            difficulty_map = {
-                QuestionDifficulty.EASY: 1,
-                QuestionDifficulty.MEDIUM: 2,
-                QuestionDifficulty.HARD: 3
-            }
-            
-            # Encode question type
-            type_map = {
-                QuestionType.MULTIPLE_CHOICE: 1,
-                QuestionType.TRUE_FALSE: 2,
-                QuestionType.NUMERICAL: 3,
-                QuestionType.DESCRIPTIVE: 4
-            }
-            
-            data.append({
-                'question_id': q.id,
-                'chapter_id': q.chapter_id,
-                'difficulty': difficulty_map.get(q.difficulty, 2),
-                'question_type': type_map.get(q.question_type, 1),
-                'marks': q.marks,
-                'popularity': correctness_rate,
-                'text_length': len(q.text) / 500  # Normalized by 500 chars
-            })
-            
-        return pd.DataFrame(data)
+        calibrated = db.session.query(ItemCalibration.question_id).first() is not None
+
+        if calibrated:
+            query = db.session.query(
+                Question.id,
+                Question.chapter_id,
+                Question.difficulty,
+                Question.question_type,
+                Question.marks,
+                func.length(Question.text),
+                ItemCalibration.difficulty,
+                ItemCalibration.discrimination
+            ).outerjoin(ItemCalibration, ItemCalibration.question_id == Question.id)
+        else:
+            # Per-question answer counts, aggregated in the database
+            answer_stats = db.session.query(
+                QuestionAnswer.question_id.label('question_id'),
+                func.count(QuestionAnswer.id).label('total_count'),
+                func.sum(case((QuestionAnswer.is_correct == True, 1), else_=0)).label('correct_count')
+            ).group_by(QuestionAnswer.question_id).subquery()
+            query = db.session.query(
+                Question.id,
+                Question.chapter_id,
+                Question.difficulty,
+                Question.question_type,
+                Question.marks,
+                func.length(Question.text),
+                answer_stats.c.total_count,
+                answer_stats.c.correct_count
+            ).outerjoin(answer_stats, answer_stats.c.question_id == Question.id)
+
+        rows = query.order_by(Question.id).yield_per(QUESTION_BATCH_SIZE)
+        
+        # Stream rows into per-column lists
+        columns = ([], [], [], [], [], [], [], [])
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+        
+        question_ids, chapter_ids, difficulties, question_types, marks, text_lengths, first_stat, second_stat = columns
+        
+        # Calculate question popularity (how often it's answered correctly)
+        popularity = np.full(len(question_ids), 0.5)
+        if calibrated:
+            irt_difficulty = np.array([np.nan if d is None else d for d in first_stat], dtype=np.float64)
+            discrimination = np.array([1.0 if a is None else a for a in second_stat], dtype=np.float64)
+            known = ~np.isnan(irt_difficulty)
+            popularity[known] = 1.0 / (1.0 + np.exp(discrimination[known] * irt_difficulty[known]))
+        else:
+            total_count = np.array([t or 0 for t in first_stat], dtype=np.float64)
+            correct_count = np.array([c or 0 for c in second_stat], dtype=np.float64)
+            np.divide(correct_count, total_count, out=popularity, where=total_count > 0)
+        
+        return pd.DataFrame({
+            'question_id': np.array(question_ids, dtype=np.int64),
+            'chapter_id': np.array(chapter_ids, dtype=np.int64),
+            'difficulty': np.array([DIFFICULTY_CODES.get(d, 2) for d in difficulties], dtype=np.int64),
+            'question_type': np.array([TYPE_CODES.get(t, 1) for t in question_types], dtype=np.int64),
+            'marks': np.array(marks, dtype=np.int64),
+            'popularity': popularity,
+            'text_length': np.array([length or 0 for length in text_lengths], dtype=np.float64) / 500  # Normalized by 500 chars
+        })
     
     def create_student_profile(self, student_id):
         """
         Create a profile vector for a student based on their performance
         """
-        # Get student's answered questions
-        answers = db.session.query(QuestionAnswer, Question)\
-            .join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
-            .join(Question, QuestionAnswer.question_id == Question.id)\
-            .filter(TestResult.student_id == student_id)\
-            .filter(TestResult.completed == True)\
-            .all()
-        
-        if not answers:
-            return None
-            
-        # Create student profile based on question characteristics they perform well on
-        chapter_scores = {}
-        difficulty_scores = {1: [], 2: [], 3: []}  # Easy, Medium, Hard
-        type_scores = {1: [], 2: [], 3: [], 4: []}  # MC, TF, Numerical, Descriptive
-        
-        for answer, question in answers:
-            # Skip if no score recorded
-            if answer.score is None:
-                continue
-                
-            # Calculate score percentage for this question
-            score_pct = answer.score / question.marks if question.marks > 0 else 0
-            
-            # Record chapter performance
-            if question.chapter_id not in chapter_scores:
-                chapter_scores[question.chapter_id] = []
-            chapter_scores[question.chapter_id].append(score_pct)
+        return self.create_student_profiles([student_id]).get(student_id)
+    
+    def create_student_profiles(self, student_ids):
+        """
+        Create profiles for many students from their ChapterPerformance
+        rollup rows, one query per PROFILE_QUERY_CHUNK students
+        
+        Args:
+            student_ids: IDs of the students to profile
             
-            # Record difficulty performance
-            difficulty_val = 1  # Default to medium
-            if question.difficulty == QuestionDifficulty.EASY:
-                difficulty_val = 1
-            elif question.difficulty == QuestionDifficulty.MEDIUM:
-                difficulty_val = 2
-            elif question.difficulty == QuestionDifficulty.HARD:
-                difficulty_val = 3
-            difficulty_scores[difficulty_val].append(score_pct)
+        Returns:
+            Dict of student ID -> profile, or None for students with no
+            scored answers
+        """
+        student_ids = list(student_ids)
+        
+        totals = {}
+        for start in range(0, len(student_ids), PROFILE_QUERY_CHUNK):
+            rows = db.session.query(
+                ChapterPerformance.student_id,
+                ChapterPerformance.chapter_id,
+                ChapterPerformance.difficulty,
+                ChapterPerformance.question_type,
+                ChapterPerformance.score_fraction_sum,
+                ChapterPerformance.scored
+            ).filter(ChapterPerformance.student_id.in_(student_ids[start:start + PROFILE_QUERY_CHUNK]))\
+                .filter(ChapterPerformance.scored > 0)\
+                .all()
             
-            # Record question type performance
-            type_val = 1  # Default to multiple choice
-            if question.question_type == QuestionType.MULTIPLE_CHOICE:
-                type_val = 1
-            elif question.question_type == QuestionType.TRUE_FALSE:
-                type_val = 2
-            elif question.question_type == QuestionType.NUMERICAL:
-                type_val = 3
-            elif question.question_type == QuestionType.DESCRIPTIVE:
-                type_val = 4
-            type_scores[type_val].append(score_pct)
+            for student_id, chapter_id, difficulty, question_type, score_sum, count in rows:
+                # [sum, count] accumulators by chapter, difficulty and type
+                chapter_totals, difficulty_totals, type_totals = totals.setdefault(student_id, ({}, {}, {}))
+                for group, key in ((chapter_totals, chapter_id),
+                                   (difficulty_totals, DIFFICULTY_CODES.get(difficulty, 1)),
+                                   (type_totals, TYPE_CODES.get(question_type, 1))):
+                    group_total = group.setdefault(key, [0.0, 0])
+                    group_total[0] += score_sum or 0.0
+                    group_total[1] += count
         
+        return {
+            student_id: self._profile_from_totals(*totals[student_id]) if student_id in totals else None
+            for student_id in student_ids
+        }
+    
+    @staticmethod
+    def _profile_from_totals(chapter_totals, difficulty_totals, type_totals):
+        """Turn per-group [score percentage sum, answer count] totals into a profile"""
         # Calculate average performance by chapter
-        chapter_avg = {}
-        for chapter_id, scores in chapter_scores.items():
-            if scores:
-                chapter_avg[chapter_id] = sum(scores) / len(scores)
-            else:
-                chapter_avg[chapter_id] = 0.5  # Default for no data
+        chapter_avg = {chapter_id: total / count for chapter_id, (total, count) in chapter_totals.items()}
         
         # Find weak chapters (below 65% average score)
         weak_chapters = [chapter_id for chapter_id, avg in chapter_avg.items() if avg < 0.65]
         
-        # Calculate performance by difficulty
+        # Calculate performance by difficulty and question type (0.5 default with no data)
         difficulty_avg = {}
-        for diff, scores in difficulty_scores.items():
-            if scores:
-                difficulty_avg[diff] = sum(scores) / len(scores)
-            else:
-                difficulty_avg[diff] = 0.5  # Default
+        for diff in DIFFICULTY_CODES.values():
+            total, count = difficulty_totals.get(diff, (0.0, 0))
+            difficulty_avg[diff] = total / count if count else 0.5
         
-        # Calculate performance by question type
         type_avg = {}
-        for qtype, scores in type_scores.items():
-            if scores:
-                type_avg[qtype] = sum(scores) / len(scores)
-            else:
-                type_avg[qtype] = 0.5  # Default
+        for qtype in TYPE_CODES.values():
+            total, count = type_totals.get(qtype, (0.0, 0))
+            type_avg[qtype] = total / count if count else 0.5
         
         # Create student preference vector
         # Lower scores mean student needs more practice (higher recommendation weight)
@@ -168,33 +436,295 @@ class RecommendationEngine:
         
         return profile
     
-    def train_model(self):
+    def get_student_profile(self, student_id):
+        """Cached create_student_profile()"""
+        return self.student_profiles.get_or_create(
+            student_id, lambda: self.create_student_profile(student_id)
+        )
+    
+    def invalidate_student_profile(self, student_id):
+        """Drop a cached profile, e.g. after the student completes a test"""
+        self.student_profiles.invalidate(student_id)
+    
+    def load_published_model(self):
         """
-        Train the recommendation model based on question features
+        Swap in the model published in the artifact directory if it is newer
+        than the one being served. Returns True if a new version was loaded.
         """
-        # Get questions data
-        self.questions_df = self.get_questions_dataframe()
+        artifact_dir = self._artifact_dir()
+        if artifact_dir is None:
+            return False
+        
+        published_version = read_current_version(artifact_dir)
+        if published_version <= self.model_version:
+            return False
         
-        if len(self.questions_df) == 0:
+        try:
+            artifact = read_artifact(artifact_dir, published_version)
+        except FileNotFoundError:
+            # Superseded and cleaned up while we were reading; pick it up next time
+            return False
+        if artifact is None:
             return False
+        
+        self.current_model = TrainedModel(
+            version=artifact['version'],
+            columns=artifact['columns'],
+            questions_features=artifact['features'],
+            scaler=artifact['transforms']['scaler'],
+            pca=artifact['transforms']['pca'],
+            answer_watermark=artifact['answer_watermark'],
+            trained_at=artifact['trained_at']
+        )
+        return True
+    
+    def _fit_model(self, version):
+        """Fit a new TrainedModel from the database, or return None if there are no questions"""
+        # Read the watermark first so answers arriving mid-training trigger another run
+        answer_watermark = self.get_answer_watermark()
+        
+        # Get questions data
+        questions_df = self.get_questions_dataframe()
+        
+        if len(questions_df) == 0:
+            return None
             
         # Extract features for model training
-        features = self.questions_df[['chapter_id', 'difficulty', 'question_type', 
-                                     'marks', 'popularity', 'text_length']]
+        features = questions_df[['chapter_id', 'difficulty', 'question_type', 
+                                 'marks', 'popularity', 'text_length']].to_numpy(dtype=np.float64)
         
-        # Normalize features
-        features_scaled = self.scaler.fit_transform(features)
+        # Normalize and reduce to 5 dimensions, off this process's GIL
+        questions_features, scaler, pca = run_fit(fit_question_features, features,
+                                                  in_process=train_in_process())
         
-        # Dimensionality reduction
-        if len(features_scaled) > 5:  # Only use PCA if we have enough samples
-            features_pca = self.pca.fit_transform(features_scaled)
-            self.model.fit(features_pca)
-            self.questions_features = features_pca
-        else:
-            self.model.fit(features_scaled)
-            self.questions_features = features_scaled
+        return TrainedModel(
+            version=version,
+            columns={name: questions_df[name].to_numpy() for name in questions_df.columns},
+            questions_features=questions_features,
+            scaler=scaler,
+            pca=pca,
+            answer_watermark=answer_watermark
+        )
+    
+    def train_model(self, if_missing=False):
+        """
+        Train the recommendation model based on question features.
+
+        The new model is built off to the side and published with a single
+        reference swap, so concurrent requests keep using the previous
+        version until this one is complete. When an artifact directory is
+        configured, only one worker trains at a time; it writes the model
+        to disk and every worker memory-maps the same files.
+        
+        Args:
+            if_missing: only train if no model is being served once the
+                training lock is held, for cold-start callers that may
+                have queued behind another run that produced one
+        
+        Returns:
+            True if a new model version is now being served
+        """
+        with self._train_lock:
+            if if_missing and (self.current_model is not None or self.load_published_model()):
+                return True
+            artifact_dir = self._artifact_dir()
+            if artifact_dir is None:
+                model = self._fit_model(self.model_version + 1)
+                if model is None:
+                    return False
+                self.current_model = model
+                return True
             
-        return True
+            with training_lock(artifact_dir) as acquired:
+                if not acquired:
+                    # Another worker is training and will publish the result
+                    return False
+                
+                version = max(read_current_version(artifact_dir), self.model_version) + 1
+                model = self._fit_model(version)
+                if model is None:
+                    return False
+                
+                write_artifact(
+                    artifact_dir,
+                    version,
+                    columns=model.columns,
+                    features=model.questions_features,
+                    transforms={'scaler': model.scaler, 'pca': model.pca},
+                    answer_watermark=model.answer_watermark,
+                    trained_at=model.trained_at
+                )
+            
+            # Serve the memory-mapped copy so this worker shares pages with the others
+            return self.load_published_model()
+    
+    def train_in_background(self):
+        """Start train_model() on a background thread unless one is already running"""
+        return self._background.start()
+    
+    def get_serving_model(self):
+        """
+        The model to answer a request with, or None while none is ready.
+        Never trains on the calling thread: if no model exists, training is
+        started in the background and callers fall back to a cold-start mix.
+        """
+        # Prefer a model another worker already published
+        if self.current_model is None and not self.load_published_model():
+            self.train_in_background()
+        return self.current_model
+    
+    def similar_questions(self, question_ids, k=5):
+        """
+        Find the k nearest questions to each given question using the fitted
+        NearestNeighbors index. All queries are answered in one batched call.
+        
+        Args:
+            question_ids: Iterable of question IDs to find neighbours for
+            k: Number of neighbours per question
+            
+        Returns:
+            Dict of question ID -> list of (similar question ID, distance),
+            nearest first. IDs unknown to the model are omitted.
+        """
+        model = self.get_serving_model()
+        query_ids = np.unique(np.fromiter(question_ids, dtype=np.int64))
+        if model is None or len(query_ids) == 0:
+            return {}
+        
+        # question_id is sorted, so rows can be located by binary search
+        model_ids = model.columns['question_id']
+        positions = np.minimum(np.searchsorted(model_ids, query_ids), model.num_questions - 1)
+        found = model_ids[positions] == query_ids
+        query_ids = query_ids[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return {}
+        
+        # One extra neighbour because each question is its own nearest match
+        n_neighbors = min(k + 1, model.num_questions)
+        distances, indices = model.model.kneighbors(model.questions_features[positions], n_neighbors=n_neighbors)
+        neighbour_ids = model_ids[indices]
+        
+        similar = {}
+        for question_id, row_ids, row_distances in zip(query_ids.tolist(), neighbour_ids, distances):
+            similar[question_id] = [
+                (int(similar_id), float(distance))
+                for similar_id, distance in zip(row_ids, row_distances)
+                if similar_id != question_id
+            ][:k]
+        return similar
+    
+    def similar_to_missed(self, student_id, k=10, max_missed=50):
+        """
+        Questions most similar to the ones a student recently got wrong
+        
+        Args:
+            student_id: The ID of the student
+            k: Number of questions to return
+            max_missed: How many of the most recently missed questions to use
+            
+        Returns:
+            List of (question ID, distance), nearest first, excluding the
+            missed questions themselves
+        """
+        missed_ids = [row[0] for row in db.session.query(QuestionAnswer.question_id)
+            .join(TestResult, QuestionAnswer.test_result_id == TestResult.id)
+            .filter(TestResult.student_id == student_id)
+            .filter(TestResult.completed == True)
+            .filter(QuestionAnswer.is_correct == False)
+            .group_by(QuestionAnswer.question_id)
+            .order_by(func.max(QuestionAnswer.id).desc())
+            .limit(max_missed)
+            .all()]
+        
+        # Keep the closest match for each candidate across all missed questions
+        best = {}
+        for neighbours in self.similar_questions(missed_ids, k=k).values():
+            for question_id, distance in neighbours:
+                if distance < best.get(question_id, np.inf):
+                    best[question_id] = distance
+        
+        for question_id in missed_ids:
+            best.pop(question_id, None)
+        
+        return sorted(best.items(), key=lambda item: item[1])[:k]
+    
+    def recommend_for_students(self, student_ids, chapter_ids=None, num_questions=10, rng=None):
+        """
+        Recommend questions for a whole class in one pass
+        
+        Profiles come from one grouped query, and students are scored
+        against the candidate matrix in blocks of STUDENT_BLOCK_SIZE rows.
+        Students with no history get a balanced mix of difficulties.
+        
+        Args:
+            student_ids: IDs of the students
+            chapter_ids: Optional list of chapter IDs to filter by
+            num_questions: Number of questions per student
+            rng: Optional numpy Generator, for reproducible selections
+            
+        Returns:
+            Dict of student ID -> list of recommended question IDs
+        """
+        student_ids = list(student_ids)
+        rng = rng or np.random.default_rng()
+        model = self.get_serving_model()
+        if model is None:
+            # Still training: everyone gets a balanced mix
+            return self._cold_start_for_students(student_ids, chapter_ids, num_questions, rng)
+        
+        question_ids = model.columns['question_id']
+        chapters = model.columns['chapter_id']
+        difficulties = model.columns['difficulty']
+        question_types = model.columns['question_type']
+        
+        # Filter by chapters if provided
+        if chapter_ids:
+            mask = np.isin(chapters, np.asarray(chapter_ids, dtype=chapters.dtype))
+            question_ids = question_ids[mask]
+            chapters = chapters[mask]
+            difficulties = difficulties[mask]
+            question_types = question_types[mask]
+        
+        if len(question_ids) == 0:
+            return {student_id: [] for student_id in student_ids}
+        
+        generation = self.student_profiles.generation
+        profiles = self.create_student_profiles(student_ids)
+        for student_id, profile in profiles.items():
+            self.student_profiles.set(student_id, profile, generation)
+        
+        recommendations = {}
+        profiled = [student_id for student_id in student_ids if profiles[student_id] is not None]
+        for start in range(0, len(profiled), STUDENT_BLOCK_SIZE):
+            block = profiled[start:start + STUDENT_BLOCK_SIZE]
+            scores = score_questions_batch([profiles[student_id] for student_id in block],
+                                           chapters, difficulties, question_types)
+            chosen = select_questions_batch(scores, num_questions, rng)
+            for student_id, indices in zip(block, chosen):
+                recommendations[student_id] = question_ids[indices].tolist()
+        
+        # If no profile (new student), recommend a mix of questions
+        for student_id in student_ids:
+            if student_id not in recommendations:
+                recommendations[student_id] = question_ids[balanced_mix(difficulties, num_questions, rng)].tolist()
+        
+        return recommendations
+    
+    def _cold_start_for_students(self, student_ids, chapter_ids, num_questions, rng):
+        """Balanced difficulty mix for each student, read straight from the database"""
+        query = db.session.query(Question.id, Question.difficulty).order_by(Question.id)
+        if chapter_ids:
+            query = query.filter(Question.chapter_id.in_(chapter_ids))
+        rows = query.all()
+        question_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        difficulties = np.array([DIFFICULTY_CODES.get(row[1], 2) for row in rows], dtype=np.int64)
+        if len(question_ids) == 0:
+            return {student_id: [] for student_id in student_ids}
+        return {
+            student_id: question_ids[balanced_mix(difficulties, num_questions, rng)].tolist()
+            for student_id in student_ids
+        }
     
     def recommend_questions(self, student_id, chapter_ids=None, num_questions=10):
         """
@@ -208,17 +738,12 @@ class RecommendationEngine:
         Returns:
             List of recommended Question objects
         """
-        # Ensure model is trained
-        if self.questions_df is None:
-            self.train_model()
+        # Pin one model version for the whole request
+        model = self.get_serving_model()
         
-        # Get or create student profile
-        if student_id not in self.student_profiles:
-            self.student_profiles[student_id] = self.create_student_profile(student_id)
-            
-        student_profile = self.student_profiles[student_id]
+        student_profile = self.get_student_profile(student_id) if model is not None else None
         
-        # If no profile (new student), recommend a mix of questions
+        # If no profile (new student) or no model yet, recommend a mix of questions
         if student_profile is None:
             # Get random questions, possibly filtered by chapter
             query = Question.query
@@ -241,60 +766,30 @@ class RecommendationEngine:
             np.random.shuffle(recommendations)
             return recommendations[:num_questions]
         
+        # Candidate columns as arrays
+        question_ids = model.columns['question_id']
+        chapters = model.columns['chapter_id']
+        difficulties = model.columns['difficulty']
+        question_types = model.columns['question_type']
+        
         # Filter by chapters if provided
-        filtered_df = self.questions_df
         if chapter_ids:
-            filtered_df = filtered_df[filtered_df['chapter_id'].isin(chapter_ids)]
+            mask = np.isin(chapters, np.asarray(chapter_ids, dtype=chapters.dtype))
+            question_ids = question_ids[mask]
+            chapters = chapters[mask]
+            difficulties = difficulties[mask]
+            question_types = question_types[mask]
             
         # If no questions match the filter, return empty list
-        if len(filtered_df) == 0:
+        if len(question_ids) == 0:
             return []
             
         # Apply student profile to weight questions
-        scores = []
-        for idx, row in filtered_df.iterrows():
-            score = 0
-            
-            # Increase score for weak chapters
-            if row['chapter_id'] in student_profile['weak_chapters']:
-                score += 5
-            
-            # Add chapter preference score (0-1)
-            chapter_pref = student_profile['chapter_preference'].get(row['chapter_id'], 0.5)
-            score += chapter_pref * 3
-            
-            # Add difficulty preference score (0-1)
-            difficulty_pref = student_profile['difficulty_preference'].get(int(row['difficulty']), 0.5)
-            score += difficulty_pref * 2
-            
-            # Add question type preference score (0-1)
-            type_pref = student_profile['type_preference'].get(int(row['question_type']), 0.5)
-            score += type_pref * 2
-            
-            scores.append(score)
-        
-        # Normalize scores
-        max_score = max(scores) if scores else 1
-        norm_scores = [s/max_score for s in scores]
-        
-        # Apply weighted random selection based on scores
-        probabilities = np.array(norm_scores) / sum(norm_scores)
-        
-        # Get indices of recommended questions
-        if len(filtered_df) <= num_questions:
-            # If we have fewer questions than requested, return all of them
-            chosen_indices = list(range(len(filtered_df)))
-        else:
-            # Otherwise use weighted random selection
-            chosen_indices = np.random.choice(
-                len(filtered_df), 
-                size=min(num_questions, len(filtered_df)), 
-                replace=False, 
-                p=probabilities
-            )
+        scores = score_questions(student_profile, chapters, difficulties, question_types)
+        chosen_indices = select_questions(scores, num_questions)
         
         # Get corresponding question IDs
-        recommended_ids = filtered_df.iloc[chosen_indices]['question_id'].tolist()
+        recommended_ids = question_ids[chosen_indices].tolist()
         
         # Fetch and return question objects
         recommended_questions = Question.query.filter(Question.id.in_(recommended_ids)).all()
@@ -0,0 +1,53 @@
+"""
+Lazily loaded recommendation engines.
+
+recommendation.py and collaborative.py import numpy, pandas, scikit-learn
+and scipy, which would otherwise dominate worker start-up. The proxies here
+import an engine on first use, so workers, scripts and init_db.py that never
+recommend anything never load the ML stack.
+"""
+
+import importlib
+import threading
+
+
+class LazyEngine:
+    """
+    Stand-in for a module-level engine singleton. Attribute access loads
+    the module and forwards to the real engine.
+    """
+
+    def __init__(self, module_name, attribute):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._engine is not None
+
+    def load(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    module = importlib.import_module(self._module_name)
+                    self._engine = getattr(module, self._attribute)
+        return self._engine
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the proxy itself
+        return getattr(self.load(), name)
+
+    def invalidate_student_profile(self, student_id):
+        # An engine that was never loaded has nothing cached
+        if self.loaded:
+            self._engine.invalidate_student_profile(student_id)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<LazyEngine {self._module_name}.{self._attribute} ({state})>"
+
+
+recommender = LazyEngine('recommendation', 'recommender')
+collaborative_recommender = LazyEngine('collaborative', 'collaborative_recommender')
@@ -0,0 +1,99 @@
+"""
+Process-wide cache of reference data: chapters and teachers.
+
+Almost every form page lists the chapters and both registration pages list
+the teachers, but these rows rarely change. They are read once per process
+and kept as immutable tuples until a committed change to a Chapter or a
+teacher invalidates them. Changes made by other processes, or by bulk SQL
+that bypasses the ORM, are picked up when the TTL expires
+(REFERENCE_CACHE_TTL).
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from cache import LRUCache
+from extensions import db
+from models import Chapter, User, UserRole
+
+ChapterRef = namedtuple('ChapterRef', ['id', 'name', 'description'])
+TeacherRef = namedtuple('TeacherRef', ['id', 'username'])
+
+CHAPTERS = 'chapters'
+TEACHERS = 'teachers'
+
+DEFAULT_TTL = 10 * 60  # seconds
+
+_cache = LRUCache(max_entries=8, ttl_seconds=DEFAULT_TTL)
+
+
+def get_chapters():
+    """All chapters as ChapterRef tuples, in id order"""
+    return _cache.get_or_create(CHAPTERS, lambda: tuple(
+        ChapterRef(*row) for row in db.session.query(Chapter.id, Chapter.name, Chapter.description)
+                                              .order_by(Chapter.id)
+    ))
+
+
+def get_chapter_names():
+    """{chapter id: chapter name}"""
+    return {chapter.id: chapter.name for chapter in get_chapters()}
+
+
+def get_teachers():
+    """All teachers as TeacherRef tuples, in id order"""
+    return _cache.get_or_create(TEACHERS, lambda: tuple(
+        TeacherRef(*row) for row in db.session.query(User.id, User.username)
+                                              .filter(User.role == UserRole.TEACHER)
+                                              .order_by(User.id)
+    ))
+
+
+def invalidate(*keys):
+    """Drop the given entries (CHAPTERS, TEACHERS), or everything if none are given"""
+    if not keys:
+        _cache.clear()
+    for key in keys:
+        _cache.invalidate(key)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def _changed_keys(instance):
+    if isinstance(instance, Chapter):
+        return {CHAPTERS}
+    if isinstance(instance, User):
+        # A user stops or starts being a teacher when the role changes
+        if instance.role == UserRole.TEACHER or inspect(instance).attrs.role.history.deleted:
+            return {TEACHERS}
+    return set()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('reference_data_changes', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending |= _changed_keys(instance)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    # Only invalidate once the change is visible to other sessions
+    changed = session.info.pop('reference_data_changes', None)
+    if changed:
+        invalidate(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('reference_data_changes', None)
+
+
+def init_reference_cache(app):
+    """Apply the app's REFERENCE_CACHE_TTL (seconds; 0 disables expiry)"""
+    ttl = app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL)
+    _cache.ttl_seconds = ttl or None
@@ -0,0 +1,196 @@
+"""
+Incrementally maintained performance rollups.
+
+StudentPerformance and ChapterPerformance hold running totals over each
+student's completed tests, so dashboards and the recommender read a few
+rows per student instead of their whole answer history.
+
+record_completed_result() adds one graded result inside the grading
+transaction. rebuild_rollups() recomputes the tables from the raw rows; run
+scripts/backfill_rollups.py after deploying or after editing results by hand.
+Editing a question's marks, chapter, difficulty or type, or deleting it,
+changes the chapter totals of everyone who answered it: the question routes
+call rebuild_question_rollups() for that.
+"""
+
+from sqlalchemy import func, case, cast, Float, select, true
+
+from models import Question, QuestionAnswer, Test, TestResult, StudentPerformance, ChapterPerformance
+from extensions import db
+
+STUDENT_KEY = ('student_id',)
+STUDENT_TOTALS = ('tests_taken', 'percentage_sum', 'total_score', 'total_marks')
+
+CHAPTER_KEY = ('student_id', 'chapter_id', 'difficulty', 'question_type')
+CHAPTER_TOTALS = ('attempts', 'correct', 'score', 'max_score', 'scored', 'score_fraction_sum')
+
+# Students per delete/insert statement when rebuilding part of the tables
+REBUILD_CHUNK = 500
+
+
+def upsert_increment(model, key_columns, total_columns, rows):
+    """
+    Add each row's totals onto the stored row with the same key, inserting
+    rows that do not exist yet. Uses the dialect's native upsert so
+    concurrent submissions for the same key cannot lose an update.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[key] for key in key_columns],
+            set_={column: table.c[column] + stmt.excluded[column] for column in total_columns}
+        )
+        db.session.execute(stmt)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {column: table.c[column] + stmt.inserted[column] for column in total_columns}
+        )
+        db.session.execute(stmt)
+    else:
+        # No native upsert: read-modify-write under the session
+        for row in rows:
+            existing = db.session.get(model, tuple(row[key] for key in key_columns))
+            if existing is None:
+                db.session.add(model(**row))
+            else:
+                for column in total_columns:
+                    setattr(existing, column, getattr(existing, column) + row[column])
+
+
+# Question columns the chapter rollup is keyed or totalled by
+ROLLUP_QUESTION_COLUMNS = ('chapter_id', 'difficulty', 'question_type', 'marks')
+
+
+def _score_fraction():
+    # NULL for unscored answers, so sum() and count() skip them
+    return case((Question.marks > 0, QuestionAnswer.score / cast(Question.marks, Float)), else_=0.0)
+
+
+def record_completed_result(test_result):
+    """
+    Add a freshly graded result to the rollups. Call once per result, in
+    the same transaction that marks it completed, after its answers are
+    added to the session.
+    """
+    test = db.session.get(Test, test_result.test_id)
+    total_score = test_result.total_score or 0.0
+    upsert_increment(StudentPerformance, STUDENT_KEY, STUDENT_TOTALS, [{
+        'student_id': test_result.student_id,
+        'tests_taken': 1,
+        'percentage_sum': total_score / test.total_marks if test.total_marks > 0 else 0.0,
+        'total_score': total_score,
+        'total_marks': test.total_marks
+    }])
+
+    rows = db.session.query(
+        Question.chapter_id,
+        Question.difficulty,
+        Question.question_type,
+        func.count(QuestionAnswer.id),
+        func.sum(case((QuestionAnswer.is_correct == True, 1), else_=0)),
+        func.sum(QuestionAnswer.score),
+        func.sum(Question.marks),
+        func.count(QuestionAnswer.score),
+        func.sum(_score_fraction())
+    ).join(Question, QuestionAnswer.question_id == Question.id)\
+        .filter(QuestionAnswer.test_result_id == test_result.id)\
+        .group_by(Question.chapter_id, Question.difficulty, Question.question_type)\
+        .all()
+
+    upsert_increment(ChapterPerformance, CHAPTER_KEY, CHAPTER_TOTALS, [{
+        'student_id': test_result.student_id,
+        'chapter_id': chapter_id,
+        'difficulty': difficulty,
+        'question_type': question_type,
+        'attempts': attempts,
+        'correct': correct or 0,
+        'score': score or 0.0,
+        'max_score': max_score or 0,
+        'scored': scored,
+        'score_fraction_sum': fraction_sum or 0.0
+    } for chapter_id, difficulty, question_type, attempts, correct, score, max_score, scored, fraction_sum in rows])
+
+
+def _rebuild(student_ids):
+    student_filter = TestResult.student_id.in_(student_ids) if student_ids is not None else true()
+
+    percentage = case((Test.total_marks > 0, func.coalesce(TestResult.total_score, 0.0) / cast(Test.total_marks, Float)),
+                      else_=0.0)
+    student_totals = select(
+        TestResult.student_id,
+        func.count(TestResult.id),
+        func.sum(percentage),
+        func.sum(func.coalesce(TestResult.total_score, 0.0)),
+        func.sum(Test.total_marks)
+    ).join(Test, Test.id == TestResult.test_id)\
+        .where(TestResult.completed == True)\
+        .where(student_filter)\
+        .group_by(TestResult.student_id)
+
+    chapter_totals = select(
+        TestResult.student_id,
+        Question.chapter_id,
+        Question.difficulty,
+        Question.question_type,
+        func.count(QuestionAnswer.id),
+        func.sum(case((QuestionAnswer.is_correct == True, 1), else_=0)),
+        func.coalesce(func.sum(QuestionAnswer.score), 0.0),
+        func.sum(Question.marks),
+        func.count(QuestionAnswer.score),
+        func.coalesce(func.sum(_score_fraction()), 0.0)
+    ).select_from(QuestionAnswer)\
+        .join(TestResult, QuestionAnswer.test_result_id == TestResult.id)\
+        .join(Question, QuestionAnswer.question_id == Question.id)\
+        .where(TestResult.completed == True)\
+        .where(student_filter)\
+        .group_by(TestResult.student_id, Question.chapter_id, Question.difficulty, Question.question_type)
+
+    for model, key, totals, source in ((StudentPerformance, STUDENT_KEY, STUDENT_TOTALS, student_totals),
+                                       (ChapterPerformance, CHAPTER_KEY, CHAPTER_TOTALS, chapter_totals)):
+        table = model.__table__
+        delete = table.delete()
+        if student_ids is not None:
+            delete = delete.where(table.c.student_id.in_(student_ids))
+        db.session.execute(delete)
+        db.session.execute(table.insert().from_select([table.c[c] for c in key + totals], source))
+
+
+def rebuild_rollups(student_ids=None):
+    """
+    Recompute the rollups from raw results, for the given students or for
+    everyone, in the current transaction. The caller commits.
+    """
+    if student_ids is None:
+        _rebuild(None)
+        return
+    student_ids = list(student_ids)
+    for start in range(0, len(student_ids), REBUILD_CHUNK):
+        _rebuild(student_ids[start:start + REBUILD_CHUNK])
+
+
+def rebuild_question_rollups(question_id):
+    """
+    Rebuild the rollups of the students with a completed answer to
+    question_id, after the question was edited or deleted, in the current
+    transaction. Flush the change first. Returns the student ids.
+    """
+    student_ids = db.session.scalars(
+        select(TestResult.student_id)
+        .join(QuestionAnswer, QuestionAnswer.test_result_id == TestResult.id)
+        .where(QuestionAnswer.question_id == question_id, TestResult.completed == True)
+        .distinct()
+    ).all()
+    if student_ids:
+        rebuild_rollups(student_ids)
+    return student_ids
@@ -1,20 +1,53 @@
 from datetime import datetime, timedelta
 import random
 from urllib.parse import urlsplit
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort,
+                   Response, stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from sqlalchemy import func, case, select
+from wtforms.validators import ValidationError
 from extensions import db
 from mailer import send_password_reset_email
 
+# Students per page of the teacher roster
+ROSTER_PAGE_SIZE = 50
+ROSTER_MAX_PAGE_SIZE = 200
+
+# Autosaves are accepted this long past a test's deadline, for the final
+# batch the page sends when its timer runs out
+AUTOSAVE_GRACE_SECONDS = 30
+AUTOSAVE_MAX_ANSWER_LENGTH = 10000
+
+def valid_form_token(token):
+    """Check a CSRF token posted outside a FlaskForm, unless CSRF protection is off"""
+    if not current_app.config.get('WTF_CSRF_ENABLED', True):
+        return True
+    try:
+        validate_csrf(token)
+        return True
+    except ValidationError:
+        return False
+
 def create_routes():
     routes_bp = Blueprint('routes', __name__)
     
     from models import (User, Question, Chapter, Test, TestQuestion, TestResult, 
-                       QuestionAnswer, UserRole, QuestionDifficulty, QuestionType)
+                       QuestionAnswer, UserRole, QuestionDifficulty, QuestionType, ItemCalibration,
+                       StudentPerformance, ChapterPerformance)
     from forms import (LoginForm, RegistrationForm, ResetPasswordForm,
-                      QuestionForm, CreateTestForm, StudentGenerateTestForm, AnswerForm, PersonalizedTestForm)
-    from utils import format_duration, calculate_grade, utc_to_local
-    from recommendation import recommender
+                      QuestionForm, CreateTestForm, StudentGenerateTestForm, PersonalizedTestForm,
+                      ClassPersonalizedTestForm)
+    from utils import format_duration, calculate_grade, utc_to_local, chapter_breakdown
+    from recommenders import recommender, collaborative_recommender
+    from grading import complete_results
+    from answers import load_answers, save_answers
+    from item_analysis import get_item_analysis, invalidate_test, LOW_DISCRIMINATION
+    import exports
+    from fragment_cache import render_cached, bump_data_version
+    from reference_data import get_chapters, get_chapter_names, get_teachers
+    from paper import get_paper, posted_answers, invalidate_paper
+    from rollups import rebuild_question_rollups, ROLLUP_QUESTION_COLUMNS
 
     @routes_bp.route('/')
     def index():
@@ -36,6 +69,27 @@ def create_routes():
         tables = db.inspect(db.engine).get_table_names()
         return jsonify({"tables": tables})
 
+    # Debug route for the recommendation model currently serving requests
+    @routes_bp.route('/debug/recommender')
+    @login_required
+    def debug_recommender():
+        if current_user.role != UserRole.TEACHER:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+        # Report without forcing the ML stack to load
+        if not recommender.loaded:
+            return jsonify({"loaded": False})
+        model = recommender.current_model
+        return jsonify({
+            "loaded": True,
+            "version": recommender.model_version,
+            "trained_at": model.trained_at.isoformat() if model else None,
+            "questions": model.num_questions if model else 0,
+            "new_answers_since_training": recommender.new_answers_since_training(),
+            "profile_cache": recommender.student_profiles.stats(),
+            "collaborative_version": collaborative_recommender.model_version if collaborative_recommender.loaded else None
+        })
+
     # Error handler for 404
     @routes_bp.errorhandler(404)
     def page_not_found(e):
@@ -52,7 +106,7 @@ def create_routes():
         form = RegistrationForm()
         
         # Populate teacher choices for student registration
-        teachers = User.query.filter_by(role=UserRole.TEACHER).all()
+        teachers = get_teachers()
         form.teacher.choices = [(str(t.id), t.username) for t in teachers]
         form.teacher.choices.insert(0, ('', 'Select a teacher'))
         
@@ -76,6 +130,7 @@ def create_routes():
             db.session.add(user)
             try:
                 db.session.commit()
+                bump_data_version(user.teacher_id)
                 flash('Your account has been created! You can now log in.', 'success')
                 return redirect(url_for('auth.login'))
             except Exception as e:
@@ -140,51 +195,83 @@ def create_routes():
             flash("Access denied. Teacher permissions required.", "danger")
             return redirect(url_for('routes.index'))
             
-        # Get student performance data
-        students = User.query.filter_by(teacher_id=current_user.id).all()
-        student_ids = [student.id for student in students]
-        
-        # Get test data
-        recent_tests = Test.query.filter_by(creator_id=current_user.id).order_by(Test.created_at.desc()).limit(5).all()
-        
-        # Get metrics for dashboard
-        total_students = len(students)
-        total_tests = Test.query.filter_by(creator_id=current_user.id).count()
-        total_questions = Question.query.filter_by(created_by=current_user.id).count()
-        
-        # Get aggregated student performance data
-        student_performance = []
-        if student_ids:
-            for student in students:
-                results = TestResult.query.filter_by(student_id=student.id, completed=True).all()
-                if results:
-                    # Calculate average of percentages
-                    percentages = [(result.total_score / Test.query.get(result.test_id).total_marks) for result in results]
-                    avg_percentage = sum(percentages) / len(percentages)
-                    tests_taken = len(results)
-                    student_performance.append({
-                        'id': student.id,
-                        'name': student.username,
-                        'tests_taken': tests_taken,
-                        'avg_score': avg_percentage  # This is now already a percentage (0-1)
-                    })
-                else:
-                    student_performance.append({
-                        'id': student.id,
-                        'name': student.username,
-                        'tests_taken': 0,
-                        'avg_score': 0
-                    })
-        
-        return render_template('teacher/dashboard.html', 
-                              title='Teacher Dashboard',
-                              students=students,
-                              recent_tests=recent_tests,
-                              total_students=total_students,
-                              total_tests=total_tests,
-                              total_questions=total_questions,
-                              student_performance=student_performance)
+        # Rendered once per data version; see fragment_cache.py
+        def page_context():
+            # Get test data
+            recent_tests = Test.query.filter_by(creator_id=current_user.id).order_by(Test.created_at.desc()).limit(5).all()
+        
+            # Get metrics for dashboard
+            total_tests = Test.query.filter_by(creator_id=current_user.id).count()
+            total_questions = Question.query.filter_by(created_by=current_user.id).count()
+        
+            # Tests taken and average percentage per student, from the performance rollup
+            rows = db.session.query(
+                User.id,
+                User.username,
+                StudentPerformance.tests_taken,
+                StudentPerformance.percentage_sum
+            ).outerjoin(StudentPerformance, StudentPerformance.student_id == User.id)\
+                .filter(User.teacher_id == current_user.id)\
+                .order_by(User.id)\
+                .all()
+        
+            total_students = len(rows)
+            student_performance = [{
+                'id': student_id,
+                'name': username,
+                'tests_taken': tests_taken or 0,
+                'avg_score': percentage_sum / tests_taken if tests_taken else 0  # Already a percentage (0-1)
+            } for student_id, username, tests_taken, percentage_sum in rows]
+            
+            return dict(
+                recent_tests=recent_tests,
+                total_students=total_students,
+                total_tests=total_tests,
+                total_questions=total_questions,
+                student_performance=student_performance
+            )
+        
+        return render_cached('teacher/dashboard.html', 'teacher_dashboard', [current_user.id], page_context,
+                             title='Teacher Dashboard')
+
 
+    def student_roster():
+        """
+        One page of the current teacher's students with their rollup totals,
+        sorted and paginated in SQL from the request's sort/order/page/per_page
+        """
+        sort = request.args.get('sort', 'username')
+        order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = max(1, min(request.args.get('per_page', ROSTER_PAGE_SIZE, type=int), ROSTER_MAX_PAGE_SIZE))
+
+        tests_taken = func.coalesce(StudentPerformance.tests_taken, 0)
+        avg_score = case((tests_taken > 0, StudentPerformance.percentage_sum / tests_taken), else_=0.0)
+        sort_columns = {'username': User.username, 'tests_taken': tests_taken, 'avg_score': avg_score}
+        if sort not in sort_columns:
+            sort = 'username'
+        sort_column = sort_columns[sort].desc() if order == 'desc' else sort_columns[sort].asc()
+
+        pagination = db.session.query(
+            User.id,
+            User.username,
+            User.email,
+            tests_taken,
+            avg_score
+        ).outerjoin(StudentPerformance, StudentPerformance.student_id == User.id)\
+            .filter(User.teacher_id == current_user.id)\
+            .filter(User.role == UserRole.STUDENT)\
+            .order_by(sort_column, User.id)\
+            .paginate(page=page, per_page=per_page, error_out=False)
+
+        student_data = [{
+            'id': student_id,
+            'username': username,
+            'email': email,
+            'tests_taken': taken,
+            'avg_score': round(average * 100, 1)  # Stored as a fraction (0-1)
+        } for student_id, username, email, taken, average in pagination.items]
+        return student_data, pagination, sort, order
 
     @routes_bp.route('/teacher/students')
     @login_required
@@ -192,57 +279,33 @@ def create_routes():
         if current_user.role != UserRole.TEACHER:
             abort(403)
 
-        # Get all users with this teacher_id
-        students = User.query.filter_by(teacher_id=current_user.id).all()
-        # Debug: print all users found with this teacher_id
-        print("DEBUG: Users with teacher_id", current_user.id)
-        for s in students:
-            print(f"User: {s.username}, role: {s.role}, type: {type(s.role)}")
-
-        # Filter for students robustly
-        students = [
-            s for s in students
-            if (
-                getattr(s, "role", None) == UserRole.STUDENT or
-                getattr(s, "role", None) == UserRole.STUDENT.value or
-                str(getattr(s, "role", None)).upper() == "STUDENT"
-            )
-        ]
+        student_data, pagination, sort, order = student_roster()
 
-        # Debug: print after filtering
-        print("DEBUG: Students after filtering")
-        for s in students:
-            print(f"Student: {s.username}, role: {s.role}")
+        return render_template('teacher/students.html',
+                              student_data=student_data,
+                              pagination=pagination,
+                              sort=sort,
+                              order=order)
 
-        # Format student data for JSON serialization
-        student_data = []
-        for student in students:
-            completed_tests = TestResult.query.filter_by(student_id=student.id, completed=True).count()
-            
-            # Calculate average score
-            results = TestResult.query.filter_by(student_id=student.id, completed=True).all()
-            if results:
-                total_percentage = sum(
-                    (r.total_score / r.test.total_marks * 100) 
-                    for r in results 
-                    if r.test.total_marks > 0
-                )
-                avg_score = total_percentage / len(results) if results else 0
-            else:
-                avg_score = 0
 
-            student_data.append({
-                'id': student.id,
-                'username': student.username,
-                'email': student.email,
-                'tests_taken': completed_tests,
-                'avg_score': round(avg_score, 1)
-            })
+    @routes_bp.route('/teacher/students/data')
+    @login_required
+    def teacher_students_data():
+        if current_user.role != UserRole.TEACHER:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
 
-        # Debug: print student_data before rendering
-        print("DEBUG: student_data to render:", student_data)
+        student_data, pagination, sort, order = student_roster()
 
-        return render_template('teacher/students.html', student_data=student_data)
+        return jsonify({
+            'success': True,
+            'students': student_data,
+            'page': pagination.page,
+            'pages': pagination.pages,
+            'per_page': pagination.per_page,
+            'total': pagination.total,
+            'sort': sort,
+            'order': order
+        })
 
 
     @routes_bp.route('/teacher/manage_questions', methods=['GET', 'POST'])
@@ -255,7 +318,7 @@ def create_routes():
         form = QuestionForm()
         
         # Populate chapter choices
-        chapters = Chapter.query.all()
+        chapters = get_chapters()
         form.chapter_id.choices = [(c.id, c.name) for c in chapters]
         
         if form.validate_on_submit():
@@ -275,6 +338,7 @@ def create_routes():
             )
             db.session.add(question)
             db.session.commit()
+            bump_data_version(current_user.id)
             flash('Question added successfully!', 'success')
             return redirect(url_for('routes.manage_questions'))
         
@@ -285,7 +349,19 @@ def create_routes():
                              title='Manage Questions',
                              form=form,
                              questions=questions,
-                             chapters={c.id: c.name for c in chapters})
+                             chapters=get_chapter_names())
+
+
+    def rollups_changed(student_ids):
+        """Drop the cached pages and profiles of students whose rollups were rebuilt"""
+        if not student_ids:
+            return
+        teacher_ids = db.session.scalars(
+            select(User.teacher_id).where(User.id.in_(student_ids)).distinct()
+        ).all()
+        bump_data_version(*student_ids, *teacher_ids)
+        for student_id in student_ids:
+            recommender.invalidate_student_profile(student_id)
 
 
     @routes_bp.route('/teacher/edit_question/<int:question_id>', methods=['GET', 'POST'])
@@ -305,10 +381,11 @@ def create_routes():
         form = QuestionForm(obj=question)
         
         # Populate chapter choices
-        chapters = Chapter.query.all()
+        chapters = get_chapters()
         form.chapter_id.choices = [(c.id, c.name) for c in chapters]
         
         if form.validate_on_submit():
+            rolled_up = [getattr(question, column) for column in ROLLUP_QUESTION_COLUMNS]
             question.text = form.text.data
             question.chapter_id = form.chapter_id.data
             question.difficulty = QuestionDifficulty(form.difficulty.data)
@@ -321,7 +398,14 @@ def create_routes():
             question.correct_answer = form.correct_answer.data
             question.solution = form.solution.data
             
+            # The chapter rollups of everyone who answered it are keyed and totalled by these
+            student_ids = []
+            if [getattr(question, column) for column in ROLLUP_QUESTION_COLUMNS] != rolled_up:
+                db.session.flush()
+                student_ids = rebuild_question_rollups(question.id)
             db.session.commit()
+            rollups_changed(student_ids)
+            bump_data_version(current_user.id)
             flash('Question updated successfully!', 'success')
             return redirect(url_for('routes.manage_questions'))
             
@@ -329,7 +413,7 @@ def create_routes():
                              title='Edit Question',
                              form=form,
                              questions=Question.query.all(),
-                             chapters={c.id: c.name for c in chapters},
+                             chapters=get_chapter_names(),
                              edit_mode=True,
                              question=question)
 
@@ -347,7 +431,11 @@ def create_routes():
             return jsonify({'success': False, 'message': 'You can only delete your own questions'}), 403
         
         db.session.delete(question)
+        db.session.flush()
+        student_ids = rebuild_question_rollups(question_id)
         db.session.commit()
+        rollups_changed(student_ids)
+        bump_data_version(current_user.id)
         
         return jsonify({'success': True})
 
@@ -376,6 +464,7 @@ def create_routes():
             
             # Now redirect to add questions to the test
             db.session.commit()
+            bump_data_version(current_user.id)
             return redirect(url_for('routes.add_questions_to_test', test_id=test.id))
         
         return render_template('teacher/create_test.html', title='Create Test', form=form)
@@ -396,7 +485,7 @@ def create_routes():
             return redirect(url_for('routes.teacher_dashboard'))
         
         # Get all available questions
-        chapters = Chapter.query.all()
+        chapters = get_chapters()
         questions = Question.query.all()
         
         # Get currently added questions
@@ -426,6 +515,9 @@ def create_routes():
             # Update test total marks
             test.total_marks = total_marks
             db.session.commit()
+            # The bulk delete above bypasses the session events that invalidate papers
+            invalidate_paper(test_id)
+            bump_data_version(current_user.id)
             
             flash("Test questions have been updated.", "success")
             return redirect(url_for('routes.teacher_dashboard'))
@@ -434,11 +526,149 @@ def create_routes():
                               title='Add Questions to Test',
                               test=test,
                               chapters=chapters,
+                              chapter_names=get_chapter_names(),
                               questions=questions,
                               added_question_ids=added_question_ids,
                               edit_mode=True)
 
 
+    @routes_bp.route('/teacher/personalized_tests', methods=['GET', 'POST'])
+    @login_required
+    def class_personalized_tests():
+        if current_user.role != UserRole.TEACHER:
+            flash("Access denied. Teacher permissions required.", "danger")
+            return redirect(url_for('routes.index'))
+
+        form = ClassPersonalizedTestForm()
+
+        # Populate chapter choices with checkboxes
+        chapters = get_chapters()
+        form.chapters.choices = [(c.id, c.name) for c in chapters]
+
+        students = db.session.query(User.id, User.username).filter_by(
+            teacher_id=current_user.id,
+            role=UserRole.STUDENT
+        ).all()
+
+        if form.validate_on_submit():
+            if not students:
+                flash("You have no students to generate tests for.", "warning")
+                return redirect(url_for('routes.class_personalized_tests'))
+
+            # Profile and score the whole class in one pass
+            chapter_ids = form.chapters.data if form.chapters.data else None
+            recommendations = recommender.recommend_for_students(
+                [student_id for student_id, _ in students],
+                chapter_ids=chapter_ids,
+                num_questions=form.num_questions.data
+            )
+
+            question_ids = {q_id for q_ids in recommendations.values() for q_id in q_ids}
+            marks = dict(db.session.query(Question.id, Question.marks).filter(Question.id.in_(question_ids)).all())
+
+            # Students whose tests would come up short are skipped
+            selections = [
+                (student_id, username, [q_id for q_id in recommendations[student_id] if q_id in marks])
+                for student_id, username in students
+            ]
+            selections = [s for s in selections if len(s[2]) >= form.num_questions.data]
+            skipped = len(students) - len(selections)
+
+            if not selections:
+                flash("Not enough questions available to generate personalized tests.", "danger")
+                return redirect(url_for('routes.class_personalized_tests'))
+
+            tests = [
+                Test(
+                    title=form.title.data,
+                    description=f"Personalized test generated for {username}",
+                    duration_minutes=form.duration_minutes.data,
+                    creator_id=current_user.id,
+                    is_public=False,  # Assigned through the student's own test result
+                    total_marks=sum(marks[q_id] for q_id in q_ids)
+                )
+                for _, username, q_ids in selections
+            ]
+            db.session.add_all(tests)
+            db.session.flush()  # Get the test IDs
+
+            db.session.bulk_insert_mappings(TestQuestion, [
+                {'test_id': test.id, 'question_id': q_id, 'order': i + 1}
+                for test, (_, _, q_ids) in zip(tests, selections)
+                for i, q_id in enumerate(q_ids)
+            ])
+
+            # No start time yet: the clock starts when the student opens the test
+            db.session.bulk_insert_mappings(TestResult, [
+                {'test_id': test.id, 'student_id': student_id, 'start_time': None, 'completed': False}
+                for test, (student_id, _, _) in zip(tests, selections)
+            ], render_nulls=True)
+            db.session.commit()
+            bump_data_version(current_user.id, *[student_id for student_id, _, _ in selections])
+
+            flash(f"Created {len(tests)} personalized tests.", "success")
+            if skipped:
+                flash(f"Skipped {skipped} students for lack of matching questions.", "warning")
+            return redirect(url_for('routes.teacher_dashboard'))
+
+        return render_template('teacher/personalized_tests.html',
+                              title='Personalized Tests for My Class',
+                              form=form,
+                              total_students=len(students))
+
+
+    @routes_bp.route('/teacher/questions/similar')
+    @login_required
+    def similar_questions():
+        if current_user.role != UserRole.TEACHER:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+        # Accepts several question_id parameters and answers them in one batch
+        question_ids = request.args.getlist('question_id', type=int)
+        k = max(1, min(request.args.get('k', 5, type=int), 50))
+
+        similar = recommender.similar_questions(question_ids, k=k)
+
+        return jsonify({
+            'success': True,
+            'similar': {
+                str(question_id): [{'id': similar_id, 'distance': round(distance, 4)}
+                                   for similar_id, distance in neighbours]
+                for question_id, neighbours in similar.items()
+            }
+        })
+
+
+    @routes_bp.route('/teacher/students/<int:student_id>/similar_questions')
+    @login_required
+    def student_similar_questions(student_id):
+        if current_user.role != UserRole.TEACHER:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+        student = User.query.get_or_404(student_id)
+        if student.teacher_id != current_user.id:
+            return jsonify({'success': False, 'message': 'You can only view your own students'}), 403
+
+        k = max(1, min(request.args.get('k', 10, type=int), 50))
+        neighbours = recommender.similar_to_missed(student_id, k=k)
+
+        questions = Question.query.filter(Question.id.in_([q_id for q_id, _ in neighbours])).all()
+        questions_dict = {q.id: q for q in questions}
+
+        return jsonify({
+            'success': True,
+            'questions': [{
+                'id': q_id,
+                'text': questions_dict[q_id].text,
+                'chapter_id': questions_dict[q_id].chapter_id,
+                'difficulty': questions_dict[q_id].difficulty.value,
+                'question_type': questions_dict[q_id].question_type.value,
+                'marks': questions_dict[q_id].marks,
+                'distance': round(distance, 4)
+            } for q_id, distance in neighbours if q_id in questions_dict]
+        })
+
+
     @routes_bp.route('/teacher/test/<int:test_id>')
     @login_required
     def view_test(test_id):
@@ -462,11 +692,62 @@ def create_routes():
         # Get test results if any
         results = TestResult.query.filter_by(test_id=test_id, completed=True).all()
         
+        # Per-question statistics over all attempts
+        attempts, item_stats = get_item_analysis(
+            test_id, [question for question, _ in test_questions], len(results))
+        
         return render_template('teacher/view_test.html',
                               title=f'Test: {test.title}',
                               test=test,
                               test_questions=test_questions,
-                              results=results)
+                              results=results,
+                              attempts=attempts,
+                              item_stats=item_stats,
+                              low_discrimination=LOW_DISCRIMINATION)
+
+
+    def export_response(stmt, columns, fmt, filename):
+        """Stream an export as a download; the generator keeps the request context for the session"""
+        return Response(
+            stream_with_context(exports.stream_export(stmt, columns, fmt)),
+            mimetype=exports.MIMETYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+        )
+
+
+    @routes_bp.route('/teacher/test/<int:test_id>/export.<any(csv, parquet):fmt>')
+    @login_required
+    def export_test_results(test_id, fmt):
+        if current_user.role != UserRole.TEACHER:
+            flash("Access denied. Teacher permissions required.", "danger")
+            return redirect(url_for('routes.index'))
+        
+        test = Test.query.get_or_404(test_id)
+        if test.creator_id != current_user.id:
+            flash("You can only export your own tests.", "danger")
+            return redirect(url_for('routes.teacher_dashboard'))
+        
+        if fmt == 'parquet' and not exports.parquet_available():
+            flash("Parquet export is not available on this server (pyarrow is not installed).", "warning")
+            return redirect(url_for('routes.view_test', test_id=test_id))
+        
+        return export_response(exports.test_results_query(test_id), exports.TEST_RESULT_COLUMNS,
+                               fmt, f'test_{test_id}_results')
+
+
+    @routes_bp.route('/teacher/students/answers.<any(csv, parquet):fmt>')
+    @login_required
+    def export_class_answers(fmt):
+        if current_user.role != UserRole.TEACHER:
+            flash("Access denied. Teacher permissions required.", "danger")
+            return redirect(url_for('routes.index'))
+        
+        if fmt == 'parquet' and not exports.parquet_available():
+            flash("Parquet export is not available on this server (pyarrow is not installed).", "warning")
+            return redirect(url_for('routes.teacher_students'))
+        
+        return export_response(exports.class_answers_query(current_user.id), exports.CLASS_ANSWER_COLUMNS,
+                               fmt, 'class_answers')
 
 
     # Student routes
@@ -477,49 +758,46 @@ def create_routes():
             flash("Access denied. Student permissions required.", "danger")
             return redirect(url_for('routes.index'))
         
-        # Get assigned tests from teacher
-        assigned_tests = Test.query.filter(
-            (Test.creator_id == current_user.teacher_id) & 
-            (Test.is_public == True)
-        ).all()
+        # Rendered once per data version; see fragment_cache.py
+        def page_context():
+            # Get assigned tests from teacher
+            assigned_tests = Test.query.filter(
+                (Test.creator_id == current_user.teacher_id) & 
+                (Test.is_public == True)
+            ).all()
         
-        # Get student's completed tests
-        completed_tests = TestResult.query.filter_by(
-            student_id=current_user.id,
-            completed=True
-        ).order_by(TestResult.end_time.desc()).all()
+            # Get student's completed tests
+            completed_tests = TestResult.query.filter_by(
+                student_id=current_user.id,
+                completed=True
+            ).order_by(TestResult.end_time.desc()).all()
         
-        # Get in-progress tests
-        in_progress_tests = TestResult.query.filter_by(
-            student_id=current_user.id,
-            completed=False
-        ).all()
+            # Get in-progress tests
+            in_progress_tests = TestResult.query.filter_by(
+                student_id=current_user.id,
+                completed=False
+            ).all()
+        
+            # Calculate performance metrics from the rollup
+            stats = db.session.get(StudentPerformance, current_user.id)
+            total_tests_taken = len(completed_tests)
+            avg_score = stats.avg_percentage * 100 if stats else 0
+        
+            # Get assigned tests that haven't been started
+            taken_test_ids = [result.test_id for result in completed_tests + in_progress_tests]
+            new_assigned_tests = [test for test in assigned_tests if test.id not in taken_test_ids]
+            
+            return dict(
+                assigned_tests=new_assigned_tests,
+                completed_tests=completed_tests,
+                in_progress_tests=in_progress_tests,
+                total_tests_taken=total_tests_taken,
+                avg_score=round(avg_score, 2)
+            )
         
-        # Calculate performance metrics
-        total_tests_taken = len(completed_tests)
-        avg_score = 0
-
-        if total_tests_taken > 0:
-            percentages = []
-            for result in completed_tests:
-                test = Test.query.get(result.test_id)
-                if test.total_marks > 0:
-                    percentage = (result.total_score / test.total_marks) * 100
-                    percentages.append(percentage)
-            if percentages:
-                avg_score = sum(percentages) / len(percentages)
-        
-        # Get assigned tests that haven't been started
-        taken_test_ids = [result.test_id for result in completed_tests + in_progress_tests]
-        new_assigned_tests = [test for test in assigned_tests if test.id not in taken_test_ids]
-        
-        return render_template('student/dashboard.html',
-                              title='Student Dashboard',
-                              assigned_tests=new_assigned_tests,
-                              completed_tests=completed_tests,
-                              in_progress_tests=in_progress_tests,
-                              total_tests_taken=total_tests_taken,
-                              avg_score=round(avg_score, 2))
+        # The assigned tests come from the teacher, so their version is part of the key
+        return render_cached('student/dashboard.html', 'student_dashboard', [current_user.id, current_user.teacher_id],
+                             page_context, title='Student Dashboard')
 
 
     @routes_bp.route('/student/create_test', methods=['GET', 'POST'])
@@ -528,7 +806,7 @@ def create_routes():
         form = StudentGenerateTestForm()
         
         # Populate chapter choices with checkboxes
-        chapters = Chapter.query.all()
+        chapters = get_chapters()
         form.chapters.choices = [(c.id, c.name) for c in chapters]
         
         if form.validate_on_submit():
@@ -543,9 +821,10 @@ def create_routes():
             if form.chapters.data:
                 query = query.filter(Question.chapter_id.in_(form.chapters.data))
             
-            # Filter by difficulty if not 'all'
+            # Filter by difficulty if not 'all', using calibrated difficulty where available
             if form.difficulty.data != 'all':
-                query = query.filter_by(difficulty=QuestionDifficulty(form.difficulty.data))
+                query = query.outerjoin(ItemCalibration, ItemCalibration.question_id == Question.id)\
+                    .filter(ItemCalibration.matches_difficulty(QuestionDifficulty(form.difficulty.data)))
             
             # Filter by question type if not 'all'
             if form.question_type.data != 'all':
@@ -587,11 +866,12 @@ def create_routes():
             test_result = TestResult(
                 test_id=test.id,
                 student_id=current_user.id,
-                start_time=datetime.utcnow(),
                 completed=False
             )
+            test_result.start(test.duration_minutes)
             db.session.add(test_result)
             db.session.commit()
+            bump_data_version(current_user.id)
             
             flash(f"Test '{form.title.data}' created and started!", "success")
             return redirect(url_for('routes.take_test', result_id=test_result.id))
@@ -611,14 +891,15 @@ def create_routes():
         form = PersonalizedTestForm()
         
         # Populate chapter choices with checkboxes
-        chapters = Chapter.query.all()
+        chapters = get_chapters()
         form.chapters.choices = [(c.id, c.name) for c in chapters]
         
         if form.validate_on_submit():
             try:
-                # Use the recommender to get personalized questions
+                # Use the selected recommender to get personalized questions
                 chapter_ids = form.chapters.data if form.chapters.data else None
-                recommended_questions = recommender.recommend_questions(
+                engine = collaborative_recommender if form.engine.data == 'collaborative' else recommender
+                recommended_questions = engine.recommend_questions(
                     student_id=current_user.id, 
                     chapter_ids=chapter_ids,
                     num_questions=form.num_questions.data
@@ -662,11 +943,12 @@ def create_routes():
                 test_result = TestResult(
                     test_id=test.id,
                     student_id=current_user.id,
-                    start_time=datetime.utcnow(),
                     completed=False
                 )
+                test_result.start(test.duration_minutes)
                 db.session.add(test_result)
                 db.session.commit()
+                bump_data_version(current_user.id)
                 
                 flash(f"Personalized test '{form.title.data}' created based on your performance history!", "success")
                 return redirect(url_for('routes.take_test', result_id=test_result.id))
@@ -715,11 +997,12 @@ def create_routes():
         test_result = TestResult(
             test_id=test_id,
             student_id=current_user.id,
-            start_time=datetime.utcnow(),
             completed=False
         )
+        test_result.start(test.duration_minutes)
         db.session.add(test_result)
         db.session.commit()
+        bump_data_version(current_user.id)
         
         return redirect(url_for('routes.take_test', result_id=test_result.id))
 
@@ -729,13 +1012,11 @@ def create_routes():
     def take_test(result_id):
         test_result = TestResult.query.get_or_404(result_id)
         
-        # Convert start time to local timezone
-        local_start_time = utc_to_local(test_result.start_time)
-        
-        # Calculate remaining time in seconds
-        elapsed_time = datetime.utcnow() - test_result.start_time
-        total_duration = timedelta(minutes=test_result.test.duration_minutes)
-        remaining_seconds = max(0, int((total_duration - elapsed_time).total_seconds()))
+        # Tests assigned in bulk start their clock when the student first opens them
+        if test_result.start_time is None and test_result.student_id == current_user.id:
+            test_result.start(get_paper(test_result.test_id).duration_minutes)
+            db.session.commit()
+            bump_data_version(current_user.id)
         
         # Ensure the student owns this test result
         if test_result.student_id != current_user.id:
@@ -746,140 +1027,120 @@ def create_routes():
         if test_result.completed:
             return redirect(url_for('routes.test_results', result_id=result_id))
         
-        test = Test.query.get(test_result.test_id)
+        # The compiled paper: test settings and ordered questions with their options
+        paper = get_paper(test_result.test_id)
+        
+        # Convert start time to local timezone
+        local_start_time = utc_to_local(test_result.start_time)
         
         # Check if time is up
-        now = datetime.utcnow()
-        end_time = test_result.start_time + timedelta(minutes=test.duration_minutes)
-        time_remaining = max(0, int((end_time - now).total_seconds()))
+        end_time = test_result.start_time + timedelta(minutes=paper.duration_minutes)
+        time_remaining = max(0, int((end_time - datetime.utcnow()).total_seconds()))
         
-        if time_remaining <= 0 and not test_result.completed:
+        if time_remaining <= 0:
             # Time's up, auto-submit
             return auto_submit_test(result_id)
         
-        # Get questions in order
-        test_questions = db.session.query(Question, TestQuestion).\
-            join(TestQuestion, Question.id == TestQuestion.question_id).\
-            filter(TestQuestion.test_id == test.id).\
-            order_by(TestQuestion.order).all()
-        
-        # Create a form for each question
-        forms = []
-        for question, test_question in test_questions:
-            form = AnswerForm(prefix=f"q{question.id}")
-            form.question_id.data = question.id
-            form.test_result_id.data = test_result.id
-            form.question_type.data = question.question_type.value
-            
-            # Set up multiple choice options if applicable
-            if question.question_type == QuestionType.MULTIPLE_CHOICE:
-                form.multiple_choice.choices = [
-                    ('A', question.option_a),
-                    ('B', question.option_b),
-                    ('C', question.option_c),
-                    ('D', question.option_d)
-                ]
-            
-            # Get existing answer if any
-            existing_answer = QuestionAnswer.query.filter_by(
-                test_result_id=test_result.id,
-                question_id=question.id
-            ).first()
-            
-            if existing_answer:
-                if question.question_type == QuestionType.MULTIPLE_CHOICE:
-                    form.multiple_choice.data = existing_answer.student_answer
-                elif question.question_type == QuestionType.TRUE_FALSE:
-                    form.true_false.data = existing_answer.student_answer
-                else:
-                    form.text_answer.data = existing_answer.student_answer
-            
-            forms.append((question, form))
-        
         if request.method == 'POST':
             # Handle form submission
             if 'save_progress' in request.form:
-                # Save current progress
-                for question, form in forms:
-                    if form.validate():
-                        # Get the appropriate answer field based on question type
-                        if question.question_type == QuestionType.MULTIPLE_CHOICE:
-                            answer = form.multiple_choice.data
-                        elif question.question_type == QuestionType.TRUE_FALSE:
-                            answer = form.true_false.data
-                        else:
-                            answer = form.text_answer.data
-                        
-                        # Update or create answer
-                        existing_answer = QuestionAnswer.query.filter_by(
-                            test_result_id=test_result.id,
-                            question_id=question.id
-                        ).first()
-                        
-                        if existing_answer:
-                            existing_answer.student_answer = answer
-                        else:
-                            new_answer = QuestionAnswer(
-                                test_result_id=test_result.id,
-                                question_id=question.id,
-                                student_answer=answer
-                            )
-                            db.session.add(new_answer)
+                if not valid_form_token(request.form.get('csrf_token')):
+                    flash("Your session has expired. Please save again.", "danger")
+                    return redirect(url_for('routes.take_test', result_id=result_id))
                 
+                # Update or create all answers in one statement
+                save_answers(test_result.id, posted_answers(paper, request.form))
                 db.session.commit()
                 flash("Progress saved!", "success")
                 return redirect(url_for('routes.take_test', result_id=result_id))
                 
             elif 'submit_test' in request.form:
                 # First save all answers from the form
-                for question, form in forms:
-                    # Get the appropriate answer field based on question type
-                    if question.question_type == QuestionType.MULTIPLE_CHOICE:
-                        answer = form.multiple_choice.data
-                    elif question.question_type == QuestionType.TRUE_FALSE:
-                        answer = form.true_false.data
-                    else:
-                        answer = form.text_answer.data
-                    
-                    # Update or create answer if answer has a value
-                    if answer:
-                        existing_answer = QuestionAnswer.query.filter_by(
-                            test_result_id=test_result.id,
-                            question_id=question.id
-                        ).first()
-                        
-                        if existing_answer:
-                            existing_answer.student_answer = answer
-                        else:
-                            new_answer = QuestionAnswer(
-                                test_result_id=test_result.id,
-                                question_id=question.id,
-                                student_answer=answer
-                            )
-                            db.session.add(new_answer)
-                
+                save_answers(test_result.id, posted_answers(paper, request.form))
                 db.session.commit()
                 
                 # Then submit the test
                 return submit_test(result_id)
         
+        # All saved answers of this attempt, in one query
+        saved_answers = {question_id: answer.student_answer
+                         for question_id, answer in load_answers(test_result.id).items()}
+        
         # Get answered/unanswered counts
-        answered = QuestionAnswer.query.filter_by(
-            test_result_id=test_result.id
-        ).filter(QuestionAnswer.student_answer != None).count()
+        answered = sum(1 for answer in saved_answers.values() if answer is not None)
 
-        total_questions = len(test_questions)
+        total_questions = len(paper.questions)
         unanswered = total_questions - answered
 
         return render_template('student/take_test.html',
-                              title=f'Taking: {test.title}',
-                              test=test,
+                              title=f'Taking: {paper.title}',
+                              paper=paper,
                               test_result=test_result,
-                              forms=forms,
-                              time_remaining=remaining_seconds,
+                              saved_answers=saved_answers,
+                              time_remaining=time_remaining,
                               answered=answered,
                               unanswered=unanswered,
-                              local_start_time=local_start_time)
+                              local_start_time=local_start_time,
+                              form_token=generate_csrf())
+
+
+    @routes_bp.route('/student/take_test/<int:result_id>/answers', methods=['POST'])
+    @login_required
+    def autosave_answers(result_id):
+        """
+        Save a batch of changed answers, sent by the test page as JSON:
+        {"answers": {"<question_id>": "<answer>", ...}}. The CSRF token comes in
+        the X-CSRFToken header, or in the body as csrf_token for beacons.
+        """
+        payload = request.get_json(silent=True) or {}
+        if not valid_form_token(request.headers.get('X-CSRFToken') or payload.get('csrf_token')):
+            return jsonify({'success': False, 'message': 'Invalid or expired CSRF token'}), 400
+
+        test_result = db.session.get(TestResult, result_id)
+        if test_result is None or test_result.student_id != current_user.id:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+        if test_result.completed:
+            return jsonify({'success': False, 'message': 'Test already submitted'}), 409
+        if test_result.start_time is None:
+            return jsonify({'success': False, 'message': 'Test not started'}), 409
+
+        paper = get_paper(test_result.test_id)
+
+        # Accept the batch the page flushes when its timer runs out
+        deadline = test_result.start_time + timedelta(minutes=paper.duration_minutes)
+        if datetime.utcnow() > deadline + timedelta(seconds=AUTOSAVE_GRACE_SECONDS):
+            return jsonify({'success': False, 'message': 'Time is up'}), 409
+
+        submitted = payload.get('answers')
+        if not isinstance(submitted, dict):
+            return jsonify({'success': False, 'message': 'No answers given'}), 400
+
+        # Options of each question on the paper; empty for free-text answers
+        question_options = {question.id: {value for value, _ in question.options}
+                            for question in paper.questions}
+
+        answers = {}
+        for key, answer in submitted.items():
+            try:
+                question_id = int(key)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': f'Invalid question id: {key}'}), 400
+            if question_id not in question_options:
+                return jsonify({'success': False, 'message': f'Question {question_id} is not part of this test'}), 400
+            if answer is None:
+                answer = ''
+            if not isinstance(answer, str) or len(answer) > AUTOSAVE_MAX_ANSWER_LENGTH:
+                return jsonify({'success': False, 'message': f'Invalid answer for question {question_id}'}), 400
+            choices = question_options[question_id]
+            if choices and answer and answer not in choices:
+                return jsonify({'success': False, 'message': f'Invalid answer for question {question_id}'}), 400
+            answers[question_id] = answer
+
+        save_answers(test_result.id, answers)
+        db.session.commit()
+
+        # A fresh token keeps long tests within the CSRF time limit
+        return jsonify({'success': True, 'saved': len(answers), 'csrf_token': generate_csrf()})
 
 
     def submit_test(result_id):
@@ -890,68 +1151,7 @@ def create_routes():
             flash("Access denied. This is not your test.", "danger")
             return redirect(url_for('routes.student_dashboard'))
         
-        # Get the test
-        test = Test.query.get(test_result.test_id)
-        
-        # Get all questions for this test
-        test_questions = TestQuestion.query.filter_by(test_id=test.id).all()
-        question_ids = [tq.question_id for tq in test_questions]
-        questions = Question.query.filter(Question.id.in_(question_ids)).all()
-        questions_dict = {q.id: q for q in questions}
-        
-        # Get all answers
-        answers = QuestionAnswer.query.filter_by(test_result_id=test_result.id).all()
-        answers_dict = {a.question_id: a for a in answers}
-        
-        # Grade each question
-        total_score = 0
-        for question_id in question_ids:
-            question = questions_dict.get(question_id)
-            answer = answers_dict.get(question_id)
-            
-            if question and answer:
-                # Grade based on question type
-                if question.question_type in [QuestionType.MULTIPLE_CHOICE, QuestionType.TRUE_FALSE]:
-                    # For multiple choice and true/false, exact match required
-                    is_correct = answer.student_answer == question.correct_answer
-                    score = question.marks if is_correct else 0
-                elif question.question_type == QuestionType.NUMERICAL:
-                    # For numerical, allow a small margin of error
-                    try:
-                        student_value = float(answer.student_answer.strip())
-                        correct_value = float(question.correct_answer.strip())
-                        is_correct = abs(student_value - correct_value) < 0.001
-                        score = question.marks if is_correct else 0
-                    except (ValueError, TypeError):
-                        is_correct = False
-                        score = 0
-                else:
-                    # For descriptive questions, can't auto-grade
-                    # In a real system, this would be graded by the teacher
-                    # For now, give partial credit if answer is provided
-                    is_correct = None
-                    score = question.marks * 0.5 if answer.student_answer else 0
-                
-                answer.is_correct = is_correct
-                answer.score = score
-                total_score += score
-            elif question:
-                # Question not answered
-                new_answer = QuestionAnswer(
-                    test_result_id=test_result.id,
-                    question_id=question.id,
-                    student_answer="",
-                    is_correct=False,
-                    score=0
-                )
-                db.session.add(new_answer)
-        
-        # Update test result
-        test_result.end_time = datetime.utcnow()
-        test_result.total_score = total_score
-        test_result.completed = True
-        
-        db.session.commit()
+        finish_test(test_result)
         
         flash("Test submitted successfully!", "success")
         return redirect(url_for('routes.test_results', result_id=result_id))
@@ -960,62 +1160,21 @@ def create_routes():
     def auto_submit_test(result_id):
         test_result = TestResult.query.get_or_404(result_id)
         
-        # Mark test as completed
-        test_result.end_time = datetime.utcnow()
-        test_result.completed = True
-        
-        # Grade all answered questions
-        total_score = 0
-        for answer in test_result.answers:
-            question = Question.query.get(answer.question_id)
-            
-            # Grade based on question type
-            if question.question_type in [QuestionType.MULTIPLE_CHOICE, QuestionType.TRUE_FALSE]:
-                # For multiple choice and true/false, exact match required
-                is_correct = answer.student_answer == question.correct_answer
-                score = question.marks if is_correct else 0
-            elif question.question_type == QuestionType.NUMERICAL:
-                # For numerical, allow a small margin of error
-                try:
-                    student_value = float(answer.student_answer.strip())
-                    correct_value = float(question.correct_answer.strip())
-                    is_correct = abs(student_value - correct_value) < 0.001
-                    score = question.marks if is_correct else 0
-                except (ValueError, TypeError):
-                    is_correct = False
-                    score = 0
-            else:
-                # For descriptive questions, can't auto-grade
-                is_correct = None
-                score = question.marks * 0.5 if answer.student_answer else 0
-            
-            answer.is_correct = is_correct
-            answer.score = score
-            total_score += score
-        
-        # Add empty answers for unanswered questions
-        test = Test.query.get(test_result.test_id)
-        test_questions = TestQuestion.query.filter_by(test_id=test.id).all()
-        answered_question_ids = [a.question_id for a in test_result.answers]
-        
-        for tq in test_questions:
-            if tq.question_id not in answered_question_ids:
-                new_answer = QuestionAnswer(
-                    test_result_id=test_result.id,
-                    question_id=tq.question_id,
-                    student_answer="",
-                    is_correct=False,
-                    score=0
-                )
-                db.session.add(new_answer)
-        
-        test_result.total_score = total_score
-        db.session.commit()
+        finish_test(test_result)
         
         flash("Time's up! Your test has been automatically submitted.", "info")
         return redirect(url_for('routes.test_results', result_id=result_id))
 
 
+    def finish_test(test_result):
+        # Grade all answers in one pass, mark the result completed and add it to the rollups
+        complete_results([test_result])
+        db.session.commit()
+        invalidate_test(test_result.test_id)
+        bump_data_version(test_result.student_id, db.session.get(User, test_result.student_id).teacher_id)
+        recommender.invalidate_student_profile(test_result.student_id)
+
+
     @routes_bp.route('/student/test_results/<int:result_id>')
     @login_required
     def test_results(result_id):
@@ -1037,33 +1196,20 @@ def create_routes():
             join(Question, QuestionAnswer.question_id == Question.id).\
             filter(QuestionAnswer.test_result_id == result_id).all()
         
-        # Get chapter performance
-        chapter_performance = {}
-        for answer, question in answers:
-            chapter = Chapter.query.get(question.chapter_id)
-            if chapter.name not in chapter_performance:
-                chapter_performance[chapter.name] = {
-                    'questions': 0,
-                    'correct': 0,
-                    'score': 0,
-                    'max_score': 0
-                }
-            
-            chapter_performance[chapter.name]['questions'] += 1
-            chapter_performance[chapter.name]['max_score'] += question.marks
-            
-            if answer.score:
-                chapter_performance[chapter.name]['score'] += answer.score
-                
-            if answer.is_correct:
-                chapter_performance[chapter.name]['correct'] += 1
-        
-        # Calculate percentages
-        for chapter, data in chapter_performance.items():
-            if data['max_score'] > 0:
-                data['percentage'] = round((data['score'] / data['max_score']) * 100, 1)
-            else:
-                data['percentage'] = 0
+        # Get chapter performance in one grouped query, in the order the answers were given
+        chapter_rows = db.session.query(
+            Chapter.name,
+            func.count(QuestionAnswer.id),
+            func.sum(case((QuestionAnswer.is_correct == True, 1), else_=0)),
+            func.coalesce(func.sum(QuestionAnswer.score), 0),
+            func.sum(Question.marks)
+        ).join(Question, QuestionAnswer.question_id == Question.id)\
+            .join(Chapter, Question.chapter_id == Chapter.id)\
+            .filter(QuestionAnswer.test_result_id == result_id)\
+            .group_by(Chapter.id, Chapter.name)\
+            .order_by(func.min(QuestionAnswer.id))\
+            .all()
+        chapter_performance = chapter_breakdown(chapter_rows)
         
         # Calculate overall score percentage
         score_percentage = round((test_result.total_score / test.total_marks) * 100, 1) if test.total_marks > 0 else 0
@@ -1084,86 +1230,64 @@ def create_routes():
             flash("Access denied. Student permissions required.", "danger")
             return redirect(url_for('routes.index'))
         
-        # Get all completed tests
-        completed_tests = TestResult.query.filter_by(
-            student_id=current_user.id,
-            completed=True
-        ).order_by(TestResult.end_time.asc()).all()
-        
-        # Get tests info with IST conversion
-        test_data = []
-        for result in completed_tests:
-            test = Test.query.get(result.test_id)
-            score_percentage = round((result.total_score / test.total_marks) * 100, 1) if test.total_marks > 0 else 0
-            local_time = utc_to_local(result.end_time)
+        # Rendered once per data version; see fragment_cache.py
+        def page_context():
+            # Get all completed tests with their test rows in one query
+            completed_tests = db.session.query(TestResult, Test)\
+                .join(Test, Test.id == TestResult.test_id)\
+                .filter(TestResult.student_id == current_user.id)\
+                .filter(TestResult.completed == True)\
+                .order_by(TestResult.end_time.asc())\
+                .all()
+        
+            # Get tests info with IST conversion
+            test_data = []
+            for result, test in completed_tests:
+                score_percentage = round((result.total_score / test.total_marks) * 100, 1) if test.total_marks > 0 else 0
+                local_time = utc_to_local(result.end_time)
             
-            test_data.append({
-                'id': result.id,
-                'test_id': test.id,
-                'title': test.title,
-                'date': local_time.strftime('%d %b, %I:%M %p IST'),
-                'score': result.total_score,
-                'total': test.total_marks,
-                'percentage': score_percentage
-            })
-        
-        # Get chapter performance data
-        chapter_performance = {}
-        
-        for result in completed_tests:
-            answers = db.session.query(QuestionAnswer, Question).\
-                join(Question, QuestionAnswer.question_id == Question.id).\
-                filter(QuestionAnswer.test_result_id == result.id).all()
-                
-            for answer, question in answers:
-                chapter = Chapter.query.get(question.chapter_id)
-                
-                if chapter.name not in chapter_performance:
-                    chapter_performance[chapter.name] = {
-                        'questions': 0,
-                        'correct': 0,
-                        'score': 0,
-                        'max_score': 0
-                    }
-                
-                chapter_performance[chapter.name]['questions'] += 1
-                chapter_performance[chapter.name]['max_score'] += question.marks
-                
-                if answer.score:
-                    chapter_performance[chapter.name]['score'] += answer.score
-                    
-                if answer.is_correct:
-                    chapter_performance[chapter.name]['correct'] += 1
-        
-        # Calculate percentages and identify strengths/weaknesses
-        strengths = []
-        weaknesses = []
-        
-        for chapter, data in chapter_performance.items():
-            if data['max_score'] > 0:
-                data['percentage'] = round((data['score'] / data['max_score']) * 100, 1)
-                
-                # Consider strong if > 75%, weak if < 50%
-                if data['percentage'] >= 75:
-                    strengths.append(chapter)
-                elif data['percentage'] < 50:
-                    weaknesses.append(chapter)
-            else:
-                data['percentage'] = 0
-        
-        # Calculate overall performance as average of percentages
-        if completed_tests:
-            percentages = [(result.total_score / Test.query.get(result.test_id).total_marks) for result in completed_tests]
-            overall_percentage = round((sum(percentages) / len(percentages)) * 100, 1)
-        else:
-            overall_percentage = 0
-        
-        return render_template('student/performance.html',
-                              title='My Performance',
-                              test_data=test_data,
-                              chapter_performance=chapter_performance,
-                              strengths=strengths,
-                              weaknesses=weaknesses,
-                              overall_percentage=overall_percentage)
+                test_data.append({
+                    'id': result.id,
+                    'test_id': test.id,
+                    'title': test.title,
+                    'date': local_time.strftime('%d %b, %I:%M %p IST'),
+                    'score': result.total_score,
+                    'total': test.total_marks,
+                    'percentage': score_percentage
+                })
+        
+            # Get chapter performance data from the rollup
+            chapter_rows = db.session.query(
+                Chapter.name,
+                func.sum(ChapterPerformance.attempts),
+                func.sum(ChapterPerformance.correct),
+                func.sum(ChapterPerformance.score),
+                func.sum(ChapterPerformance.max_score)
+            ).join(Chapter, Chapter.id == ChapterPerformance.chapter_id)\
+                .filter(ChapterPerformance.student_id == current_user.id)\
+                .group_by(Chapter.id, Chapter.name)\
+                .all()
+            chapter_performance = chapter_breakdown(chapter_rows)
+        
+            # Consider strong if >= 75%, weak if < 50%
+            strengths = [chapter for chapter, data in chapter_performance.items()
+                         if data['max_score'] > 0 and data['percentage'] >= 75]
+            weaknesses = [chapter for chapter, data in chapter_performance.items()
+                          if data['max_score'] > 0 and data['percentage'] < 50]
+        
+            # Calculate overall performance as average of percentages
+            stats = db.session.get(StudentPerformance, current_user.id)
+            overall_percentage = round(stats.avg_percentage * 100, 1) if stats else 0
+            
+            return dict(
+                test_data=test_data,
+                chapter_performance=chapter_performance,
+                strengths=strengths,
+                weaknesses=weaknesses,
+                overall_percentage=overall_percentage
+            )
+        
+        return render_cached('student/performance.html', 'student_performance', [current_user.id], page_context,
+                             title='My Performance')
 
     return routes_bp
@@ -0,0 +1,35 @@
+import os
+import sys
+import argparse
+import time
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+from models import StudentPerformance, ChapterPerformance
+from rollups import rebuild_rollups
+
+
+def backfill(student_ids=None):
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        try:
+            rebuild_rollups(student_ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Rebuilt rollups: {StudentPerformance.query.count()} students, "
+              f"{ChapterPerformance.query.count()} chapter rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the student and chapter performance rollups from raw results")
+    parser.add_argument('--student', type=int, action='append', dest='student_ids',
+                        help="Only rebuild this student (repeatable); default is everyone")
+    args = parser.parse_args()
+    backfill(args.student_ids)
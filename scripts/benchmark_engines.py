@@ -0,0 +1,147 @@
+import os
+import sys
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import func
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import create_benchmark_app, generate
+from models import TestResult, QuestionAnswer
+from extensions import db
+from rollups import rebuild_rollups
+
+
+def hold_out_latest_results():
+    """
+    Hide each student's most recent completed result from training by marking
+    it incomplete. Returns {student_id: result_id}.
+    """
+    latest = db.session.query(
+        TestResult.student_id, func.max(TestResult.id)
+    ).filter(TestResult.completed == True).group_by(TestResult.student_id).all()
+    held_out = {student_id: result_id for student_id, result_id in latest}
+    # Keep at least one training result per student
+    counts = dict(db.session.query(TestResult.student_id, func.count(TestResult.id))
+                  .filter(TestResult.completed == True).group_by(TestResult.student_id).all())
+    held_out = {sid: rid for sid, rid in held_out.items() if counts[sid] > 1}
+
+    TestResult.query.filter(TestResult.id.in_(list(held_out.values())))\
+        .update({TestResult.completed: False}, synchronize_session=False)
+    rebuild_rollups(list(held_out))
+    db.session.commit()
+    return held_out
+
+
+def restore_results(held_out):
+    TestResult.query.filter(TestResult.id.in_(list(held_out.values())))\
+        .update({TestResult.completed: True}, synchronize_session=False)
+    rebuild_rollups(list(held_out))
+    db.session.commit()
+
+
+def content_need(engine, student_id, question_ids):
+    """Content-based score for each question (higher means recommended first)"""
+    from recommendation import score_questions
+    profile = engine.get_student_profile(student_id)
+    if profile is None:
+        return None
+    columns = engine.current_model.columns
+    positions = np.searchsorted(columns['question_id'], question_ids)
+    return score_questions(profile, columns['chapter_id'][positions],
+                           columns['difficulty'][positions], columns['question_type'][positions])
+
+
+def collaborative_need(engine, student_id, question_ids):
+    mastery = engine.predict_mastery(student_id, question_ids)
+    return None if mastery is None else 1.0 - mastery
+
+
+def hit_rates(held_out, scorers, rng):
+    """
+    For each held-out result, rank its questions with every engine and take
+    the top half. The hit rate is the share of those the student actually
+    got wrong; the baseline is the share wrong among all held-out questions.
+    """
+    hits = {name: [] for name in scorers}
+    baseline = []
+    for student_id, result_id in held_out.items():
+        answers = db.session.query(QuestionAnswer.question_id, QuestionAnswer.is_correct)\
+            .filter(QuestionAnswer.test_result_id == result_id).all()
+        question_ids = np.array([a[0] for a in answers], dtype=np.int64)
+        wrong = np.array([not a[1] for a in answers])
+        top = max(1, len(answers) // 2)
+        baseline.append(wrong.mean())
+
+        for name, scorer in scorers.items():
+            need = scorer(student_id, question_ids)
+            if need is None:
+                continue
+            # Random tie-breaking so equal scores do not favour bank order
+            order = np.lexsort((rng.random(len(need)), -need))
+            hits[name].append(wrong[order[:top]].mean())
+
+    return {name: float(np.mean(values)) if values else float('nan') for name, values in hits.items()}, \
+        float(np.mean(baseline))
+
+
+def latencies(engine, student_ids, num_questions):
+    timings = []
+    for student_id in student_ids:
+        start = time.perf_counter()
+        engine.recommend_questions(student_id, None, num_questions)
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def run_benchmark(args):
+    app = create_benchmark_app(args.database)
+    with app.app_context():
+        if not TestResult.query.first():
+            print("Generating synthetic data...")
+            generate(args.questions, args.students, args.answers, seed=args.seed)
+
+        from recommendation import recommender
+        from collaborative import collaborative_recommender
+
+        held_out = hold_out_latest_results()
+        try:
+            timings = {}
+            start = time.perf_counter()
+            recommender.train_model()
+            recommender.get_serving_model()
+            timings['content'] = time.perf_counter() - start
+            start = time.perf_counter()
+            collaborative_recommender.train_model()
+            timings['collaborative'] = time.perf_counter() - start
+
+            rng = np.random.default_rng(args.seed)
+            rates, baseline = hit_rates(held_out, {
+                'content': lambda sid, qids: content_need(recommender, sid, qids),
+                'collaborative': lambda sid, qids: collaborative_need(collaborative_recommender, sid, qids)
+            }, rng)
+
+            sample = rng.choice(list(held_out), size=min(args.latency_students, len(held_out)), replace=False)
+            print(f"{len(held_out)} held-out results, baseline wrong rate {baseline:.3f}")
+            print(f"{'engine':>14} {'train s':>8} {'median ms':>10} {'p95 ms':>8} {'hit rate':>9}")
+            for name, engine in (('content', recommender), ('collaborative', collaborative_recommender)):
+                sample_timings = latencies(engine, sample, args.num_questions)
+                print(f"{name:>14} {timings[name]:>8.2f} {np.median(sample_timings):>10.2f} "
+                      f"{np.percentile(sample_timings, 95):>8.2f} {rates[name]:>9.3f}")
+        finally:
+            restore_results(held_out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare content-based and collaborative recommenders")
+    parser.add_argument('database', help="SQLite benchmark database, generated if empty")
+    parser.add_argument('--questions', type=int, default=2_000)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--answers', type=int, default=100_000)
+    parser.add_argument('--num-questions', type=int, default=20)
+    parser.add_argument('--latency-students', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    run_benchmark(parser.parse_args())
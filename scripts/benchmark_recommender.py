@@ -0,0 +1,151 @@
+import os
+import sys
+import argparse
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import create_benchmark_app, generate
+from models import User, UserRole, Question, QuestionAnswer
+from extensions import db
+
+# A benchmark is reported as a regression when its median grows by more than this factor
+DEFAULT_THRESHOLD = 1.25
+
+
+def timed(fn, repeats):
+    """Run fn repeats times and return the wall-clock timings in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    timings = np.array(timings)
+    return {
+        'runs': len(timings),
+        'median_ms': round(float(np.median(timings)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'min_ms': round(float(timings.min()), 3),
+        'max_ms': round(float(timings.max()), 3)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    app = create_benchmark_app(args.database)
+    with app.app_context():
+        if not QuestionAnswer.query.first():
+            print(f"Generating {args.questions} questions, {args.students} students, {args.answers} answers...")
+            start = time.perf_counter()
+            generate(args.questions, args.students, args.answers, seed=args.seed)
+            print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+        from recommendation import recommender
+
+        rng = np.random.default_rng(args.seed)
+        student_ids = [sid for (sid,) in db.session.query(User.id).filter(User.role == UserRole.STUDENT)]
+        sample = [int(s) for s in rng.choice(student_ids, size=min(args.sample, len(student_ids)), replace=False)]
+        sample_iter = iter(sample)
+
+        results = {}
+
+        results['get_questions_dataframe'] = summarize(timed(recommender.get_questions_dataframe, args.repeats))
+        results['train_model'] = summarize(timed(recommender.train_model, args.repeats))
+        recommender.get_serving_model()
+
+        # One student per run, bypassing the profile cache
+        results['create_student_profile'] = summarize(timed(
+            lambda: recommender.create_student_profile(next(sample_iter)), len(sample)))
+
+        recommender.student_profiles.clear()
+        sample_iter = iter(sample)
+        results['recommend_questions_cold'] = summarize(timed(
+            lambda: recommender.recommend_questions(next(sample_iter), None, args.num_questions), len(sample)))
+        sample_iter = iter(sample)
+        results['recommend_questions_warm'] = summarize(timed(
+            lambda: recommender.recommend_questions(next(sample_iter), None, args.num_questions), len(sample)))
+
+        report = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': np.__version__,
+                'database': db.engine.url.get_backend_name()
+            },
+            'dataset': {
+                'questions': Question.query.count(),
+                'students': len(student_ids),
+                'answers': QuestionAnswer.query.count()
+            },
+            'results': results
+        }
+    return report
+
+
+def compare(report, baseline, threshold):
+    """Print median changes against a baseline report and return the names that regressed"""
+    regressions = []
+    print(f"{'benchmark':>28} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, current in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['median_ms']:
+            continue
+        ratio = current['median_ms'] / previous['median_ms']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        print(f"{name:>28} {previous['median_ms']:>12.2f} {current['median_ms']:>12.2f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the recommendation engine on a synthetic dataset")
+    parser.add_argument('database', help="SQLite benchmark database, generated if empty")
+    parser.add_argument('--questions', type=int, default=50_000)
+    parser.add_argument('--students', type=int, default=5_000)
+    parser.add_argument('--answers', type=int, default=5_000_000)
+    parser.add_argument('--repeats', type=int, default=3, help="Runs of the whole-bank benchmarks")
+    parser.add_argument('--sample', type=int, default=50, help="Students timed for per-student benchmarks")
+    parser.add_argument('--num-questions', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--baseline', help="Earlier JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Median ratio above which a benchmark counts as regressed")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
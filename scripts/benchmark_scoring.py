@@ -0,0 +1,87 @@
+import os
+import sys
+import argparse
+import time
+
+import numpy as np
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommendation import score_questions, select_questions
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+NUM_CHAPTERS = 40
+
+
+def make_candidates(size, rng):
+    """Synthetic encoded question features, shaped like RecommendationEngine.questions_df"""
+    return {
+        'question_id': np.arange(1, size + 1, dtype=np.int64),
+        'chapter_id': rng.integers(1, NUM_CHAPTERS + 1, size=size),
+        'difficulty': rng.integers(1, 4, size=size),
+        'question_type': rng.integers(1, 5, size=size)
+    }
+
+
+def make_profile(rng):
+    """Synthetic student profile with the same shape as create_student_profile()"""
+    chapter_avg = {int(c): float(rng.random()) for c in range(1, NUM_CHAPTERS + 1) if rng.random() < 0.7}
+    return {
+        'weak_chapters': [c for c, avg in chapter_avg.items() if avg < 0.65],
+        'difficulty_preference': {d: float(rng.random()) for d in (1, 2, 3)},
+        'type_preference': {t: float(rng.random()) for t in (1, 2, 3, 4)},
+        'chapter_preference': {c: 1 - avg for c, avg in chapter_avg.items()}
+    }
+
+
+def legacy_scores(profile, candidates):
+    """Row-at-a-time scoring as done before vectorization, for comparison"""
+    import pandas as pd
+    scores = []
+    for idx, row in pd.DataFrame(candidates).iterrows():
+        score = 0
+        if row['chapter_id'] in profile['weak_chapters']:
+            score += 5
+        score += profile['chapter_preference'].get(row['chapter_id'], 0.5) * 3
+        score += profile['difficulty_preference'].get(int(row['difficulty']), 0.5) * 2
+        score += profile['type_preference'].get(int(row['question_type']), 0.5) * 2
+        scores.append(score)
+    return np.array(scores)
+
+
+def time_request(profile, candidates, num_questions):
+    start = time.perf_counter()
+    scores = score_questions(profile, candidates['chapter_id'], candidates['difficulty'], candidates['question_type'])
+    chosen = select_questions(scores, num_questions)
+    candidates['question_id'][chosen].tolist()
+    return time.perf_counter() - start
+
+
+def run_benchmark(sizes, repeats, num_questions, legacy_limit):
+    rng = np.random.default_rng(42)
+    profile = make_profile(rng)
+
+    print(f"{'candidates':>12} {'median ms':>10} {'p95 ms':>10} {'legacy ms':>10}")
+    for size in sizes:
+        candidates = make_candidates(size, rng)
+        timings = np.array([time_request(profile, candidates, num_questions) for _ in range(repeats)]) * 1000
+
+        legacy = '-'
+        if size <= legacy_limit:
+            start = time.perf_counter()
+            legacy_scores(profile, candidates)
+            legacy = f"{(time.perf_counter() - start) * 1000:.1f}"
+
+        print(f"{size:>12,} {np.median(timings):>10.2f} {np.percentile(timings, 95):>10.2f} {legacy:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request latency of recommendation scoring")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--num-questions', type=int, default=20)
+    parser.add_argument('--legacy-limit', type=int, default=10_000,
+                        help="Also time the old iterrows loop up to this many candidates")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.repeats, args.num_questions, args.legacy_limit)
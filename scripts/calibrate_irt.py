@@ -0,0 +1,34 @@
+import os
+import sys
+import argparse
+import time
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from irt import calibrate, MODELS
+
+
+def run_calibration(model, incremental):
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        run = calibrate(model=model, incremental=incremental)
+        if run is None:
+            print("No graded answers to calibrate")
+            return
+        kind = "Incremental" if run.incremental else "Full"
+        print(f"{kind} {run.model} calibration: {run.num_responses} responses, "
+              f"{run.num_questions} questions and {run.num_students} students updated "
+              f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fit IRT difficulty/discrimination per question. Run from cron; "
+                    "incremental runs only refit what changed since the last run.")
+    parser.add_argument('--model', choices=MODELS, default='2PL')
+    parser.add_argument('--full', action='store_true', help="Refit everything instead of running incrementally")
+    args = parser.parse_args()
+    run_calibration(args.model, incremental=not args.full)
@@ -0,0 +1,97 @@
+import os
+import sys
+import argparse
+import json
+import subprocess
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_time_budget.json')
+
+# Booting the app must not pull these in; they load on first recommendation
+DEFAULT_FORBIDDEN = ['numpy', 'pandas', 'sklearn', 'scipy']
+
+# Headroom given to the measured total when the budget is rewritten
+BUDGET_HEADROOM = 1.5
+PROFILE_ENTRIES = 15
+
+BOOT_SNIPPET = "from app import create_app; create_app()"
+
+
+def profile_boot():
+    """
+    Run create_app() in a fresh interpreter under -X importtime.
+
+    Returns {top-level module: cumulative microseconds} and the set of all
+    imported module names.
+    """
+    env = dict(os.environ, DATABASE_URL='sqlite://', PYTHONPATH=PROJECT_ROOT)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"App boot failed:\n{completed.stderr[-2000:]}")
+
+    top_level = {}
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        # Nested imports are indented under the module that triggered them
+        if not name.startswith('  '):
+            top_level[name.strip()] = top_level.get(name.strip(), 0) + int(cumulative)
+    return top_level, imported
+
+
+def check(budget, top_level, imported):
+    """Return a list of budget violations"""
+    problems = []
+    total_ms = sum(top_level.values()) / 1000
+    if total_ms > budget['max_total_ms']:
+        problems.append(f"Total import time {total_ms:.0f} ms exceeds budget of {budget['max_total_ms']} ms")
+    for module in budget.get('forbidden', []):
+        if module in imported:
+            problems.append(f"{module} is imported during app boot")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check app boot import time against the checked-in budget")
+    parser.add_argument('--update', action='store_true',
+                        help=f"Rewrite the budget from this run (total x {BUDGET_HEADROOM})")
+    args = parser.parse_args()
+
+    top_level, imported = profile_boot()
+    total_ms = sum(top_level.values()) / 1000
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:PROFILE_ENTRIES]
+
+    print(f"Total import time: {total_ms:.0f} ms")
+    for name, micros in slowest:
+        print(f"{micros / 1000:>10.1f} ms  {name}")
+
+    if args.update:
+        previous = {}
+        if os.path.exists(BUDGET_FILE):
+            with open(BUDGET_FILE) as f:
+                previous = json.load(f)
+        budget = {
+            'max_total_ms': int(total_ms * BUDGET_HEADROOM),
+            'forbidden': previous.get('forbidden', DEFAULT_FORBIDDEN),
+            'profile_ms': {name: round(micros / 1000, 1) for name, micros in slowest}
+        }
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
+        print(f"Budget written to {BUDGET_FILE}")
+        sys.exit(0)
+
+    with open(BUDGET_FILE) as f:
+        problems = check(json.load(f), top_level, imported)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
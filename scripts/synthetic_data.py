@@ -0,0 +1,216 @@
+import os
+import sys
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import (User, UserRole, Chapter, Question, QuestionDifficulty, QuestionType,
+                    Test, TestQuestion, TestResult, QuestionAnswer)
+from extensions import db
+from rollups import rebuild_rollups
+
+INSERT_CHUNK = 10_000
+DIFFICULTIES = [QuestionDifficulty.EASY, QuestionDifficulty.MEDIUM, QuestionDifficulty.HARD]
+QUESTION_TYPES = list(QuestionType)
+OPTION_LETTERS = 'ABCD'
+
+
+def _max_id(model):
+    return db.session.query(db.func.max(model.id)).scalar() or 0
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(model.__table__.insert(), rows[start:start + INSERT_CHUNK])
+
+
+def _answer_keys(rng, question_ids, question_types):
+    """
+    Per question, an answer the grader marks correct and one it marks
+    wrong, in the form its type expects: an option letter, True/False, a
+    number or free text. Descriptive questions are left blank when wrong.
+    """
+    correct_answers, wrong_answers = [], []
+    for question_id, question_type in zip(question_ids, question_types):
+        if question_type == QuestionType.MULTIPLE_CHOICE:
+            correct, wrong = rng.choice(list(OPTION_LETTERS), size=2, replace=False)
+        elif question_type == QuestionType.TRUE_FALSE:
+            correct, wrong = ('True', 'False') if rng.random() < 0.5 else ('False', 'True')
+        elif question_type == QuestionType.NUMERICAL:
+            value = int(rng.integers(1, 1000))
+            correct, wrong = str(value), str(value + 1)
+        else:
+            correct, wrong = f"Synthetic answer {question_id}", ''
+        correct_answers.append(str(correct))
+        wrong_answers.append(str(wrong))
+    return correct_answers, wrong_answers
+
+
+def generate(num_questions, num_students, num_answers, num_chapters=20, questions_per_test=20, seed=0):
+    """
+    Append a synthetic school to the current database.
+
+    Students answer correctly with probability sigmoid(ability - difficulty),
+    where ability is a per-student level plus a per-chapter offset, so the
+    data has the chapter structure the recommenders look for.
+
+    Returns a dict with the generated id ranges and row counts.
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash('password')
+
+    user_base = _max_id(User)
+    chapter_base = _max_id(Chapter)
+    question_base = _max_id(Question)
+    test_base = _max_id(Test)
+    result_base = _max_id(TestResult)
+
+    teacher_id = user_base + 1
+    _insert(User, [{
+        'id': teacher_id,
+        'username': f"synthetic_teacher_{teacher_id}",
+        'email': f"synthetic_teacher_{teacher_id}@example.com",
+        'password_hash': password_hash,
+        'role': UserRole.TEACHER,
+        'created_at': now
+    }])
+    student_ids = np.arange(teacher_id + 1, teacher_id + 1 + num_students)
+    _insert(User, [{
+        'id': int(sid),
+        'username': f"synthetic_student_{sid}",
+        'email': f"synthetic_student_{sid}@example.com",
+        'password_hash': password_hash,
+        'role': UserRole.STUDENT,
+        'teacher_id': teacher_id,
+        'created_at': now
+    } for sid in student_ids])
+
+    chapter_ids = np.arange(chapter_base + 1, chapter_base + 1 + num_chapters)
+    _insert(Chapter, [{'id': int(cid), 'name': f"Synthetic chapter {cid}"} for cid in chapter_ids])
+
+    # Question bank
+    question_ids = np.arange(question_base + 1, question_base + 1 + num_questions)
+    question_chapter = rng.integers(0, num_chapters, size=num_questions)
+    question_difficulty = rng.integers(0, 3, size=num_questions)
+    question_type = rng.integers(0, len(QUESTION_TYPES), size=num_questions)
+    question_marks = question_difficulty + 1
+    difficulty_param = (question_difficulty - 1) + rng.normal(0, 0.5, size=num_questions)
+    correct_answers, wrong_answers = _answer_keys(
+        rng, question_ids.tolist(), [QUESTION_TYPES[t] for t in question_type])
+    _insert(Question, [{
+        'id': int(question_ids[i]),
+        'text': f"Synthetic question {question_ids[i]}",
+        'chapter_id': int(chapter_ids[question_chapter[i]]),
+        'difficulty': DIFFICULTIES[question_difficulty[i]],
+        'question_type': QUESTION_TYPES[question_type[i]],
+        'marks': int(question_marks[i]),
+        'correct_answer': correct_answers[i],
+        **{f"option_{letter.lower()}": f"Option {letter}"
+           if QUESTION_TYPES[question_type[i]] == QuestionType.MULTIPLE_CHOICE else None
+           for letter in OPTION_LETTERS},
+        'created_by': teacher_id,
+        'created_at': now
+    } for i in range(num_questions)])
+
+    # Tests drawn from the bank; several results share each test
+    questions_per_test = min(questions_per_test, num_questions)
+    num_results = max(1, num_answers // questions_per_test)
+    num_tests = max(1, num_results // 10)
+    test_ids = np.arange(test_base + 1, test_base + 1 + num_tests)
+    test_questions = np.array([
+        rng.choice(num_questions, size=questions_per_test, replace=False) for _ in range(num_tests)
+    ])
+    _insert(Test, [{
+        'id': int(test_ids[t]),
+        'title': f"Synthetic test {test_ids[t]}",
+        'duration_minutes': 30,
+        'total_marks': int(question_marks[test_questions[t]].sum()),
+        'creator_id': teacher_id,
+        'is_public': True,
+        'created_at': now
+    } for t in range(num_tests)])
+    _insert(TestQuestion, [{
+        'test_id': int(test_ids[t]),
+        'question_id': int(question_ids[q]),
+        'order': order + 1
+    } for t in range(num_tests) for order, q in enumerate(test_questions[t])])
+
+    # Results and answers
+    ability = rng.normal(0, 1, size=(num_students, 1)) + rng.normal(0, 1, size=(num_students, num_chapters))
+    result_ids = np.arange(result_base + 1, result_base + 1 + num_results)
+    result_student = rng.integers(0, num_students, size=num_results)
+    result_test = rng.integers(0, num_tests, size=num_results)
+    answered = test_questions[result_test]  # num_results x questions_per_test
+    logits = ability[result_student[:, None], question_chapter[answered]] - difficulty_param[answered]
+    correct = rng.random(answered.shape) < 1 / (1 + np.exp(-logits))
+    scores = np.where(correct, question_marks[answered], 0)
+    start_times = [now - timedelta(minutes=int(m)) for m in rng.integers(60, 60 * 24 * 90, size=num_results)]
+
+    _insert(TestResult, [{
+        'id': int(result_ids[r]),
+        'test_id': int(test_ids[result_test[r]]),
+        'student_id': int(student_ids[result_student[r]]),
+        'start_time': start_times[r],
+        'end_time': start_times[r] + timedelta(minutes=25),
+        'completed_at': start_times[r] + timedelta(minutes=25),
+        'total_score': float(scores[r].sum()),
+        'completed': True
+    } for r in range(num_results)])
+
+    for start in range(0, num_results, max(1, INSERT_CHUNK // questions_per_test)):
+        stop = min(start + max(1, INSERT_CHUNK // questions_per_test), num_results)
+        db.session.execute(QuestionAnswer.__table__.insert(), [{
+            'test_result_id': int(result_ids[r]),
+            'question_id': int(question_ids[answered[r, i]]),
+            'student_answer': (correct_answers if correct[r, i] else wrong_answers)[answered[r, i]],
+            'is_correct': bool(correct[r, i]),
+            'score': float(scores[r, i])
+        } for r in range(start, stop) for i in range(questions_per_test)])
+
+    rebuild_rollups(student_ids.tolist())
+    db.session.commit()
+    return {
+        'teacher_id': teacher_id,
+        'student_ids': (int(student_ids[0]), int(student_ids[-1])) if num_students else None,
+        'question_ids': (int(question_ids[0]), int(question_ids[-1])) if num_questions else None,
+        'tests': num_tests,
+        'results': num_results,
+        'answers': num_results * questions_per_test
+    }
+
+
+def create_benchmark_app(database_path):
+    """App bound to a separate SQLite file, with background refresh and sweeping disabled"""
+    database_path = os.path.abspath(database_path)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database_path
+    os.environ['RECOMMENDER_REFRESH_ENABLED'] = '0'
+    os.environ['EXPIRY_SWEEP_ENABLED'] = '0'
+    os.environ['RECOMMENDER_ARTIFACT_DIR'] = os.path.splitext(database_path)[0] + '_recommender'
+    return create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic students, questions and answers")
+    parser.add_argument('database', help="SQLite file to create or extend (never the application database)")
+    parser.add_argument('--questions', type=int, default=2_000)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--answers', type=int, default=100_000)
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--questions-per-test', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_benchmark_app(args.database)
+    with app.app_context():
+        start = time.perf_counter()
+        summary = generate(args.questions, args.students, args.answers, args.chapters,
+                           args.questions_per_test, args.seed)
+        print(f"Generated {summary} in {time.perf_counter() - start:.1f}s")
@@ -139,3 +139,169 @@ function loadTimerState(testId) {
 function clearTimerState(testId) {
     localStorage.removeItem(`test_${testId}_timer`);
 }
+
+/**
+ * Save answers in the background while a test is being taken.
+ * Changed answers are collected per question and sent as one JSON batch
+ * once the student pauses (debounceMs), and at least every maxWaitMs while
+ * they keep typing. Whatever is still pending when the page is hidden or
+ * closed goes out with navigator.sendBeacon. Each save returns a fresh CSRF
+ * token, which is also copied into the form's csrf_token field.
+ * @param {Object} options - form (form element), url (autosave endpoint),
+ *     csrfToken, statusSelector (optional), debounceMs, maxWaitMs
+ * @return {Object} Object with flush() returning a Promise, and clear()
+ */
+function initAnswerAutosave(options) {
+    const form = options.form;
+    const url = options.url;
+    let csrfToken = options.csrfToken;
+    const status = options.statusSelector ? document.querySelector(options.statusSelector) : null;
+    const debounceMs = options.debounceMs || 2000;
+    const maxWaitMs = options.maxWaitMs || 10000;
+
+    let pending = {};
+    let debounceTimer = null;
+    let maxWaitTimer = null;
+    let inFlight = null;
+    let stopped = false;
+
+    function setStatus(text) {
+        if (status) {
+            status.textContent = text;
+        }
+    }
+
+    // Answer fields are named q<question id>-<field>
+    function questionIdOf(field) {
+        const match = /^q(\d+)-(multiple_choice|true_false|text_answer)$/.exec(field.name || '');
+        return match ? match[1] : null;
+    }
+
+    function clearTimers() {
+        clearTimeout(debounceTimer);
+        clearTimeout(maxWaitTimer);
+        debounceTimer = null;
+        maxWaitTimer = null;
+    }
+
+    function schedule() {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(flush, debounceMs);
+        if (!maxWaitTimer) {
+            maxWaitTimer = setTimeout(flush, maxWaitMs);
+        }
+    }
+
+    function takeBatch() {
+        const batch = pending;
+        pending = {};
+        return batch;
+    }
+
+    // Put a failed batch back, unless newer answers have replaced it
+    function requeue(batch) {
+        Object.keys(batch).forEach(function(questionId) {
+            if (!(questionId in pending)) {
+                pending[questionId] = batch[questionId];
+            }
+        });
+    }
+
+    function flush() {
+        clearTimers();
+        if (stopped) {
+            return Promise.resolve();
+        }
+        if (inFlight) {
+            // Send whatever changed meanwhile once the current batch is done
+            return inFlight.then(flush);
+        }
+        if (Object.keys(pending).length === 0) {
+            return Promise.resolve();
+        }
+
+        const batch = takeBatch();
+        setStatus('Saving...');
+        inFlight = fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify({answers: batch}),
+            credentials: 'same-origin',
+            keepalive: true
+        }).then(function(response) {
+            if (response.ok) {
+                setStatus('All changes saved');
+                return response.json().then(function(data) {
+                    if (data.csrf_token) {
+                        csrfToken = data.csrf_token;
+                        const tokenField = form.querySelector('input[name="csrf_token"]');
+                        if (tokenField) {
+                            tokenField.value = csrfToken;
+                        }
+                    }
+                });
+            } else if (response.status === 409) {
+                // Submitted or out of time; nothing more will be accepted
+                stopped = true;
+                setStatus('');
+            } else {
+                requeue(batch);
+                setStatus('Not saved, will retry');
+                schedule();
+            }
+        }).catch(function() {
+            requeue(batch);
+            setStatus('Offline, will retry');
+            schedule();
+        }).finally(function() {
+            inFlight = null;
+        });
+        return inFlight;
+    }
+
+    function flushBeacon() {
+        if (stopped || Object.keys(pending).length === 0 || !navigator.sendBeacon) {
+            return;
+        }
+        const body = JSON.stringify({answers: pending, csrf_token: csrfToken});
+        if (navigator.sendBeacon(url, new Blob([body], {type: 'application/json'}))) {
+            pending = {};
+            clearTimers();
+        }
+    }
+
+    function onChange(event) {
+        const field = event.target;
+        const questionId = questionIdOf(field);
+        if (!questionId || (field.type === 'radio' && !field.checked)) {
+            return;
+        }
+        pending[questionId] = field.value;
+        schedule();
+    }
+
+    form.addEventListener('change', onChange);
+    form.addEventListener('input', onChange);
+    // The form posts every answer itself
+    form.addEventListener('submit', function() {
+        pending = {};
+        clearTimers();
+    });
+    window.addEventListener('pagehide', flushBeacon);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'hidden') {
+            flushBeacon();
+        }
+    });
+
+    return {
+        flush: flush,
+        clear: function() {
+            pending = {};
+            clearTimers();
+        }
+    };
+}
@@ -0,0 +1,152 @@
+"""
+Auto-submission of expired test attempts.
+
+take_test auto-submits an attempt whose time is up, but only when the
+student loads it again, so abandoned attempts stayed open for ever: never
+graded, listed as in progress and left out of every aggregate. The sweeper
+finds open attempts whose deadline has passed with the
+(completed, deadline) index and grades them a batch at a time through
+grading.complete_results().
+
+Each worker runs a sweeper thread (EXPIRY_SWEEP_ENABLED), and
+scripts/sweep_expired.py does one pass for cron. Running several at once is
+safe: batches are selected FOR UPDATE SKIP LOCKED where the database
+supports it, and complete_results() only counts the results its own
+conditional update completed. Attempts get EXPIRY_SWEEP_GRACE seconds past
+their deadline so the last autosave and the page's own submission land
+first.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import TestResult, User
+from extensions import db
+from grading import complete_results
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH = 200
+SWEEP_GRACE = 60  # seconds
+
+
+def expired_results_query(cutoff, batch_size):
+    """Open attempts whose deadline is before cutoff, oldest first"""
+    return select(TestResult)\
+        .where(TestResult.completed == False)\
+        .where(TestResult.deadline < cutoff)\
+        .order_by(TestResult.deadline)\
+        .limit(batch_size)\
+        .with_for_update(skip_locked=True)
+
+
+def sweep_batch(batch_size=SWEEP_BATCH, grace_seconds=SWEEP_GRACE):
+    """
+    Auto-submit one batch of expired attempts and commit. Returns the number
+    of attempts found; 0 means nothing is left to sweep.
+    """
+    from fragment_cache import bump_data_version
+    from item_analysis import invalidate_test
+    from recommenders import recommender
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    try:
+        test_results = db.session.scalars(expired_results_query(cutoff, batch_size)).all()
+        if not test_results:
+            db.session.rollback()
+            return 0
+        completed = complete_results(test_results)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    student_ids = {test_result.student_id for test_result in completed}
+    teacher_ids = db.session.scalars(
+        select(User.teacher_id).where(User.id.in_(student_ids)).distinct()
+    ).all() if student_ids else []
+    for test_id in {test_result.test_id for test_result in completed}:
+        invalidate_test(test_id)
+    bump_data_version(*student_ids, *teacher_ids)
+    for student_id in student_ids:
+        recommender.invalidate_student_profile(student_id)
+
+    logger.info(f"Auto-submitted {len(completed)} expired attempts")
+    return len(test_results)
+
+
+def sweep_expired(batch_size=SWEEP_BATCH, grace_seconds=SWEEP_GRACE):
+    """Auto-submit every expired attempt, a batch at a time. Returns the number of batches run."""
+    batches = 0
+    while sweep_batch(batch_size, grace_seconds):
+        batches += 1
+    return batches
+
+
+class ExpirySweeper:
+    """Runs sweep_expired() every interval_seconds in a daemon thread"""
+
+    def __init__(self, app, interval_seconds=60, batch_size=SWEEP_BATCH, grace_seconds=SWEEP_GRACE,
+                 name='expiry-sweeper'):
+        self.app = app
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._start_lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sweep_once(self):
+        with self.app.app_context():
+            return sweep_expired(self.batch_size, self.grace_seconds)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sweep_once()
+            except Exception as e:
+                logger.error(f"Expired attempt sweep failed: {e}", exc_info=True)
+            self._stop_event.wait(self.interval_seconds)
+
+
+def init_expiry_sweeper(app):
+    """
+    Attach an ExpirySweeper to the app under app.extensions['expiry_sweeper'].
+    Like the model refresher, the thread is started by the first request so
+    CLI scripts that call create_app() do not spawn one.
+    """
+    sweeper = ExpirySweeper(
+        app,
+        interval_seconds=app.config['EXPIRY_SWEEP_INTERVAL'],
+        batch_size=app.config['EXPIRY_SWEEP_BATCH'],
+        grace_seconds=app.config['EXPIRY_SWEEP_GRACE']
+    )
+    app.extensions['expiry_sweeper'] = sweeper
+
+    @app.before_request
+    def start_expiry_sweeper():
+        if not sweeper.running:
+            sweeper.start()
+
+    return sweeper
@@ -0,0 +1,23 @@
+"""
+CSV exports must not hand spreadsheets live formulas from free text.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exports import neutralise_formula
+
+
+@pytest.mark.parametrize('value', ['=SUM(A1:A9)', '+1', '-1+2', '@cmd', '\tx', '\rx'])
+def test_formula_cells_are_made_literal(value):
+    assert neutralise_formula(value) == "'" + value
+
+
+@pytest.mark.parametrize('value', ['Paris', '42', '', None, 3.5])
+def test_other_cells_are_unchanged(value):
+    assert neutralise_formula(value) == value
@@ -0,0 +1,75 @@
+"""
+Query-count regression tests: teacher pages must issue a fixed number of
+queries however many students the teacher has.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# Add the project root and scripts directories to Python path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'scripts'))
+
+from synthetic_data import create_benchmark_app, generate
+
+SMALL_CLASS = 5
+LARGE_CLASS = 2 * SMALL_CLASS
+
+PAGES = ['/teacher/dashboard', '/teacher/students', '/teacher/students/data']
+
+
+@contextmanager
+def count_queries(engine):
+    """Yields a list whose length is the number of statements executed in the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def school(tmp_path, monkeypatch):
+    """An app with two teachers, of SMALL_CLASS and LARGE_CLASS students, each with completed tests"""
+    # Count the queries a page really runs, not a replay of its cached fragments
+    monkeypatch.setenv('FRAGMENT_CACHE_ENABLED', '0')
+    for name in ('DATABASE_URL', 'RECOMMENDER_REFRESH_ENABLED', 'EXPIRY_SWEEP_ENABLED', 'RECOMMENDER_ARTIFACT_DIR'):
+        monkeypatch.delenv(name, raising=False)
+    app = create_benchmark_app(str(tmp_path / 'school.db'))
+    app.config['TESTING'] = True
+
+    from extensions import db
+    with app.app_context():
+        small = generate(40, SMALL_CLASS, SMALL_CLASS * 40, num_chapters=5, seed=1)
+        large = generate(40, LARGE_CLASS, LARGE_CLASS * 40, num_chapters=5, seed=2)
+        engine = db.engine
+    # Requests run outside this app context so each gets its own g (and logged-in user)
+    return app, engine, small['teacher_id'], large['teacher_id']
+
+
+def page_queries(app, engine, teacher_id, url):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(teacher_id)
+    # Warm the reference-data caches so both teachers are measured alike
+    assert client.get(url).status_code == 200
+    with count_queries(engine) as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', PAGES)
+def test_teacher_page_queries_do_not_grow_with_students(school, url):
+    app, engine, small_teacher, large_teacher = school
+    assert page_queries(app, engine, small_teacher, url) == page_queries(app, engine, large_teacher, url)
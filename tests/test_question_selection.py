@@ -0,0 +1,90 @@
+"""
+Sampling of recommended questions from their scores.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommendation import select_questions, select_questions_batch
+
+NUM_QUESTIONS = 10
+
+
+@pytest.mark.parametrize('positive', [0, 3, NUM_QUESTIONS])
+def test_select_questions_with_few_positive_scores(positive):
+    scores = np.zeros(50)
+    scores[:positive] = np.linspace(1.0, 2.0, positive)
+
+    chosen = select_questions(scores, NUM_QUESTIONS)
+
+    assert len(chosen) == NUM_QUESTIONS
+    assert len(set(chosen.tolist())) == NUM_QUESTIONS
+    # Every question that stands out is picked
+    assert set(range(positive)) <= set(chosen.tolist())
+
+
+def test_select_questions_weighted():
+    scores = np.zeros(50)
+    scores[:20] = 1.0
+
+    chosen = select_questions(scores, NUM_QUESTIONS)
+
+    assert len(set(chosen.tolist())) == NUM_QUESTIONS
+    assert (scores[chosen] > 0).all()
+
+
+def test_select_questions_batch_with_few_positive_scores():
+    scores = np.zeros((4, 50))
+    scores[1, :3] = 1.0
+    scores[2, :20] = 1.0
+
+    chosen = select_questions_batch(scores, NUM_QUESTIONS, np.random.default_rng(0))
+
+    assert chosen.shape == (4, NUM_QUESTIONS)
+    for row in chosen:
+        assert len(set(row.tolist())) == NUM_QUESTIONS
+    assert {0, 1, 2} <= set(chosen[1].tolist())
+    assert (scores[2, chosen[2]] > 0).all()
+
+
+def test_collaborative_recommends_for_mastered_questions(tmp_path, monkeypatch):
+    # Students predicted to master (nearly) every question still get a full set
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+    from synthetic_data import create_benchmark_app, generate
+    from collaborative import CollaborativeEngine, FactorModel
+
+    for name in ('DATABASE_URL', 'RECOMMENDER_REFRESH_ENABLED', 'EXPIRY_SWEEP_ENABLED', 'RECOMMENDER_ARTIFACT_DIR'):
+        monkeypatch.delenv(name, raising=False)
+    app = create_benchmark_app(str(tmp_path / 'school.db'))
+    with app.app_context():
+        summary = generate(40, 1, 40, num_chapters=2, seed=1)
+        question_ids = np.arange(summary['question_ids'][0], summary['question_ids'][1] + 1)
+        student_id = summary['student_ids'][0]
+
+        # Predicted mastery 1 everywhere except three questions
+        question_bias = np.zeros(len(question_ids))
+        question_bias[:3] = -0.5
+        engine = CollaborativeEngine()
+        engine.current_model = FactorModel(
+            version=1,
+            student_ids=np.array([student_id]),
+            question_ids=question_ids,
+            chapter_ids=np.zeros(len(question_ids), dtype=np.int64),
+            global_mean=1.0,
+            question_bias=question_bias,
+            student_factors=np.zeros((1, 1)),
+            question_factors=np.zeros((len(question_ids), 1)),
+            answer_watermark=0
+        )
+
+        np.random.seed(0)
+        recommended = {question.id for question in engine.recommend_questions(student_id, num_questions=NUM_QUESTIONS)}
+
+    assert len(recommended) == NUM_QUESTIONS
+    assert set(question_ids[:3].tolist()) <= recommended
@@ -0,0 +1,100 @@
+"""
+CPU-bound parts of model training, run in a separate process.
+
+The engines read the database in their own (background) thread and hand
+plain NumPy arrays to the functions here through a process pool, so a fit
+never holds the GIL of a web worker. Everything in this module must stay
+picklable and free of Flask/database state.
+
+The pool spawns its worker, which re-imports the parent's __main__ module
+the way multiprocessing always does. Web servers and the scripts in
+scripts/ keep their work under ``if __name__ == "__main__":``; a script
+that trains from unguarded top-level code would run a second time in the
+pool worker, so guard it or set RECOMMENDER_TRAIN_IN_PROCESS=0. Code that
+ends up calling run_fit() inside a pool worker fits inline rather than
+starting a pool of its own.
+"""
+
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def training_pool():
+    """
+    Process pool shared by the engines of this worker, created on first use.
+
+    Workers are spawned rather than forked: forking a threaded web worker
+    can copy held locks into the child.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            # Stop the worker at exit instead of leaving it reading a closed pipe
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def run_fit(fn, *args, in_process=True):
+    """Run fn(*args) in the training pool and wait for it, or inline if in_process is False"""
+    global _pool
+    if not in_process or multiprocessing.parent_process() is not None:
+        # Inline when asked, and inside a pool worker, which never starts a pool of its own
+        return fn(*args)
+    pool = training_pool()
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A dead worker (e.g. killed for memory) breaks the pool for good; start fresh next run
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def fit_question_features(features, n_components=5):
+    """
+    Fit the scaler and PCA used to embed questions.
+
+    Returns:
+        (questions_features, scaler, pca); pca is None when there are too
+        few questions to reduce
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+
+    # Only use PCA if we have enough samples
+    if len(features_scaled) > n_components:
+        pca = PCA(n_components=n_components)
+        return pca.fit_transform(features_scaled), scaler, pca
+    return features_scaled, scaler, None
+
+
+def factorize_scores(residual_matrix, n_factors):
+    """
+    Truncated SVD of a sparse student x question residual matrix.
+
+    Returns:
+        (student_factors, question_factors), each scaled by the square root
+        of the singular values
+    """
+    from scipy.sparse.linalg import svds
+
+    k = min(n_factors, min(residual_matrix.shape) - 1)
+    if k < 1:
+        return np.zeros((residual_matrix.shape[0], 1)), np.zeros((residual_matrix.shape[1], 1))
+
+    u, sigma, vt = svds(residual_matrix, k=k)
+    root_sigma = np.sqrt(sigma)
+    return u * root_sigma, vt.T * root_sigma
@@ -25,3 +25,19 @@ def calculate_grade(percentage):
 def utc_to_local(utc_dt, timezone_str='Asia/Kolkata'):
     local_tz = pytz.timezone(timezone_str)
     return utc_dt.replace(tzinfo=pytz.utc).astimezone(local_tz)
+
+def chapter_breakdown(rows):
+    """
+    Build the per-chapter dict the result templates expect from
+    (chapter name, questions, correct, score, max score) rows
+    """
+    breakdown = {}
+    for name, questions, correct, score, max_score in rows:
+        breakdown[name] = {
+            'questions': questions,
+            'correct': correct or 0,
+            'score': score,
+            'max_score': max_score,
+            'percentage': round((score / max_score) * 100, 1) if max_score > 0 else 0
+        }
+    return breakdown